@@ -1,8 +1,13 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 from .models import (
-    Account, Customer, Invoice, InvoiceItem, Bill, Payment,
-    JournalEntry, JournalEntryLine, Expense, Budget
+    Account, AccountBalance, Customer, Invoice, InvoiceItem, Bill, Payment, PaymentAllocation,
+    JournalEntry, JournalEntryLine, Expense, Budget, PeriodClose, ClosingBalance,
+    PostingRule, JournalWatermark
 )
+from .allocations import reconcile_payments
+from .budgets import rebuild_actuals
+from .invoicing import recalculate_invoices
+from .posting import post_entries
 
 
 class InvoiceItemInline(admin.TabularInline):
@@ -18,6 +23,20 @@ class JournalEntryLineInline(admin.TabularInline):
     fields = ['account', 'debit_amount', 'credit_amount', 'description']
 
 
+class PaymentAllocationInline(admin.TabularInline):
+    model = PaymentAllocation
+    extra = 0
+    fields = ['invoice', 'bill', 'amount']
+
+
+class ClosingBalanceInline(admin.TabularInline):
+    model = ClosingBalance
+    extra = 0
+    fields = ['account', 'debit_total', 'credit_total']
+    readonly_fields = ['account', 'debit_total', 'credit_total']
+    can_delete = False
+
+
 @admin.register(Account)
 class AccountAdmin(admin.ModelAdmin):
     list_display = ['code', 'name', 'account_type', 'parent', 'is_active', 'created_at']
@@ -26,6 +45,15 @@ class AccountAdmin(admin.ModelAdmin):
     ordering = ['code']
 
 
+@admin.register(AccountBalance)
+class AccountBalanceAdmin(admin.ModelAdmin):
+    list_display = ['account', 'period_start', 'debit_total', 'credit_total', 'updated_at']
+    list_filter = ['period_start', 'account__account_type']
+    search_fields = ['account__code', 'account__name']
+    readonly_fields = ['account', 'period_start', 'debit_total', 'credit_total', 'updated_at']
+    ordering = ['account__code', 'period_start']
+
+
 @admin.register(Customer)
 class CustomerAdmin(admin.ModelAdmin):
     list_display = ['name', 'email', 'phone', 'company', 'city', 'country', 'is_active', 'created_at']
@@ -42,6 +70,12 @@ class InvoiceAdmin(admin.ModelAdmin):
     readonly_fields = ['created_at', 'updated_at']
     inlines = [InvoiceItemInline]
     ordering = ['-invoice_date']
+    actions = ['recalculate_totals']
+    
+    @admin.action(description='Recalculate totals from line items')
+    def recalculate_totals(self, request, queryset):
+        updated = recalculate_invoices(queryset)
+        self.message_user(request, f"Recalculated totals of {updated} invoices.", messages.SUCCESS)
 
 
 @admin.register(Bill)
@@ -59,17 +93,40 @@ class PaymentAdmin(admin.ModelAdmin):
     list_filter = ['payment_type', 'payment_method', 'payment_date']
     search_fields = ['payment_number', 'reference_number']
     readonly_fields = ['created_at', 'updated_at']
+    inlines = [PaymentAllocationInline]
     ordering = ['-payment_date']
+    actions = ['reconcile_selected']
+    
+    @admin.action(description='Allocate selected payments to open invoices and bills')
+    def reconcile_selected(self, request, queryset):
+        result = reconcile_payments(queryset)
+        self.message_user(
+            request,
+            f"Allocated {result.by_reference} payments by reference and {result.by_amount} by amount.",
+            messages.SUCCESS,
+        )
 
 
 @admin.register(JournalEntry)
 class JournalEntryAdmin(admin.ModelAdmin):
-    list_display = ['entry_number', 'entry_date', 'status', 'description', 'created_by']
-    list_filter = ['status', 'entry_date']
+    list_display = ['entry_number', 'entry_date', 'status', 'description', 'source_type', 'created_by']
+    list_filter = ['status', 'source_type', 'entry_date']
     search_fields = ['entry_number', 'description']
     readonly_fields = ['created_at', 'updated_at']
     inlines = [JournalEntryLineInline]
     ordering = ['-entry_date']
+    actions = ['post_selected']
+    
+    @admin.action(description='Post selected draft entries')
+    def post_selected(self, request, queryset):
+        try:
+            result = post_entries(queryset.values_list('pk', flat=True))
+        except ValueError as e:
+            self.message_user(request, str(e), messages.ERROR)
+            return
+        self.message_user(request, f"Posted {len(result.posted)} entries.", messages.SUCCESS)
+        if result.rejected:
+            self.message_user(request, f"{len(result.rejected)} entries were not posted (unbalanced, empty, not drafts or in a closed period).", messages.WARNING)
 
 
 @admin.register(Expense)
@@ -86,5 +143,37 @@ class BudgetAdmin(admin.ModelAdmin):
     list_display = ['name', 'period_type', 'start_date', 'end_date', 'account', 'budgeted_amount', 'actual_amount', 'is_active']
     list_filter = ['period_type', 'is_active', 'start_date']
     search_fields = ['name', 'account__name']
-    readonly_fields = ['created_at', 'updated_at']
+    readonly_fields = ['actual_amount', 'created_at', 'updated_at']
     ordering = ['-start_date']
+    actions = ['rebuild_selected']
+    
+    @admin.action(description='Recompute actuals from the ledger')
+    def rebuild_selected(self, request, queryset):
+        updated = rebuild_actuals(queryset)
+        self.message_user(request, f"Recomputed actuals of {updated} budgets.", messages.SUCCESS)
+
+
+@admin.register(PeriodClose)
+class PeriodCloseAdmin(admin.ModelAdmin):
+    list_display = ['period_end', 'closed_by', 'closed_at']
+    readonly_fields = ['period_end', 'closed_by', 'closed_at']
+    inlines = [ClosingBalanceInline]
+    ordering = ['-period_end']
+    
+    def has_add_permission(self, request):
+        # Periods are closed with financial.periods.close_period
+        return False
+
+
+@admin.register(PostingRule)
+class PostingRuleAdmin(admin.ModelAdmin):
+    list_display = ['document_type', 'category', 'debit_account', 'credit_account', 'tax_account', 'is_active']
+    list_filter = ['document_type', 'is_active']
+    search_fields = ['category', 'debit_account__code', 'credit_account__code']
+    ordering = ['document_type', 'category']
+
+
+@admin.register(JournalWatermark)
+class JournalWatermarkAdmin(admin.ModelAdmin):
+    list_display = ['source_type', 'last_updated_at', 'last_run_at']
+    readonly_fields = ['last_run_at']
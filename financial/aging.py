@@ -0,0 +1,112 @@
+"""
+Accounts receivable aging - open invoice balances per customer in 0-30,
+31-60, 61-90 and 90+ days past due buckets.
+
+All buckets for all customers come from one grouped query with conditional
+sums over the open balance (``total_amount - paid_amount``) of each invoice,
+bucketed by ``due_date``. Reports are cached per as-of day under a key
+that includes the invoice count and latest ``updated_at``, read with one
+indexed aggregate, so an invoice saved, paid or deleted by any process
+(the default cache is per process) makes every cached day stale; an
+invalidation also bumps a version number in the cache.
+
+``with_invoice_totals`` annotates customer querysets with their invoiced and
+outstanding totals so customer pages don't aggregate per row.
+"""
+from collections import namedtuple
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Max, Q, Sum
+
+from .models import Customer, Invoice
+
+ZERO = Decimal('0.00')
+CENT = Decimal('0.01')
+
+OPEN_STATUSES = ['sent', 'overdue']
+
+BUCKETS = [
+    ('days_0_30', '0-30'),
+    ('days_31_60', '31-60'),
+    ('days_61_90', '61-90'),
+    ('days_over_90', '90+'),
+]
+
+AgingRow = namedtuple('AgingRow', ['customer_id', 'customer_name'] + [key for key, _ in BUCKETS] + ['total'])
+
+CACHE_KEY = 'financial:ar_aging:{version}:{stamp}:{as_of}'
+VERSION_KEY = 'financial:ar_aging:version'
+CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def aging_queryset(as_of, using='default'):
+    """One row per customer with open invoices, every bucket as a conditional sum"""
+    balance = ExpressionWrapper(F('total_amount') - F('paid_amount'),
+                                output_field=DecimalField(max_digits=12, decimal_places=2))
+    day_30, day_60, day_90 = (as_of - timedelta(days=days) for days in (30, 60, 90))
+    return (
+        Invoice.objects.using(using)
+        .filter(status__in=OPEN_STATUSES, total_amount__gt=F('paid_amount'))
+        .values('customer_id', 'customer__name')
+        .annotate(
+            days_0_30=Sum(balance, filter=Q(due_date__gte=day_30)),
+            days_31_60=Sum(balance, filter=Q(due_date__lt=day_30, due_date__gte=day_60)),
+            days_61_90=Sum(balance, filter=Q(due_date__lt=day_60, due_date__gte=day_90)),
+            days_over_90=Sum(balance, filter=Q(due_date__lt=day_90)),
+            total=Sum(balance),
+        )
+        .order_by('customer__name', 'customer_id')
+        .values_list('customer_id', 'customer__name', *[key for key, _ in BUCKETS], 'total')
+    )
+
+
+def with_invoice_totals(queryset):
+    """Annotate customers with ``total_invoiced`` and ``outstanding_balance``"""
+    return queryset.annotate(
+        total_invoiced=Sum('invoices__total_amount'),
+        outstanding_balance=Sum(
+            'invoices__total_amount',
+            filter=Q(invoices__status__in=Customer.OUTSTANDING_STATUSES),
+        ),
+    )
+
+
+def iter_aging(as_of, chunk_size=2000, using='default'):
+    """Yield AgingRow tuples straight from the database cursor"""
+    for customer_id, name, *amounts in aging_queryset(as_of, using).iterator(chunk_size=chunk_size):
+        # SQLite sums decimals as floats, round back to cents
+        yield AgingRow(customer_id, name, *[(amount or ZERO).quantize(CENT) for amount in amounts])
+
+
+def compute_aging(as_of, using='default'):
+    """Aging rows and bucket totals for ``as_of``"""
+    rows = list(iter_aging(as_of, using=using))
+    totals = {key: sum((getattr(row, key) for row in rows), ZERO) for key, _ in BUCKETS + [('total', '')]}
+    return {'as_of': as_of, 'rows': rows, 'totals': totals}
+
+
+def invoices_stamp(using='default'):
+    """Invoice count and latest change, different after any invoice write"""
+    stamp = Invoice.objects.using(using).aggregate(count=Count('pk'), changed=Max('updated_at'))
+    changed = stamp['changed'].isoformat() if stamp['changed'] else ''
+    return f"{stamp['count']}:{changed}"
+
+
+def get_aging(as_of, using='default'):
+    """Cached aging report for ``as_of``, computed on a miss"""
+    version = cache.get(VERSION_KEY, 0)
+    key = CACHE_KEY.format(version=version, stamp=invoices_stamp(using), as_of=as_of.isoformat())
+    report = cache.get(key)
+    if report is None:
+        report = compute_aging(as_of, using=using)
+        cache.set(key, report, CACHE_TIMEOUT)
+    return report
+
+
+def invalidate_aging():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 1, None)
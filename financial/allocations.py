@@ -0,0 +1,205 @@
+"""
+Payment allocation - applies payments to invoices and bills and keeps their
+``paid_amount`` and status in step.
+
+A payment can be split over several documents and a document can be paid by
+several payments; each part is a PaymentAllocation. The allocations are the
+source of the paid amount: whenever they change, the affected documents are
+refreshed with one UPDATE that sums their allocations in a subquery and
+derives the status from the new amount (paid once fully covered, otherwise
+sent/pending or overdue by due date). Drafts and cancelled documents keep
+their status.
+
+``reconcile_payments`` matches payments with an unallocated remainder to open
+documents in one pass: first by document number in the payment reference,
+then received payments whose remainder equals the open balance of one of
+the customer's invoices, oldest due date first.
+"""
+from collections import defaultdict, deque, namedtuple
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .aging import invalidate_aging
+from .models import Bill, Invoice, Payment, PaymentAllocation
+
+ZERO = Decimal('0.00')
+CENT = Decimal('0.01')
+AMOUNT = DecimalField(max_digits=12, decimal_places=2)
+
+DocumentKind = namedtuple('DocumentKind', [
+    'model', 'field', 'number_field', 'party_field', 'payment_type', 'open_status', 'statuses',
+])
+
+INVOICES = DocumentKind(Invoice, 'invoice', 'invoice_number', 'customer_id', 'received', 'sent',
+                        ['sent', 'overdue', 'paid'])
+BILLS = DocumentKind(Bill, 'bill', 'bill_number', None, 'made', 'pending',
+                     ['pending', 'overdue', 'paid'])
+KINDS = {kind.payment_type: kind for kind in (INVOICES, BILLS)}
+
+ReconcileResult = namedtuple('ReconcileResult', ['by_reference', 'by_amount'])
+
+
+def allocated_total(field, outer='pk'):
+    """Subquery summing the allocations of the outer row's payment or document"""
+    allocated = (
+        PaymentAllocation.objects.filter(**{field: OuterRef(outer)})
+        .order_by()
+        .values(field)
+        .annotate(total=Sum('amount'))
+        .values('total')
+    )
+    return Coalesce(Subquery(allocated, output_field=AMOUNT), Value(ZERO), output_field=AMOUNT)
+
+
+def refresh_paid_amounts(kind, document_ids, using='default'):
+    """Recompute paid_amount and status of the given invoices or bills in one UPDATE"""
+    document_ids = [pk for pk in set(document_ids) if pk is not None]
+    if not document_ids:
+        return 0
+    paid = allocated_total(kind.field)
+    status = Case(
+        When(~Q(status__in=kind.statuses), then=F('status')),
+        When(total_amount__gt=0, total_amount__lte=paid, then=Value('paid')),
+        When(due_date__lt=timezone.localdate(), then=Value('overdue')),
+        default=Value(kind.open_status),
+    )
+    # updated_at is bumped so the journal generator sees the change
+    updated = kind.model.objects.using(using).filter(pk__in=document_ids).update(
+        paid_amount=paid, status=status, updated_at=timezone.now(),
+    )
+    if kind is INVOICES:
+        transaction.on_commit(invalidate_aging, using=using)
+    return updated
+
+
+def unallocated_payments(queryset):
+    """Payments annotated with ``unallocated`` that still have some left"""
+    return (
+        queryset.annotate(unallocated=F('amount') - allocated_total('payment'))
+        .filter(unallocated__gt=0)
+    )
+
+
+def allocate_payment(payment, allocations, using='default'):
+    """
+    Apply ``payment`` to documents, ``allocations`` being ``(document,
+    amount)`` pairs of invoices for received payments and bills for payments
+    made. Raises ValueError when an amount exceeds the payment's remainder
+    or a document's open balance; nothing is allocated then.
+    """
+    kind = KINDS[payment.payment_type]
+    with transaction.atomic(using=using):
+        remaining = (
+            unallocated_payments(Payment.objects.using(using).select_for_update().filter(pk=payment.pk))
+            .values_list('unallocated', flat=True)
+            .first()
+        ) or ZERO
+        remaining = Decimal(remaining).quantize(CENT)
+        wanted = defaultdict(Decimal)
+        for document, amount in allocations:
+            if not isinstance(document, kind.model):
+                raise ValueError(f"{payment.get_payment_type_display()} can only be allocated to "
+                                 f"{kind.model._meta.verbose_name_plural.lower()}.")
+            if amount <= 0:
+                raise ValueError('Allocated amounts must be positive.')
+            wanted[document.pk] += amount
+        if sum(wanted.values(), ZERO) > remaining:
+            raise ValueError(f"Only {remaining} of payment {payment.payment_number} is unallocated.")
+
+        documents = (
+            kind.model.objects.using(using)
+            .select_for_update()
+            .filter(pk__in=list(wanted))
+            .values_list('pk', kind.number_field, 'status', 'total_amount', 'paid_amount')
+        )
+        for pk, number, status, total, paid in documents:
+            if status not in kind.statuses or status == 'paid':
+                raise ValueError(f"{number} is not open for payment.")
+            if wanted[pk] > total - paid:
+                raise ValueError(f"{number} has only {total - paid} open.")
+
+        created = PaymentAllocation.objects.using(using).bulk_create([
+            PaymentAllocation(payment=payment, amount=amount, **{f'{kind.field}_id': pk})
+            for pk, amount in wanted.items()
+        ])
+        refresh_paid_amounts(kind, wanted, using=using)
+    return created
+
+
+def reconcile_batch(kind, payments, using='default'):
+    """Match the unallocated payments of one kind to open documents"""
+    by_reference = by_amount = 0
+    party = kind.party_field
+    with transaction.atomic(using=using):
+        payment_rows = list(
+            unallocated_payments(payments.select_for_update().filter(payment_type=kind.payment_type))
+            .order_by('payment_date', 'pk')
+            .values_list('pk', 'reference_number', 'customer_id', 'unallocated')
+        )
+        if not payment_rows:
+            return ReconcileResult(0, 0)
+        documents = (
+            kind.model.objects.using(using)
+            .select_for_update()
+            .filter(status__in=[status for status in kind.statuses if status != 'paid'],
+                    total_amount__gt=F('paid_amount'))
+            .order_by('due_date', 'pk')
+            .values_list('pk', kind.number_field, party or 'pk', 'total_amount', 'paid_amount')
+        )
+        # [pk, party, open balance], shared by both lookups
+        numbered, amounts = {}, defaultdict(deque)
+        for pk, number, party_id, total, paid in documents:
+            document = [pk, party_id, total - paid]
+            numbered[number.strip().lower()] = document
+            if party:
+                amounts[party_id, document[2]].append(document)
+
+        new_allocations = []
+        for payment_id, reference, customer_id, remaining in payment_rows:
+            # SQLite computes the remainder as a float
+            remaining = Decimal(remaining).quantize(CENT)
+            document = numbered.get(reference.strip().lower()) if reference.strip() else None
+            if document is not None and document[2] > 0:
+                amount = min(remaining, document[2])
+                by_reference += 1
+            elif party and customer_id is not None:
+                queue = amounts.get((customer_id, remaining))
+                # Documents partly paid by a reference match no longer qualify
+                while queue and queue[0][2] != remaining:
+                    queue.popleft()
+                if not queue:
+                    continue
+                document = queue.popleft()
+                amount = remaining
+                by_amount += 1
+            else:
+                continue
+            document[2] -= amount
+            new_allocations.append(PaymentAllocation(
+                payment_id=payment_id, amount=amount, **{f'{kind.field}_id': document[0]},
+            ))
+
+        PaymentAllocation.objects.using(using).bulk_create(new_allocations)
+        refresh_paid_amounts(
+            kind, [getattr(allocation, f'{kind.field}_id') for allocation in new_allocations], using=using,
+        )
+    return ReconcileResult(by_reference, by_amount)
+
+
+def reconcile_payments(payments=None, using='default'):
+    """
+    Allocate the unallocated remainder of ``payments`` (all payments by
+    default) to open invoices and bills. Returns a ReconcileResult with the
+    number of allocations matched by reference and by amount.
+    """
+    if payments is None:
+        payments = Payment.objects.using(using)
+    total = ReconcileResult(0, 0)
+    for kind in KINDS.values():
+        result = reconcile_batch(kind, payments, using=using)
+        total = ReconcileResult(total.by_reference + result.by_reference, total.by_amount + result.by_amount)
+    return total
@@ -5,3 +5,6 @@ class FinancialConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'financial'
     verbose_name = 'Financial Management'
+
+    def ready(self):
+        import financial.signals
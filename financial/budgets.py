@@ -0,0 +1,77 @@
+"""
+Budget actuals - keeps Budget.actual_amount equal to the posted activity of
+the budget's account between its start and end dates.
+
+Every posting announced on ``ledger.lines_posted`` is matched to the budgets
+whose account and window cover the line and added to their actuals with
+``F()`` updates, in the posting transaction. Actuals are signed by the
+account's normal balance, so expense budgets count debits and revenue
+budgets count credits. ``rebuild_actuals`` recomputes budgets from the
+period totals, one ``posted_totals`` call per distinct budget window.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F
+
+from .models import Budget
+from .reports import CENT, normal_balance, posted_totals
+
+ZERO = Decimal('0.00')
+
+
+def budget_deltas(rows, using='default'):
+    """``{budget_id: amount}`` to add to the actuals for posted line rows"""
+    rows = list(rows)
+    if not rows:
+        return {}
+    dates = [entry_date for _, entry_date, _, _ in rows]
+    budgets = defaultdict(list)
+    for pk, account_id, account_type, start, end in (
+        Budget.objects.using(using)
+        .filter(account_id__in={row[0] for row in rows}, start_date__lte=max(dates), end_date__gte=min(dates))
+        .values_list('pk', 'account_id', 'account__account_type', 'start_date', 'end_date')
+    ):
+        budgets[account_id].append((pk, account_type, start, end))
+
+    deltas = defaultdict(Decimal)
+    for account_id, entry_date, debit, credit in rows:
+        for pk, account_type, start, end in budgets.get(account_id, ()):
+            if start <= entry_date <= end:
+                deltas[pk] += normal_balance(account_type, debit, credit)
+    return {pk: amount for pk, amount in deltas.items() if amount}
+
+
+def apply_posted_rows(rows, using='default'):
+    """Add posted line rows to the actuals of the budgets they fall in"""
+    deltas = budget_deltas(rows, using=using)
+    manager = Budget.objects.using(using)
+    with transaction.atomic(using=using):
+        for pk, amount in deltas.items():
+            manager.filter(pk=pk).update(actual_amount=F('actual_amount') + amount)
+    return len(deltas)
+
+
+def rebuild_actuals(budgets=None, using='default'):
+    """
+    Recompute the actuals of ``budgets`` (every budget by default) from the
+    posted totals. Returns the number of budgets updated.
+    """
+    if budgets is None:
+        budgets = Budget.objects.using(using)
+    windows = defaultdict(list)
+    for pk, account_id, account_type, start, end in budgets.values_list(
+        'pk', 'account_id', 'account__account_type', 'start_date', 'end_date',
+    ):
+        windows[start, end].append((pk, account_id, account_type))
+
+    updates = []
+    for (start, end), members in windows.items():
+        totals = posted_totals(start, end, using=using) if start <= end else {}
+        for pk, account_id, account_type in members:
+            debit, credit = totals.get(account_id, (ZERO, ZERO))
+            updates.append(Budget(pk=pk, actual_amount=normal_balance(account_type, debit, credit).quantize(CENT)))
+    with transaction.atomic(using=using):
+        Budget.objects.using(using).bulk_update(updates, ['actual_amount'], batch_size=1000)
+    return len(updates)
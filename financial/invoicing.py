@@ -0,0 +1,71 @@
+"""
+Set-based invoice totals - recomputes subtotal, tax and total for any
+Invoice queryset with one UPDATE per chunk.
+
+The subtotal is a correlated ``SUM(total_price)`` subquery over the invoice
+items, and tax and total are derived from the same expression inside the
+UPDATE, so no item or invoice is loaded into Python. Invoices are processed
+in primary-key chunks, one transaction each, which keeps locks and
+statements small for millions of rows.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce
+from django.utils import timezone
+
+from .aging import invalidate_aging
+from .models import Invoice, InvoiceItem
+
+AMOUNT = DecimalField(max_digits=12, decimal_places=2)
+
+
+def totals_expressions(tax_rate=None):
+    """UPDATE expressions for subtotal, tax_amount and total_amount"""
+    items_total = (
+        InvoiceItem.objects.filter(invoice=OuterRef('pk'))
+        .order_by()
+        .values('invoice')
+        .annotate(total=Sum('total_price'))
+        .values('total')
+    )
+    subtotal = Coalesce(Subquery(items_total, output_field=AMOUNT), Value(Decimal('0.00')), output_field=AMOUNT)
+    rate = Value(tax_rate, output_field=AMOUNT) if tax_rate is not None else F('tax_rate')
+    tax_amount = Cast(subtotal * rate / Value(Decimal('100.00')), output_field=AMOUNT)
+    return {
+        'subtotal': subtotal,
+        'tax_amount': tax_amount,
+        'total_amount': subtotal + tax_amount - F('discount_amount'),
+    }
+
+
+def recalculate_invoices(queryset=None, tax_rate=None, chunk_size=10000):
+    """
+    Recompute the totals of every invoice in ``queryset`` (all invoices by
+    default), optionally switching them to ``tax_rate`` first.
+
+    Returns the number of invoices updated.
+    """
+    if queryset is None:
+        queryset = Invoice.objects.all()
+    using = queryset.db
+    values = totals_expressions(tax_rate)
+    if tax_rate is not None:
+        values['tax_rate'] = tax_rate
+
+    ids = queryset.order_by('pk').values_list('pk', flat=True)
+    updated = 0
+    last_pk = 0
+    while True:
+        chunk = list(ids.filter(pk__gt=last_pk)[:chunk_size])
+        if not chunk:
+            break
+        last_pk = chunk[-1]
+        with transaction.atomic(using=using):
+            # updated_at is bumped so the journal generator sees the change
+            updated += Invoice.objects.using(using).filter(pk__in=chunk).update(
+                updated_at=timezone.now(), **values,
+            )
+            transaction.on_commit(invalidate_aging, using=using)
+    return updated
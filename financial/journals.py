@@ -0,0 +1,311 @@
+"""
+GL journal generation - turns invoices, bills, payments and expenses into
+journal entries using the PostingRule account mappings.
+
+Documents are read in ``(updated_at, pk)`` order from the source type's
+watermark, so a run only reads documents changed since the previous one.
+Every document owns at most one generated entry (unique on source type and
+id): an entry that already matches its document is left alone, a changed
+document gets its entry rewritten and re-posted and a cancelled document
+gets its entry voided, so running the generator again is harmless. Each
+batch is written in one transaction and then advances the watermark, which
+lets an interrupted run resume where it stopped.
+
+A document stamped inside a long transaction can commit after later stamped
+documents have been processed, so each run re-reads ``WATERMARK_OVERLAP``
+below the watermark; the unchanged check makes the re-read cheap.
+"""
+from collections import Counter, defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import BooleanField, Case, Q, Value, When
+
+from .models import (
+    Bill, Expense, Invoice, JournalEntry, JournalEntryLine, JournalWatermark, Payment,
+    PeriodClose, PostingRule,
+)
+from .posting import post_batch
+
+ZERO = Decimal('0.00')
+
+# How far below the watermark each run re-reads documents, longer than any
+# transaction that stamps updated_at (bulk invoice recalculation, allocation)
+WATERMARK_OVERLAP = timedelta(minutes=15)
+
+
+class DocumentSource:
+    """How the documents of one model map to journal entries"""
+    model = None
+    source_type = ''
+    label = ''
+    date_field = ''
+    number_field = ''
+    amount_field = 'total_amount'
+    tax_field = None
+    tax_side = None  # 'debit' or 'credit', the side the tax is split from
+    category_field = None
+    eligible = Q()  # documents that should have a posted entry
+
+    def fields(self):
+        fields = ['pk', 'updated_at', self.date_field, self.number_field, self.amount_field]
+        return fields + [field for field in (self.tax_field, self.category_field) if field]
+
+    def document_type(self, row):
+        return self.source_type
+
+    def find_rule(self, row, rules):
+        document_type = self.document_type(row)
+        category = row[self.category_field] if self.category_field else ''
+        return rules.get((document_type, category)) or rules.get((document_type, ''))
+
+    def entry(self, row, rules):
+        """``(entry_date, description, lines)`` wanted for a document, or None"""
+        if not row['eligible']:
+            return None
+        rule = self.find_rule(row, rules)
+        if rule is None:
+            return None
+        tax = row[self.tax_field] if self.tax_field else ZERO
+        lines = journal_lines(rule, row[self.amount_field], tax, self.tax_side)
+        if not lines:
+            return None
+        description = f"{self.label} {row[self.number_field]}"[:500]
+        return row[self.date_field], description, lines
+
+
+class InvoiceSource(DocumentSource):
+    model = Invoice
+    source_type = 'invoice'
+    label = 'Invoice'
+    date_field = 'invoice_date'
+    number_field = 'invoice_number'
+    tax_field = 'tax_amount'
+    tax_side = 'credit'
+    eligible = Q(status__in=['sent', 'paid', 'overdue'])
+
+
+class BillSource(DocumentSource):
+    model = Bill
+    source_type = 'bill'
+    label = 'Bill'
+    date_field = 'bill_date'
+    number_field = 'bill_number'
+    tax_field = 'tax_amount'
+    tax_side = 'debit'
+    eligible = Q(status__in=['pending', 'paid', 'overdue'])
+
+
+class PaymentSource(DocumentSource):
+    model = Payment
+    source_type = 'payment'
+    label = 'Payment'
+    date_field = 'payment_date'
+    number_field = 'payment_number'
+    amount_field = 'amount'
+    category_field = 'payment_method'
+
+    def fields(self):
+        return super().fields() + ['payment_type']
+
+    def document_type(self, row):
+        return f"payment_{row['payment_type']}"
+
+
+class ExpenseSource(DocumentSource):
+    model = Expense
+    source_type = 'expense'
+    label = 'Expense'
+    date_field = 'expense_date'
+    number_field = 'expense_number'
+    amount_field = 'amount'
+    category_field = 'category'
+
+
+SOURCES = {source.source_type: source for source in (
+    InvoiceSource(), BillSource(), PaymentSource(), ExpenseSource(),
+)}
+
+
+def journal_lines(rule, amount, tax=ZERO, tax_side=None):
+    """Sorted ``(account_id, debit, credit)`` lines for a document amount"""
+    if amount <= 0:
+        return []
+    debits = [[rule.debit_account_id, amount]]
+    credits = [[rule.credit_account_id, amount]]
+    if tax and rule.tax_account_id and tax_side:
+        side = credits if tax_side == 'credit' else debits
+        side[0][1] -= tax
+        side.append([rule.tax_account_id, tax])
+    lines = [(account_id, value, ZERO) for account_id, value in debits if value]
+    lines += [(account_id, ZERO, value) for account_id, value in credits if value]
+    return sorted(lines)
+
+
+def load_rules(using='default'):
+    """Active posting rules keyed by ``(document_type, category)``"""
+    return {
+        (rule.document_type, rule.category): rule
+        for rule in PostingRule.objects.using(using).filter(is_active=True)
+    }
+
+
+def entry_number(source_type, source_id):
+    return f"GL-{source_type.upper()}-{source_id}"
+
+
+def generate_batch(source, rows, rules, post=True, stats=None, using='default'):
+    """Create, rewrite or void the generated entries of one batch of documents"""
+    stats = Counter() if stats is None else stats
+    lock_date = PeriodClose.get_lock_date(using)
+
+    def is_closed(entry_date):
+        return lock_date is not None and entry_date <= lock_date
+
+    entries = JournalEntry.objects.using(using)
+    with transaction.atomic(using=using):
+        existing = {
+            source_id: (pk, status, entry_date)
+            for pk, source_id, status, entry_date in entries.filter(
+                source_type=source.source_type, source_id__in=[row['pk'] for row in rows],
+            ).values_list('pk', 'source_id', 'status', 'entry_date')
+        }
+        existing_lines = defaultdict(list)
+        for entry_id, *line in (
+            JournalEntryLine.objects.using(using)
+            .filter(journal_entry_id__in=[entry[0] for entry in existing.values()])
+            .order_by()
+            .values_list('journal_entry_id', 'account_id', 'debit_amount', 'credit_amount')
+        ):
+            existing_lines[entry_id].append(tuple(line))
+
+        new_entries, lines = [], {}
+        for row in rows:
+            if row['eligible'] and source.find_rule(row, rules) is None:
+                # No matching rule, existing entries are left alone
+                stats['unmapped'] += 1
+                continue
+            wanted = source.entry(row, rules)
+            current = existing.get(row['pk'])
+
+            if current is None:
+                if wanted is None:
+                    continue
+                entry_date, description, entry_lines = wanted
+                if post and is_closed(entry_date):
+                    stats['closed'] += 1
+                    continue
+                new_entries.append(JournalEntry(
+                    entry_number=entry_number(source.source_type, row['pk']),
+                    entry_date=entry_date,
+                    description=description,
+                    source_type=source.source_type,
+                    source_id=row['pk'],
+                ))
+                lines[row['pk']] = entry_lines
+                stats['created'] += 1
+                continue
+
+            entry_id, status, current_date = current
+            if wanted is None:
+                if status == 'void':
+                    continue
+                if status == 'posted' and is_closed(current_date):
+                    stats['closed'] += 1
+                    continue
+                entry = entries.get(pk=entry_id)
+                entry.status = 'void'
+                entry.save()
+                stats['voided'] += 1
+                continue
+
+            entry_date, description, entry_lines = wanted
+            if post:
+                wanted_status = 'posted'
+            else:
+                wanted_status = 'draft' if status == 'void' else status
+            if (status == wanted_status and current_date == entry_date
+                    and sorted(existing_lines[entry_id]) == entry_lines):
+                stats['unchanged'] += 1
+                continue
+            if (status == 'posted' and is_closed(current_date)) or (post and is_closed(entry_date)):
+                stats['closed'] += 1
+                continue
+            # Back to draft (reversing the posted lines), then replace the lines
+            entry = entries.get(pk=entry_id)
+            entry.status = 'draft'
+            entry.entry_date = entry_date
+            entry.description = description
+            entry.save()
+            JournalEntryLine.objects.using(using).filter(journal_entry_id=entry_id).delete()
+            lines[row['pk']] = entry_lines
+            stats['updated'] += 1
+
+        entries.bulk_create(new_entries)
+        entry_ids = dict(
+            entries.filter(source_type=source.source_type, source_id__in=list(lines))
+            .values_list('source_id', 'pk')
+        )
+        JournalEntryLine.objects.using(using).bulk_create([
+            JournalEntryLine(journal_entry_id=entry_ids[source_id], account_id=account_id,
+                             debit_amount=debit, credit_amount=credit)
+            for source_id, entry_lines in lines.items()
+            for account_id, debit, credit in entry_lines
+        ])
+        if post:
+            to_post = [entry_ids[source_id] for source_id in lines]
+            post_batch(to_post, using=using)
+
+        # Batches re-read below the watermark must not move it back
+        JournalWatermark.objects.using(using).filter(
+            Q(last_updated_at__isnull=True) | Q(last_updated_at__lt=rows[-1]['updated_at']),
+            source_type=source.source_type,
+        ).update(last_updated_at=rows[-1]['updated_at'])
+    return stats
+
+
+def generate_journals(source_types=None, full=False, post=True, batch_size=1000,
+                      overlap=WATERMARK_OVERLAP, using='default'):
+    """
+    Generate journal entries for documents changed since the last run.
+
+    ``full`` ignores the watermarks and re-checks every document, e.g. after
+    the posting rules changed; otherwise documents from ``overlap`` below
+    the watermark on are re-checked. Returns a Counter of created, updated,
+    voided, unchanged, unmapped (no matching rule) and closed (dated inside
+    a closed period) documents.
+    """
+    rules = load_rules(using)
+    stats = Counter()
+    for source_type in source_types or SOURCES:
+        source = SOURCES[source_type]
+        watermark, _ = JournalWatermark.objects.using(using).get_or_create(source_type=source_type)
+        if source.eligible:
+            eligible = Case(When(source.eligible, then=Value(True)), default=Value(False),
+                            output_field=BooleanField())
+        else:
+            eligible = Value(True, output_field=BooleanField())
+        documents = (
+            source.model.objects.using(using)
+            .annotate(eligible=eligible)
+            .order_by('updated_at', 'pk')
+        )
+        if watermark.last_updated_at is not None and not full:
+            # Documents committed late with an older stamp are picked up by the
+            # overlap, documents already journaled come out unchanged
+            documents = documents.filter(updated_at__gte=watermark.last_updated_at - overlap)
+
+        last = None
+        while True:
+            batch = documents
+            if last is not None:
+                batch = batch.filter(
+                    Q(updated_at__gt=last[0]) | Q(updated_at=last[0], pk__gt=last[1])
+                )
+            rows = list(batch.values(*source.fields(), 'eligible')[:batch_size])
+            if not rows:
+                break
+            generate_batch(source, rows, rules, post=post, stats=stats, using=using)
+            last = rows[-1]['updated_at'], rows[-1]['pk']
+    return stats
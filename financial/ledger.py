@@ -0,0 +1,168 @@
+"""
+General ledger balances - keeps AccountBalance in step with posted journal
+entries.
+
+Lines of posted entries are reduced to debit and credit totals per account
+per month and added to AccountBalance with an atomic upsert. Unposting an
+entry, editing or deleting a line of a posted entry, or moving a posted entry
+to another date applies the same rows with negated amounts, so the table
+always equals the sum of all posted lines. Rows dated on or before the last
+period close (see ``financial.periods``) are rejected.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F, Sum
+from django.dispatch import Signal
+from django.utils import timezone
+
+from .models import AccountBalance, JournalEntryLine, PeriodClose
+
+ZERO = Decimal('0.00')
+
+# Line columns needed to post a line, ``entry_date`` is the entry's date
+LINE_FIELDS = ('account_id', 'journal_entry__entry_date', 'debit_amount', 'credit_amount')
+
+# Sent inside the posting transaction with ``rows`` (tuples of account_id,
+# entry_date, debit, credit - reversals carry negated amounts) and ``using``
+lines_posted = Signal()
+
+
+def period_start(day):
+    """First day of the month ``day`` falls in"""
+    return day.replace(day=1)
+
+
+def collect_balance_deltas(rows, deltas=None):
+    """
+    Fold line rows into ``{(account_id, period_start): [debit, credit]}``.
+
+    ``rows`` are tuples ordered as ``LINE_FIELDS``.
+    """
+    if deltas is None:
+        deltas = defaultdict(lambda: [ZERO, ZERO])
+    for account_id, entry_date, debit, credit in rows:
+        totals = deltas[account_id, period_start(entry_date)]
+        totals[0] += debit
+        totals[1] += credit
+    return deltas
+
+
+def apply_balance_deltas(deltas, using='default'):
+    """
+    Add ``deltas`` to AccountBalance rows, creating missing rows.
+
+    Missing rows are inserted at zero with ``ignore_conflicts`` and each row
+    is then incremented with an ``F()`` update, so concurrent postings to the
+    same account and month never lose an update.
+    """
+    deltas = {key: totals for key, totals in deltas.items() if any(totals)}
+    if not deltas:
+        return
+    manager = AccountBalance.objects.using(using)
+    with transaction.atomic(using=using):
+        manager.bulk_create(
+            [AccountBalance(account_id=account_id, period_start=start)
+             for account_id, start in deltas],
+            ignore_conflicts=True,
+        )
+        now = timezone.now()
+        for (account_id, start), (debit, credit) in deltas.items():
+            manager.filter(account_id=account_id, period_start=start).update(
+                debit_total=F('debit_total') + debit,
+                credit_total=F('credit_total') + credit,
+                updated_at=now,
+            )
+
+
+def check_period_open(dates, using='default'):
+    """Raise ValueError when any date is on or before the last period close"""
+    dates = [day for day in dates if day is not None]
+    if not dates:
+        return
+    lock_date = PeriodClose.get_lock_date(using)
+    if lock_date is not None and min(dates) <= lock_date:
+        raise ValueError(f'The books are closed through {lock_date}, back-dated postings are not allowed.')
+
+
+def post_rows(rows, sender=None, using='default'):
+    """Apply line rows to the balances and announce them to ``lines_posted``"""
+    rows = list(rows)
+    if not rows:
+        return
+    check_period_open({entry_date for _, entry_date, _, _ in rows}, using=using)
+    with transaction.atomic(using=using):
+        apply_balance_deltas(collect_balance_deltas(rows), using=using)
+        lines_posted.send(sender=sender, rows=rows, using=using)
+
+
+def reverse_rows(rows):
+    """Negate the amounts of line rows"""
+    return [
+        (account_id, entry_date, -debit, -credit)
+        for account_id, entry_date, debit, credit in rows
+    ]
+
+
+def entry_rows(entry_ids, entry_date=None, using='default'):
+    """
+    Line rows for journal entries, optionally dated ``entry_date`` instead of
+    the date stored on the entry
+    """
+    rows = (
+        JournalEntryLine.objects.using(using)
+        .filter(journal_entry_id__in=entry_ids)
+        .order_by()
+        .values_list(*LINE_FIELDS)
+    )
+    if entry_date is None:
+        return list(rows)
+    return [(account_id, entry_date, debit, credit) for account_id, _, debit, credit in rows]
+
+
+def with_balances(queryset):
+    """Annotate accounts with ``debit_total`` and ``credit_total`` for ``get_balance``"""
+    return queryset.annotate(
+        debit_total=Sum('balances__debit_total'),
+        credit_total=Sum('balances__credit_total'),
+    )
+
+
+def rebuild_balances(chunk_size=10000, using='default'):
+    """
+    Recompute every AccountBalance row from the posted journal lines.
+
+    Posted lines are streamed and folded into per-account, per-month totals
+    in memory; rows for months without posted lines are reset to zero.
+    Returns the number of AccountBalance rows written.
+    """
+    manager = AccountBalance.objects.using(using)
+    with transaction.atomic(using=using):
+        rows = (
+            JournalEntryLine.objects.using(using)
+            .filter(journal_entry__status='posted')
+            .order_by()
+            .values_list(*LINE_FIELDS)
+            .iterator(chunk_size=chunk_size)
+        )
+        totals = collect_balance_deltas(rows)
+
+        now = timezone.now()
+        existing = {
+            (account_id, start): pk
+            for pk, account_id, start in manager.values_list('pk', 'account_id', 'period_start')
+        }
+        updates = []
+        for key, pk in existing.items():
+            debit, credit = totals.get(key, (ZERO, ZERO))
+            updates.append(AccountBalance(pk=pk, debit_total=debit, credit_total=credit, updated_at=now))
+        manager.bulk_update(updates, ['debit_total', 'credit_total', 'updated_at'], batch_size=chunk_size)
+        manager.bulk_create(
+            [AccountBalance(account_id=account_id, period_start=start,
+                            debit_total=debit, credit_total=credit)
+             for (account_id, start), (debit, credit) in totals.items()
+             if (account_id, start) not in existing],
+            batch_size=chunk_size,
+        )
+    return len(updates) + len(set(totals) - set(existing))
@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from financial.journals import SOURCES, generate_journals
+
+
+class Command(BaseCommand):
+    help = 'Generate GL journal entries for invoices, bills, payments and expenses changed since the last run'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', action='append', choices=sorted(SOURCES),
+                            help='Only process this source type (repeatable)')
+        parser.add_argument('--full', action='store_true', help='Ignore the watermarks and re-check every document')
+        parser.add_argument('--no-post', action='store_true', help='Leave generated entries as drafts')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Documents processed per transaction')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            stats = generate_journals(
+                source_types=options['source'],
+                full=options['full'],
+                post=not options['no_post'],
+                batch_size=options['batch_size'],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+        elapsed = time.perf_counter() - started
+        summary = ', '.join(
+            f"{stats[key]} {key}" for key in ('created', 'updated', 'voided', 'unchanged', 'unmapped', 'closed')
+        )
+        self.stdout.write(self.style.SUCCESS(f"Journals generated in {elapsed:.2f}s: {summary}"))
@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from financial.models import JournalEntry
+from financial.posting import post_entries
+
+
+class Command(BaseCommand):
+    help = 'Post draft journal entries in batches, skipping unbalanced entries'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--through', help='Only post entries dated on or before this date (YYYY-MM-DD)')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Entries posted per transaction')
+
+    def handle(self, *args, **options):
+        entries = JournalEntry.objects.filter(status='draft')
+        if options['through']:
+            through = parse_date(options['through'])
+            if through is None:
+                raise CommandError(f"Invalid date: {options['through']}")
+            entries = entries.filter(entry_date__lte=through)
+
+        started = time.perf_counter()
+        try:
+            result = post_entries(
+                entries.order_by('entry_date', 'pk').values_list('pk', flat=True),
+                batch_size=options['batch_size'],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+        elapsed = time.perf_counter() - started
+
+        for entry_id, reason in sorted(result.rejected.items())[:20]:
+            self.stdout.write(self.style.WARNING(f"Entry {entry_id} not posted: {reason}"))
+        self.stdout.write(self.style.SUCCESS(
+            f"Posted {len(result.posted)} entries, rejected {len(result.rejected)} in {elapsed:.2f}s"
+        ))
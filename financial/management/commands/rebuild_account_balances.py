@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from financial.ledger import rebuild_balances
+
+
+class Command(BaseCommand):
+    help = 'Rebuild per-period account balances from the posted journal lines'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=10000, help='Journal lines fetched per chunk')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        rows = rebuild_balances(chunk_size=options['chunk_size'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {rows} account balance rows in {elapsed:.2f}s"
+        ))
@@ -0,0 +1,17 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from financial.budgets import rebuild_actuals
+
+
+class Command(BaseCommand):
+    help = 'Recompute budget actuals from the posted account balances'
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        budgets = rebuild_actuals()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt actuals of {budgets} budgets in {elapsed:.2f}s"
+        ))
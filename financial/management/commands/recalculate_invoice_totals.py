@@ -0,0 +1,33 @@
+import time
+from decimal import Decimal, InvalidOperation
+
+from django.core.management.base import BaseCommand, CommandError
+
+from financial.invoicing import recalculate_invoices
+from financial.models import Invoice
+
+
+class Command(BaseCommand):
+    help = 'Recompute invoice subtotal, tax and total from the line items with set-based updates'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--status', action='append', choices=[key for key, _ in Invoice.STATUS_CHOICES],
+                            help='Only recalculate invoices with this status (repeatable)')
+        parser.add_argument('--tax-rate', help='Set this tax rate (percent) on the invoices before recalculating')
+        parser.add_argument('--chunk-size', type=int, default=10000, help='Invoices updated per transaction')
+
+    def handle(self, *args, **options):
+        invoices = Invoice.objects.all()
+        if options['status']:
+            invoices = invoices.filter(status__in=options['status'])
+        tax_rate = None
+        if options['tax_rate'] is not None:
+            try:
+                tax_rate = Decimal(options['tax_rate'])
+            except InvalidOperation:
+                raise CommandError(f"Invalid tax rate: {options['tax_rate']}")
+
+        started = time.perf_counter()
+        updated = recalculate_invoices(invoices, tax_rate=tax_rate, chunk_size=options['chunk_size'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f"Recalculated {updated} invoices in {elapsed:.2f}s"))
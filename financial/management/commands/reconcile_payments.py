@@ -0,0 +1,18 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from financial.allocations import reconcile_payments
+
+
+class Command(BaseCommand):
+    help = 'Allocate unallocated payments to open invoices and bills by reference or matching amount'
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        result = reconcile_payments()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Allocated {result.by_reference} payments by reference and {result.by_amount} by amount "
+            f"in {elapsed:.2f}s"
+        ))
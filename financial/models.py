@@ -1,4 +1,5 @@
 from django.db import models
+from django.core.exceptions import ValidationError
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 from decimal import Decimal
@@ -18,6 +19,9 @@ class Account(models.Model):
         ('expense', 'Expense'),
     ]
     
+    # Account types whose balance is debits minus credits
+    DEBIT_TYPES = ['asset', 'expense']
+    
     code = models.CharField(max_length=20, unique=True, help_text="Account code (e.g., 1000, 2000)")
     name = models.CharField(max_length=200)
     account_type = models.CharField(max_length=20, choices=ACCOUNT_TYPES)
@@ -38,17 +42,51 @@ class Account(models.Model):
     def get_absolute_url(self):
         return reverse('financial:account_detail', kwargs={'pk': self.pk})
     
-    def get_balance(self):
-        """Calculate current account balance"""
-        debits = self.journal_entries_debit.aggregate(
-            total=models.Sum('debit_amount'))['total'] or Decimal('0.00')
-        credits = self.journal_entries_credit.aggregate(
-            total=models.Sum('credit_amount'))['total'] or Decimal('0.00')
-        
-        if self.account_type in ['asset', 'expense']:
+    def normal_balance(self, debits, credits):
+        """Signed balance for the account type from debit and credit totals"""
+        if self.account_type in self.DEBIT_TYPES:
             return debits - credits
         else:  # liability, equity, revenue
             return credits - debits
+    
+    def get_balance(self):
+        """
+        Current account balance from the posted period totals.
+        
+        Uses ``debit_total``/``credit_total`` annotations when the account was
+        loaded with ``financial.ledger.with_balances``, otherwise reads the
+        account's AccountBalance rows in one query.
+        """
+        if hasattr(self, 'debit_total') and hasattr(self, 'credit_total'):
+            debits, credits = self.debit_total, self.credit_total
+        else:
+            totals = self.balances.aggregate(
+                debits=models.Sum('debit_total'), credits=models.Sum('credit_total'))
+            debits, credits = totals['debits'], totals['credits']
+        return self.normal_balance(debits or Decimal('0.00'), credits or Decimal('0.00'))
+
+
+class AccountBalance(models.Model):
+    """
+    Posted debit and credit totals per account per month
+    """
+    account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='balances')
+    period_start = models.DateField(help_text="First day of the month")
+    debit_total = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    credit_total = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['account', 'period_start']
+        verbose_name = 'Account Balance'
+        verbose_name_plural = 'Account Balances'
+        unique_together = ['account', 'period_start']
+        indexes = [
+            models.Index(fields=['period_start', 'account']),
+        ]
+    
+    def __str__(self):
+        return f"{self.account.code} {self.period_start:%Y-%m}: Dr {self.debit_total} Cr {self.credit_total}"
 
 
 class Customer(models.Model):
@@ -80,11 +118,20 @@ class Customer(models.Model):
     def get_absolute_url(self):
         return reverse('financial:customer_detail', kwargs={'pk': self.pk})
     
+    # Invoice statuses counted in the outstanding balance
+    OUTSTANDING_STATUSES = ['draft', 'sent', 'overdue']
+    
     def get_total_invoices(self):
+        """Uses the ``total_invoiced`` annotation from ``financial.aging.with_invoice_totals`` when present"""
+        if hasattr(self, 'total_invoiced'):
+            return self.total_invoiced or Decimal('0.00')
         return self.invoices.aggregate(total=models.Sum('total_amount'))['total'] or Decimal('0.00')
     
     def get_outstanding_balance(self):
-        return self.invoices.filter(status__in=['draft', 'sent', 'overdue']).aggregate(
+        """Uses the ``outstanding_balance`` annotation when present"""
+        if hasattr(self, 'outstanding_balance'):
+            return self.outstanding_balance or Decimal('0.00')
+        return self.invoices.filter(status__in=self.OUTSTANDING_STATUSES).aggregate(
             total=models.Sum('total_amount'))['total'] or Decimal('0.00')
 
 
@@ -127,6 +174,10 @@ class Invoice(models.Model):
         ordering = ['-invoice_date', '-invoice_number']
         verbose_name = 'Invoice'
         verbose_name_plural = 'Invoices'
+        indexes = [
+            # Change scans of the journal generator
+            models.Index(fields=['updated_at', 'id']),
+        ]
     
     def __str__(self):
         return f"{self.invoice_number} - {self.customer.name}"
@@ -136,7 +187,7 @@ class Invoice(models.Model):
     
     def calculate_totals(self):
         """Calculate invoice totals"""
-        self.subtotal = sum(item.total_price for item in self.items.all())
+        self.subtotal = self.items.aggregate(total=models.Sum('total_price'))['total'] or Decimal('0.00')
         self.tax_amount = (self.subtotal * self.tax_rate) / Decimal('100.00')
         self.total_amount = self.subtotal + self.tax_amount - self.discount_amount
         self.save()
@@ -206,6 +257,10 @@ class Bill(models.Model):
         ordering = ['-bill_date', '-bill_number']
         verbose_name = 'Bill'
         verbose_name_plural = 'Bills'
+        indexes = [
+            # Change scans of the journal generator
+            models.Index(fields=['updated_at', 'id']),
+        ]
     
     def __str__(self):
         return f"{self.bill_number} - {self.vendor_name}"
@@ -259,6 +314,10 @@ class Payment(models.Model):
         ordering = ['-payment_date', '-payment_number']
         verbose_name = 'Payment'
         verbose_name_plural = 'Payments'
+        indexes = [
+            # Change scans of the journal generator
+            models.Index(fields=['updated_at', 'id']),
+        ]
     
     def __str__(self):
         return f"{self.payment_number} - {self.get_payment_type_display()} - ${self.amount}"
@@ -267,6 +326,31 @@ class Payment(models.Model):
         return reverse('financial:payment_detail', kwargs={'pk': self.pk})
 
 
+class PaymentAllocation(models.Model):
+    """
+    Part of a payment applied to one invoice or bill
+    """
+    payment = models.ForeignKey(Payment, on_delete=models.CASCADE, related_name='allocations')
+    invoice = models.ForeignKey(Invoice, on_delete=models.CASCADE, null=True, blank=True, related_name='allocations')
+    bill = models.ForeignKey(Bill, on_delete=models.CASCADE, null=True, blank=True, related_name='allocations')
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['payment', 'pk']
+        verbose_name = 'Payment Allocation'
+        verbose_name_plural = 'Payment Allocations'
+
+    def __str__(self):
+        return f"{self.payment.payment_number} -> {self.invoice or self.bill}: ${self.amount}"
+
+    def clean(self):
+        if (self.invoice_id is None) == (self.bill_id is None):
+            raise ValidationError('An allocation applies to exactly one invoice or bill.')
+        if self.amount is not None and self.amount <= 0:
+            raise ValidationError('Allocated amount must be positive.')
+
+
 class JournalEntry(models.Model):
     """
     General Journal Entries for double-entry bookkeeping
@@ -283,6 +367,10 @@ class JournalEntry(models.Model):
     description = models.CharField(max_length=500)
     notes = models.TextField(blank=True)
     
+    # Source document for generated entries (see financial.journals)
+    source_type = models.CharField(max_length=20, blank=True)
+    source_id = models.PositiveIntegerField(null=True, blank=True)
+    
     # Tracking
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='created_entries')
     created_at = models.DateTimeField(auto_now_add=True)
@@ -292,6 +380,7 @@ class JournalEntry(models.Model):
         ordering = ['-entry_date', '-entry_number']
         verbose_name = 'Journal Entry'
         verbose_name_plural = 'Journal Entries'
+        unique_together = ['source_type', 'source_id']
     
     def __str__(self):
         return f"{self.entry_number} - {self.description}"
@@ -299,14 +388,40 @@ class JournalEntry(models.Model):
     def get_absolute_url(self):
         return reverse('financial:journal_entry_detail', kwargs={'pk': self.pk})
     
+    def clean(self):
+        """Reject unbalanced postings and postings into or out of a closed period"""
+        if self.pk and self.status == 'posted' and not self.is_balanced():
+            raise ValidationError({'status': 'Debits must equal credits before the entry is posted.'})
+        lock_date = PeriodClose.get_lock_date()
+        if lock_date is None or self.entry_date is None:
+            return
+        stored = None
+        if self.pk:
+            stored = JournalEntry.objects.filter(pk=self.pk).values_list('status', 'entry_date').first()
+        current = (self.status, self.entry_date)
+        if stored == current:
+            return
+        for status, entry_date in filter(None, (stored, current)):
+            if status == 'posted' and entry_date <= lock_date:
+                raise ValidationError({'entry_date': f'The books are closed through {lock_date}.'})
+    
+    def get_totals(self):
+        """Total debit and credit of the entry's lines in one query"""
+        totals = self.lines.aggregate(
+            debit=models.Sum('debit_amount'), credit=models.Sum('credit_amount'))
+        return tuple(
+            (totals[key] or Decimal('0.00')).quantize(Decimal('0.01')) for key in ('debit', 'credit')
+        )
+    
     def get_total_debit(self):
-        return self.lines.aggregate(total=models.Sum('debit_amount'))['total'] or Decimal('0.00')
+        return self.get_totals()[0]
     
     def get_total_credit(self):
-        return self.lines.aggregate(total=models.Sum('credit_amount'))['total'] or Decimal('0.00')
+        return self.get_totals()[1]
     
     def is_balanced(self):
-        return self.get_total_debit() == self.get_total_credit()
+        debit, credit = self.get_totals()
+        return debit == credit
 
 
 class JournalEntryLine(models.Model):
@@ -328,6 +443,101 @@ class JournalEntryLine(models.Model):
         return f"{self.account.code} - Debit: {self.debit_amount} Credit: {self.credit_amount}"
 
 
+class PostingRule(models.Model):
+    """
+    Maps a source document type to the accounts of its generated journal entry
+    """
+    DOCUMENT_TYPES = [
+        ('invoice', 'Invoice'),
+        ('bill', 'Bill'),
+        ('payment_received', 'Payment Received'),
+        ('payment_made', 'Payment Made'),
+        ('expense', 'Expense'),
+    ]
+    
+    document_type = models.CharField(max_length=20, choices=DOCUMENT_TYPES)
+    category = models.CharField(max_length=50, blank=True,
+                                help_text="Expense category or payment method, blank for any")
+    debit_account = models.ForeignKey(Account, on_delete=models.PROTECT, related_name='debit_rules')
+    credit_account = models.ForeignKey(Account, on_delete=models.PROTECT, related_name='credit_rules')
+    tax_account = models.ForeignKey(Account, on_delete=models.PROTECT, null=True, blank=True, related_name='tax_rules',
+                                    help_text="Splits the tax amount of invoices and bills to this account")
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['document_type', 'category']
+        verbose_name = 'Posting Rule'
+        verbose_name_plural = 'Posting Rules'
+        unique_together = ['document_type', 'category']
+    
+    def __str__(self):
+        category = f" ({self.category})" if self.category else ""
+        return f"{self.get_document_type_display()}{category}: Dr {self.debit_account.code} / Cr {self.credit_account.code}"
+
+
+class JournalWatermark(models.Model):
+    """
+    Last source document change turned into journal entries, per source type
+    """
+    source_type = models.CharField(max_length=20, unique=True)
+    last_updated_at = models.DateTimeField(null=True, blank=True)
+    last_run_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['source_type']
+        verbose_name = 'Journal Watermark'
+        verbose_name_plural = 'Journal Watermarks'
+    
+    def __str__(self):
+        return f"{self.source_type} through {self.last_updated_at}"
+
+
+class PeriodClose(models.Model):
+    """
+    Closed accounting period - no postings on or before period_end
+    """
+    period_end = models.DateField(unique=True, help_text="Last day of the closed month")
+    notes = models.TextField(blank=True)
+    
+    # Tracking
+    closed_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='closed_periods')
+    closed_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-period_end']
+        verbose_name = 'Period Close'
+        verbose_name_plural = 'Period Closes'
+    
+    def __str__(self):
+        return f"Closed through {self.period_end}"
+    
+    @classmethod
+    def get_lock_date(cls, using='default'):
+        """Last closed day, or None while no period is closed"""
+        return cls.objects.using(using).order_by('-period_end').values_list('period_end', flat=True).first()
+
+
+class ClosingBalance(models.Model):
+    """
+    Frozen cumulative debit and credit totals per account at a period close
+    """
+    period_close = models.ForeignKey(PeriodClose, on_delete=models.CASCADE, related_name='balances')
+    account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='closing_balances')
+    debit_total = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    credit_total = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    
+    class Meta:
+        ordering = ['period_close', 'account']
+        verbose_name = 'Closing Balance'
+        verbose_name_plural = 'Closing Balances'
+        unique_together = ['period_close', 'account']
+    
+    def __str__(self):
+        return f"{self.account.code} @ {self.period_close.period_end}: Dr {self.debit_total} Cr {self.credit_total}"
+
+
 class Expense(models.Model):
     """
     Business Expenses
@@ -366,6 +576,10 @@ class Expense(models.Model):
         ordering = ['-expense_date', '-expense_number']
         verbose_name = 'Expense'
         verbose_name_plural = 'Expenses'
+        indexes = [
+            # Change scans of the journal generator
+            models.Index(fields=['updated_at', 'id']),
+        ]
     
     def __str__(self):
         return f"{self.expense_number} - {self.get_category_display()} - ${self.amount}"
@@ -0,0 +1,59 @@
+"""
+Period close - freezes cumulative account balances at a month end and locks
+the books through that date.
+
+Periods are closed in order: closing a month end also closes every earlier
+day. The closing balances are the previous close plus the AccountBalance
+totals of the months in between, so a close reads one row per account and
+month and never the journal lines. Only the latest close can be reopened.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+
+from .models import ClosingBalance, PeriodClose
+from .reports import next_month, posted_totals
+
+
+def close_period(period_end, user=None, notes='', using='default'):
+    """
+    Close the books through ``period_end`` (the last day of a month) and
+    store the closing balance of every account with postings.
+    """
+    if period_end + timedelta(days=1) != next_month(period_end):
+        raise ValueError('A period can only be closed at the end of a month.')
+    with transaction.atomic(using=using):
+        latest = (
+            PeriodClose.objects.using(using)
+            .select_for_update()
+            .order_by('-period_end')
+            .first()
+        )
+        if latest is not None and period_end <= latest.period_end:
+            raise ValueError(f'The books are already closed through {latest.period_end}.')
+        totals = posted_totals(None, period_end, using=using)
+        period_close = PeriodClose.objects.using(using).create(
+            period_end=period_end, closed_by=user, notes=notes,
+        )
+        ClosingBalance.objects.using(using).bulk_create([
+            ClosingBalance(period_close=period_close, account_id=account_id,
+                           debit_total=debit, credit_total=credit)
+            for account_id, (debit, credit) in totals.items()
+            if debit or credit
+        ], batch_size=5000)
+    return period_close
+
+
+def reopen_period(using='default'):
+    """Reopen the latest closed period, returning its end date or None"""
+    with transaction.atomic(using=using):
+        latest = (
+            PeriodClose.objects.using(using)
+            .select_for_update()
+            .order_by('-period_end')
+            .first()
+        )
+        if latest is None:
+            return None
+        latest.delete()
+    return latest.period_end
@@ -0,0 +1,92 @@
+"""
+Journal entry posting - validates and posts draft entries in bulk.
+
+Each batch runs in its own transaction: one grouped query totals debits,
+credits and line counts per entry, balanced entries are switched to
+``posted`` with a single UPDATE and their lines are applied to the account
+balances in one pass. Unbalanced, empty, non-draft and closed-period entries
+are left untouched and reported back with the reason.
+"""
+from collections import namedtuple
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from .ledger import entry_rows, post_rows
+from .models import JournalEntry, JournalEntryLine, PeriodClose
+
+ZERO = Decimal('0.00')
+CENT = Decimal('0.01')
+
+PostingResult = namedtuple('PostingResult', ['posted', 'rejected'])
+
+
+def entry_totals(entry_ids, using='default'):
+    """``{entry_id: (debit, credit, line_count)}`` for the given entries in one query"""
+    # Rounded to cents, SQLite sums decimals as floats
+    return {
+        entry_id: ((debit or ZERO).quantize(CENT), (credit or ZERO).quantize(CENT), lines)
+        for entry_id, debit, credit, lines in (
+            JournalEntryLine.objects.using(using)
+            .filter(journal_entry_id__in=entry_ids)
+            .order_by()
+            .values('journal_entry_id')
+            .annotate(debit=Sum('debit_amount'), credit=Sum('credit_amount'), lines=Count('pk'))
+            .values_list('journal_entry_id', 'debit', 'credit', 'lines')
+        )
+    }
+
+
+def post_batch(entry_ids, using='default'):
+    """Post one batch of entries in a single transaction"""
+    posted, rejected = [], {}
+    lock_date = PeriodClose.get_lock_date(using)
+    with transaction.atomic(using=using):
+        drafts = dict(
+            JournalEntry.objects.using(using)
+            .select_for_update()
+            .filter(pk__in=entry_ids, status='draft')
+            .values_list('pk', 'entry_date')
+        )
+        totals = entry_totals(list(drafts), using=using)
+        for entry_id in entry_ids:
+            if entry_id not in drafts:
+                rejected[entry_id] = 'not a draft entry'
+                continue
+            debit, credit, lines = totals.get(entry_id, (ZERO, ZERO, 0))
+            if lock_date is not None and drafts[entry_id] <= lock_date:
+                rejected[entry_id] = f'dated inside the books closed through {lock_date}'
+            elif not lines:
+                rejected[entry_id] = 'no lines'
+            elif debit != credit:
+                rejected[entry_id] = f'debits {debit} do not equal credits {credit}'
+            else:
+                posted.append(entry_id)
+        if not posted:
+            return posted, rejected
+
+        rows = entry_rows(posted, using=using)
+        # update() bypasses the JournalEntry signals, the lines are posted here
+        JournalEntry.objects.using(using).filter(pk__in=posted).update(
+            status='posted', updated_at=timezone.now(),
+        )
+        post_rows(rows, sender=JournalEntry, using=using)
+    return posted, rejected
+
+
+def post_entries(entry_ids, batch_size=2000, using='default'):
+    """
+    Post draft journal entries, ``batch_size`` entries per transaction.
+
+    Returns a PostingResult with the posted entry ids and a dict of rejected
+    entry ids to the reason.
+    """
+    entry_ids = list(dict.fromkeys(entry_ids))
+    result = PostingResult([], {})
+    for offset in range(0, len(entry_ids), batch_size):
+        posted, rejected = post_batch(entry_ids[offset:offset + batch_size], using=using)
+        result.posted.extend(posted)
+        result.rejected.update(rejected)
+    return result
@@ -0,0 +1,284 @@
+"""
+Financial statements - trial balance, income statement and balance sheet.
+
+Account totals for a date range come from at most two grouped queries: whole
+months are read from the AccountBalance period totals and only the partial
+months at either end of the range are summed from posted journal lines.
+Totals are then rolled up the ``Account.parent`` hierarchy in memory, so the
+cost of a report depends on the number of accounts and months, not on the
+number of journal lines. Balances as of a date start from the last period
+close instead of the beginning of time.
+"""
+from collections import defaultdict, namedtuple
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db.models import Q, Sum
+
+from .ledger import period_start
+from .models import Account, AccountBalance, ClosingBalance, JournalEntryLine, PeriodClose
+
+ZERO = Decimal('0.00')
+CENT = Decimal('0.01')
+
+class ReportRow(namedtuple('ReportRow', [
+        'account_id', 'code', 'name', 'account_type', 'depth', 'is_parent', 'debit', 'credit', 'balance'])):
+    """One account line; ``debit``/``credit`` include the account's descendants"""
+    __slots__ = ()
+
+    @property
+    def net_debit(self):
+        return max(self.debit - self.credit, ZERO)
+
+    @property
+    def net_credit(self):
+        return max(self.credit - self.debit, ZERO)
+
+Section = namedtuple('Section', ['account_type', 'title', 'rows', 'total'])
+
+ACCOUNT_FIELDS = ('pk', 'code', 'name', 'account_type', 'parent_id')
+
+
+def next_month(day):
+    """First day of the month after ``day``"""
+    return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def whole_months(start, end):
+    """
+    First and last period start of the months entirely inside ``start..end``.
+
+    ``None`` bounds are open. Returns None when no whole month fits in the
+    range.
+    """
+    first = start if start is None or start.day == 1 else next_month(start)
+    last = None
+    if end is not None:
+        last = period_start(end)
+        if end + timedelta(days=1) != next_month(end):
+            # end is not the last day of its month
+            last = period_start(last - timedelta(days=1))
+    if first is not None and last is not None and first > last:
+        return None
+    return first, last
+
+
+def _add(totals, rows):
+    # SQLite sums decimals as floats, round back to cents
+    for account_id, debit, credit in rows:
+        account_totals = totals[account_id]
+        account_totals[0] += (debit or ZERO).quantize(CENT)
+        account_totals[1] += (credit or ZERO).quantize(CENT)
+
+
+def _line_totals(date_filter, using):
+    return (
+        JournalEntryLine.objects.using(using)
+        .filter(date_filter, journal_entry__status='posted')
+        .order_by()
+        .values('account_id')
+        .annotate(debit=Sum('debit_amount'), credit=Sum('credit_amount'))
+        .values_list('account_id', 'debit', 'credit')
+    )
+
+
+def _date_range(start, end):
+    date_filter = Q()
+    if start is not None:
+        date_filter &= Q(journal_entry__entry_date__gte=start)
+    if end is not None:
+        date_filter &= Q(journal_entry__entry_date__lte=end)
+    return date_filter
+
+
+def posted_totals(start=None, end=None, using='default'):
+    """
+    Posted debit and credit totals per account for ``start..end`` inclusive.
+
+    Returns ``{account_id: [debit, credit]}``; ``None`` bounds are open.
+    Totals from the beginning of time start from the frozen balances of the
+    last period close on or before ``end`` and add only the open delta.
+    """
+    totals = defaultdict(lambda: [ZERO, ZERO])
+    if start is None:
+        closes = PeriodClose.objects.using(using).order_by('-period_end')
+        if end is not None:
+            closes = closes.filter(period_end__lte=end)
+        close = closes.values_list('pk', 'period_end').first()
+        if close is not None:
+            _add(totals, (
+                ClosingBalance.objects.using(using)
+                .filter(period_close_id=close[0])
+                .values_list('account_id', 'debit_total', 'credit_total')
+            ))
+            start = close[1] + timedelta(days=1)
+            if end is not None and start > end:
+                return totals
+
+    months = whole_months(start, end)
+    if months is None:
+        _add(totals, _line_totals(_date_range(start, end), using))
+        return totals
+
+    first, last = months
+    balances = AccountBalance.objects.using(using)
+    if first is not None:
+        balances = balances.filter(period_start__gte=first)
+    if last is not None:
+        balances = balances.filter(period_start__lte=last)
+    _add(totals, (
+        balances.order_by()
+        .values('account_id')
+        .annotate(debit=Sum('debit_total'), credit=Sum('credit_total'))
+        .values_list('account_id', 'debit', 'credit')
+    ))
+
+    # Partial months before and after the whole months
+    edges = Q()
+    if start is not None and start < first:
+        edges |= _date_range(start, first - timedelta(days=1))
+    if end is not None and end >= next_month(last):
+        edges |= _date_range(next_month(last), end)
+    if edges:
+        _add(totals, _line_totals(edges, using))
+    return totals
+
+
+def load_accounts(using='default'):
+    """``{account_id: (code, name, account_type, parent_id)}`` in code order"""
+    return {
+        pk: (code, name, account_type, parent_id)
+        for pk, code, name, account_type, parent_id
+        in Account.objects.using(using).order_by('code').values_list(*ACCOUNT_FIELDS)
+    }
+
+
+def roll_up(accounts, totals):
+    """Add every account's totals to all of its ancestors"""
+    rolled = defaultdict(lambda: [ZERO, ZERO])
+    for account_id, (debit, credit) in totals.items():
+        node, seen = account_id, set()
+        while node is not None and node in accounts and node not in seen:
+            seen.add(node)
+            rolled[node][0] += debit
+            rolled[node][1] += credit
+            node = accounts[node][3]
+    return rolled
+
+
+def normal_balance(account_type, debit, credit):
+    """Signed balance for an account type, as ``Account.normal_balance``"""
+    if account_type in Account.DEBIT_TYPES:
+        return debit - credit
+    return credit - debit
+
+
+def build_section(account_type, accounts, rolled, include_zero=False):
+    """Rows of one account type in hierarchy order, with the section total"""
+    children = defaultdict(list)
+    roots = []
+    for account_id, (code, name, type_, parent_id) in accounts.items():
+        if type_ != account_type:
+            continue
+        if parent_id in accounts and accounts[parent_id][2] == account_type:
+            children[parent_id].append(account_id)
+        else:
+            roots.append(account_id)
+
+    rows = []
+    total = ZERO
+    stack = [(account_id, 0) for account_id in reversed(roots)]
+    seen = set()
+    while stack:
+        account_id, depth = stack.pop()
+        if account_id in seen:
+            continue
+        seen.add(account_id)
+        debit, credit = rolled.get(account_id, (ZERO, ZERO))
+        if not include_zero and not debit and not credit:
+            continue
+        code, name = accounts[account_id][:2]
+        balance = normal_balance(account_type, debit, credit)
+        if depth == 0:
+            total += balance
+        rows.append(ReportRow(
+            account_id, code, name, account_type, depth, bool(children[account_id]),
+            debit, credit, balance,
+        ))
+        stack.extend((child, depth + 1) for child in reversed(children[account_id]))
+    return Section(account_type, dict(Account.ACCOUNT_TYPES)[account_type], rows, total)
+
+
+def trial_balance(end=None, start=None, include_zero=False, using='default'):
+    """
+    Net debit or credit per account for posted lines up to ``end`` (or in
+    ``start..end``), grouped by account type
+    """
+    accounts = load_accounts(using)
+    totals = posted_totals(start, end, using)
+    rolled = roll_up(accounts, totals)
+    sections = [
+        build_section(account_type, accounts, rolled, include_zero)
+        for account_type, _ in Account.ACCOUNT_TYPES
+    ]
+    total_debit = total_credit = ZERO
+    for debit, credit in totals.values():
+        if debit > credit:
+            total_debit += debit - credit
+        else:
+            total_credit += credit - debit
+    return {
+        'start': start,
+        'end': end,
+        'sections': sections,
+        'total_debit': total_debit,
+        'total_credit': total_credit,
+        'is_balanced': total_debit == total_credit,
+    }
+
+
+def income_statement(start=None, end=None, include_zero=False, using='default'):
+    """Revenue and expense for posted lines in ``start..end``"""
+    accounts = load_accounts(using)
+    rolled = roll_up(accounts, posted_totals(start, end, using))
+    revenue = build_section('revenue', accounts, rolled, include_zero)
+    expense = build_section('expense', accounts, rolled, include_zero)
+    return {
+        'start': start,
+        'end': end,
+        'sections': [revenue, expense],
+        'total_revenue': revenue.total,
+        'total_expense': expense.total,
+        'net_income': revenue.total - expense.total,
+    }
+
+
+def balance_sheet(as_of=None, include_zero=False, using='default'):
+    """
+    Assets, liabilities and equity as of a date.
+
+    Revenue and expense balances not yet closed to equity are reported as
+    current earnings so the sheet balances.
+    """
+    accounts = load_accounts(using)
+    totals = posted_totals(None, as_of, using)
+    rolled = roll_up(accounts, totals)
+    sections = [
+        build_section(account_type, accounts, rolled, include_zero)
+        for account_type in ('asset', 'liability', 'equity')
+    ]
+    earnings = ZERO
+    for account_id, (debit, credit) in totals.items():
+        if account_id in accounts and accounts[account_id][2] in ('revenue', 'expense'):
+            earnings += credit - debit
+    assets, liabilities, equity = (section.total for section in sections)
+    return {
+        'as_of': as_of,
+        'sections': sections,
+        'total_assets': assets,
+        'total_liabilities': liabilities,
+        'total_equity': equity + earnings,
+        'current_earnings': earnings,
+        'total_liabilities_and_equity': liabilities + equity + earnings,
+        'is_balanced': assets == liabilities + equity + earnings,
+    }
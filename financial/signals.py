@@ -0,0 +1,242 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .aging import invalidate_aging
+from .allocations import BILLS, INVOICES, KINDS, allocate_payment, refresh_paid_amounts
+from .budgets import apply_posted_rows, rebuild_actuals
+from .ledger import check_period_open, entry_rows, lines_posted, post_rows, reverse_rows
+from .models import Budget, Invoice, JournalEntry, JournalEntryLine, Payment, PaymentAllocation
+
+
+def posted_date(entry_id, using):
+    """Date of a posted journal entry, None for drafts and void entries"""
+    return (
+        JournalEntry.objects.using(using)
+        .filter(pk=entry_id, status='posted')
+        .values_list('entry_date', flat=True)
+        .first()
+    )
+
+
+@receiver(pre_save, sender=JournalEntry)
+def journal_entry_pre_save(sender, instance, using, raw=False, **kwargs):
+    """
+    Remember the stored status and date so post_save can rebalance, and
+    refuse to post into or unpost from a closed period
+    """
+    instance._posted_state = None
+    if raw:
+        return
+    if instance.pk:
+        instance._posted_state = (
+            JournalEntry.objects.using(using)
+            .filter(pk=instance.pk)
+            .values_list('status', 'entry_date')
+            .first()
+        )
+    old_state = instance._posted_state or (None, None)
+    if old_state != (instance.status, instance.entry_date):
+        check_period_open([
+            entry_date for status, entry_date in (old_state, (instance.status, instance.entry_date))
+            if status == 'posted'
+        ], using=using)
+
+
+@receiver(post_save, sender=JournalEntry)
+def journal_entry_post_save(sender, instance, created, using, raw=False, **kwargs):
+    """
+    Post or reverse the entry's lines when it enters, leaves or moves while posted
+    """
+    if raw:
+        return
+    old_status, old_date = getattr(instance, '_posted_state', None) or (None, None)
+    was_posted = old_status == 'posted'
+    is_posted = instance.status == 'posted'
+    moved = was_posted and is_posted and old_date != instance.entry_date
+    rows = []
+    if was_posted and (not is_posted or moved):
+        rows += reverse_rows(entry_rows([instance.pk], entry_date=old_date, using=using))
+    if is_posted and (not was_posted or moved):
+        rows += entry_rows([instance.pk], entry_date=instance.entry_date, using=using)
+    post_rows(rows, sender=sender, using=using)
+
+
+@receiver(pre_save, sender=JournalEntryLine)
+def journal_line_pre_save(sender, instance, using, raw=False, **kwargs):
+    """
+    Remember the stored line and the entry's posting date so post_save can
+    replace the line, and refuse changes inside a closed period
+    """
+    instance._posted_row = instance._posted_date = None
+    if raw:
+        return
+    if instance.pk:
+        instance._posted_row = (
+            JournalEntryLine.objects.using(using)
+            .filter(pk=instance.pk, journal_entry__status='posted')
+            .values_list('account_id', 'journal_entry__entry_date', 'debit_amount', 'credit_amount')
+            .first()
+        )
+    instance._posted_date = posted_date(instance.journal_entry_id, using)
+    old_row = instance._posted_row
+    check_period_open([old_row[1] if old_row else None, instance._posted_date], using=using)
+
+
+@receiver(post_save, sender=JournalEntryLine)
+def journal_line_post_save(sender, instance, created, using, raw=False, **kwargs):
+    """
+    Keep balances in step with lines added to or edited on posted entries
+    """
+    if raw:
+        return
+    old_row = getattr(instance, '_posted_row', None)
+    rows = reverse_rows([old_row]) if old_row else []
+    entry_date = getattr(instance, '_posted_date', None)
+    if entry_date is not None:
+        rows.append((instance.account_id, entry_date, instance.debit_amount, instance.credit_amount))
+    post_rows(rows, sender=sender, using=using)
+
+
+@receiver(pre_delete, sender=JournalEntryLine)
+def journal_line_pre_delete(sender, instance, using, **kwargs):
+    """
+    Remember the posting date of the line's entry, refusing deletes inside
+    a closed period
+    """
+    instance._posted_date = posted_date(instance.journal_entry_id, using)
+    check_period_open([instance._posted_date], using=using)
+
+
+@receiver(post_delete, sender=JournalEntryLine)
+def journal_line_post_delete(sender, instance, using, **kwargs):
+    """
+    Reverse lines removed from posted entries, including entry deletes
+    """
+    entry_date = getattr(instance, '_posted_date', None)
+    if entry_date is not None:
+        row = (instance.account_id, entry_date, instance.debit_amount, instance.credit_amount)
+        post_rows(reverse_rows([row]), sender=sender, using=using)
+
+
+@receiver(post_save, sender=Invoice)
+@receiver(post_delete, sender=Invoice)
+def invoice_changed(sender, using, **kwargs):
+    """
+    Drop cached AR aging reports once the change is committed
+    """
+    transaction.on_commit(invalidate_aging, using=using)
+
+
+@receiver(pre_save, sender=PaymentAllocation)
+def allocation_pre_save(sender, instance, using, raw=False, **kwargs):
+    """
+    Remember the documents the allocation applied to so both get refreshed
+    """
+    instance._allocated_to = None
+    if instance.pk and not raw:
+        instance._allocated_to = (
+            PaymentAllocation.objects.using(using)
+            .filter(pk=instance.pk)
+            .values_list('invoice_id', 'bill_id')
+            .first()
+        )
+
+
+@receiver(post_save, sender=PaymentAllocation)
+@receiver(post_delete, sender=PaymentAllocation)
+def allocation_changed(sender, instance, using, raw=False, **kwargs):
+    """
+    Refresh paid_amount and status of the invoice or bill paid by the allocation
+    """
+    if raw:
+        return
+    invoice_ids, bill_ids = [instance.invoice_id], [instance.bill_id]
+    old = getattr(instance, '_allocated_to', None)
+    if old:
+        invoice_ids.append(old[0])
+        bill_ids.append(old[1])
+    refresh_paid_amounts(INVOICES, invoice_ids, using=using)
+    refresh_paid_amounts(BILLS, bill_ids, using=using)
+
+
+@receiver(pre_save, sender=Payment)
+def payment_pre_save(sender, instance, using, raw=False, **kwargs):
+    """
+    Remember the stored type, amount and document to spot edits that move
+    the payment's allocation
+    """
+    instance._payment_state = None
+    if instance.pk and not raw:
+        instance._payment_state = (
+            Payment.objects.using(using)
+            .filter(pk=instance.pk)
+            .values_list('payment_type', 'amount', 'invoice_id', 'bill_id')
+            .first()
+        )
+
+
+@receiver(post_save, sender=Payment)
+def payment_saved(sender, instance, using, raw=False, **kwargs):
+    """
+    Allocate a payment entered against a single invoice or bill to that
+    document, up to its open balance, and allocate it again when its
+    amount or document is edited
+    """
+    if raw:
+        return
+    allocations = instance.allocations.using(using)
+    old_state = getattr(instance, '_payment_state', None)
+    state = (instance.payment_type, instance.amount, instance.invoice_id, instance.bill_id)
+    if old_state is not None and old_state != state:
+        _, _, old_invoice_id, old_bill_id = old_state
+        # Only the allocation made for the payment's own document is replaced,
+        # payments split over several documents keep their allocations
+        if not allocations.exclude(invoice_id=old_invoice_id, bill_id=old_bill_id).exists():
+            allocations.delete()
+
+    kind = KINDS.get(instance.payment_type)
+    document_id = getattr(instance, f'{kind.field}_id') if kind else None
+    if document_id is None or allocations.exists():
+        return
+    # Read the document again, the delete above may have changed its paid amount
+    document = kind.model.objects.using(using).get(pk=document_id)
+    amount = min(instance.amount, document.total_amount - document.paid_amount)
+    if amount > 0 and document.status in kind.statuses and document.status != 'paid':
+        allocate_payment(instance, [(document, amount)], using=using)
+
+
+@receiver(lines_posted)
+def lines_posted_to_budgets(sender, rows, using, **kwargs):
+    """
+    Add posted and reversed lines to the matching budget actuals
+    """
+    apply_posted_rows(rows, using=using)
+
+
+@receiver(pre_save, sender=Budget)
+def budget_pre_save(sender, instance, using, raw=False, **kwargs):
+    """
+    Remember the stored account and window to spot changes that move the actuals
+    """
+    instance._budget_window = None
+    if instance.pk and not raw:
+        instance._budget_window = (
+            Budget.objects.using(using)
+            .filter(pk=instance.pk)
+            .values_list('account_id', 'start_date', 'end_date')
+            .first()
+        )
+
+
+@receiver(post_save, sender=Budget)
+def budget_saved(sender, instance, created, using, raw=False, **kwargs):
+    """
+    Compute the actuals of new budgets and budgets with a new account or window
+    """
+    if raw:
+        return
+    window = (instance.account_id, instance.start_date, instance.end_date)
+    if created or getattr(instance, '_budget_window', None) != window:
+        rebuild_actuals(Budget.objects.using(using).filter(pk=instance.pk), using=using)
+        instance.refresh_from_db(using=using, fields=['actual_amount'])
@@ -0,0 +1,310 @@
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.test import TestCase
+from django.urls import reverse
+
+from .allocations import allocate_payment, reconcile_payments
+from .ledger import period_start
+from .models import (
+    Account, AccountBalance, Bill, ClosingBalance, Customer, Invoice, JournalEntry, JournalEntryLine,
+    Payment, PaymentAllocation,
+)
+from .periods import close_period, reopen_period
+from .posting import post_entries
+
+
+class CustomerBalanceQueryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='accountant', password='secret')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def create_customers(self, count, start=0):
+        customers = Customer.objects.bulk_create(
+            [Customer(name=f'Customer {start + index:03d}') for index in range(count)]
+        )
+        customers = Customer.objects.filter(name__in=[customer.name for customer in customers])
+        invoices = []
+        for customer in customers:
+            for number, status in enumerate(['draft', 'sent', 'paid']):
+                invoices.append(Invoice(
+                    invoice_number=f'INV-{customer.pk}-{number}',
+                    customer=customer,
+                    invoice_date=date(2024, 1, 1),
+                    due_date=date(2024, 1, 31),
+                    status=status,
+                    total_amount=Decimal('100.00'),
+                ))
+        Invoice.objects.bulk_create(invoices)
+
+    def test_customer_list_query_count_is_constant(self):
+        url = reverse('financial:customer_list')
+        self.create_customers(5)
+        with self.assertNumQueries(4) as context:
+            # session, user, pagination count, customer page
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+        self.create_customers(95, start=5)
+        with self.assertNumQueries(len(context.captured_queries)):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        customer = response.context['customers'][0]
+        self.assertEqual(customer.get_total_invoices(), Decimal('300.00'))
+        self.assertEqual(customer.get_outstanding_balance(), Decimal('200.00'))
+        self.assertContains(response, '$300.00')
+
+    def test_customer_detail_balances_in_one_query(self):
+        self.create_customers(1)
+        customer = Customer.objects.get()
+        with self.assertNumQueries(3):
+            # session, user, annotated customer
+            response = self.client.get(reverse('financial:customer_detail', args=[customer.pk]))
+        self.assertContains(response, '$300.00')
+        self.assertContains(response, '$200.00')
+
+
+class JournalTestMixin:
+    @classmethod
+    def setUpTestData(cls):
+        cls.cash = Account.objects.create(code='1000', name='Cash', account_type='asset')
+        cls.revenue = Account.objects.create(code='4000', name='Revenue', account_type='revenue')
+
+    def create_entry(self, number, entry_date, amount, status='draft'):
+        entry = JournalEntry.objects.create(
+            entry_number=number, entry_date=entry_date, description=number, status=status,
+        )
+        JournalEntryLine.objects.create(journal_entry=entry, account=self.cash, debit_amount=amount)
+        JournalEntryLine.objects.create(journal_entry=entry, account=self.revenue, credit_amount=amount)
+        return entry
+
+    def post(self, entry, **changes):
+        for field, value in dict(changes, status='posted').items():
+            setattr(entry, field, value)
+        entry.save()
+
+    def balances(self):
+        return {
+            (account_id, month): (debit, credit)
+            for account_id, month, debit, credit in AccountBalance.objects.values_list(
+                'account_id', 'period_start', 'debit_total', 'credit_total',
+            )
+            if debit or credit
+        }
+
+    def assertBalancesMatchLines(self):
+        expected = defaultdict(lambda: [Decimal('0.00'), Decimal('0.00')])
+        lines = JournalEntryLine.objects.filter(journal_entry__status='posted').values_list(
+            'account_id', 'journal_entry__entry_date', 'debit_amount', 'credit_amount',
+        )
+        for account_id, entry_date, debit, credit in lines:
+            totals = expected[account_id, period_start(entry_date)]
+            totals[0] += debit
+            totals[1] += credit
+        self.assertEqual(self.balances(), {
+            key: tuple(totals) for key, totals in expected.items() if any(totals)
+        })
+
+
+class LedgerBalanceTests(JournalTestMixin, TestCase):
+    """AccountBalance always equals the sum of the posted journal lines"""
+
+    def test_post_adds_lines_to_balances(self):
+        entry = self.create_entry('JE-1', date(2024, 1, 15), Decimal('100.00'))
+        self.assertEqual(self.balances(), {})
+        self.post(entry)
+        self.assertEqual(self.cash.get_balance(), Decimal('100.00'))
+        self.assertEqual(self.revenue.get_balance(), Decimal('100.00'))
+        self.assertBalancesMatchLines()
+
+    def test_unpost_and_line_edits_keep_balances(self):
+        entry = self.create_entry('JE-1', date(2024, 1, 15), Decimal('100.00'))
+        self.post(entry)
+        line = entry.lines.get(account=self.cash)
+        line.debit_amount = Decimal('80.00')
+        line.save()
+        self.assertBalancesMatchLines()
+        entry.lines.get(account=self.revenue).delete()
+        self.assertBalancesMatchLines()
+        entry.status = 'void'
+        entry.save()
+        self.assertEqual(self.balances(), {})
+        self.assertBalancesMatchLines()
+
+    def test_redating_a_posted_entry_moves_its_balances(self):
+        entry = self.create_entry('JE-1', date(2024, 1, 15), Decimal('100.00'))
+        self.post(entry)
+        entry.entry_date = date(2024, 3, 1)
+        entry.save()
+        self.assertEqual(set(month for _, month in self.balances()), {date(2024, 3, 1)})
+        self.assertBalancesMatchLines()
+        entry.delete()
+        self.assertEqual(self.balances(), {})
+
+
+class PeriodCloseTests(JournalTestMixin, TestCase):
+    """Closing a period freezes its balances and refuses back-dated postings"""
+
+    def setUp(self):
+        self.posted = self.create_entry('JE-1', date(2024, 1, 15), Decimal('100.00'), status='posted')
+        close_period(date(2024, 1, 31))
+
+    def test_close_stores_closing_balances(self):
+        closing = dict(ClosingBalance.objects.values_list('account_id', 'debit_total'))
+        self.assertEqual(closing, {self.cash.pk: Decimal('100.00'), self.revenue.pk: Decimal('0.00')})
+        with self.assertRaises(ValueError):
+            close_period(date(2024, 1, 31))
+        with self.assertRaises(ValueError):
+            close_period(date(2024, 2, 15))
+
+    def test_postings_into_closed_period_are_refused(self):
+        entry = self.create_entry('JE-2', date(2024, 1, 20), Decimal('50.00'))
+        with self.assertRaises(ValueError):
+            self.post(entry)
+        later = self.create_entry('JE-3', date(2024, 2, 1), Decimal('50.00'))
+        with self.assertRaises(ValueError):
+            self.post(later, entry_date=date(2024, 1, 31))
+        self.assertBalancesMatchLines()
+
+    def test_closed_postings_cant_be_changed(self):
+        self.posted.status = 'void'
+        with self.assertRaises(ValueError):
+            self.posted.save()
+        line = JournalEntryLine.objects.get(journal_entry=self.posted, account=self.cash)
+        line.debit_amount = Decimal('1.00')
+        with self.assertRaises(ValueError):
+            line.save()
+        # The delete collector raises inside its own atomic block
+        with self.assertRaises(ValueError), transaction.atomic():
+            line.delete()
+        self.assertEqual(self.cash.get_balance(), Decimal('100.00'))
+
+    def test_postings_after_the_close_and_reopen(self):
+        entry = self.create_entry('JE-2', date(2024, 2, 1), Decimal('50.00'))
+        self.post(entry)
+        self.assertEqual(self.cash.get_balance(), Decimal('150.00'))
+        self.assertEqual(reopen_period(), date(2024, 1, 31))
+        self.post(self.create_entry('JE-3', date(2024, 1, 20), Decimal('25.00')))
+        self.assertEqual(self.cash.get_balance(), Decimal('175.00'))
+        self.assertBalancesMatchLines()
+
+    def test_post_entries_rejects_closed_period_entries(self):
+        closed = self.create_entry('JE-2', date(2024, 1, 20), Decimal('50.00'))
+        valid = self.create_entry('JE-3', date(2024, 2, 1), Decimal('30.00'))
+        result = post_entries([closed.pk, valid.pk], batch_size=1)
+        self.assertEqual(result.posted, [valid.pk])
+        self.assertEqual(list(result.rejected), [closed.pk])
+        closed.refresh_from_db()
+        self.assertEqual(closed.status, 'draft')
+        self.assertEqual(self.cash.get_balance(), Decimal('130.00'))
+        self.assertBalancesMatchLines()
+
+
+class PaymentAllocationTests(TestCase):
+    """paid_amount and status follow the allocations of payments"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = Customer.objects.create(name='Customer')
+
+    def create_invoice(self, number, total, due_date=date(2099, 1, 31)):
+        return Invoice.objects.create(
+            invoice_number=number, customer=self.customer, invoice_date=date(2024, 1, 1),
+            due_date=due_date, status='sent', total_amount=Decimal(total),
+        )
+
+    def create_payment(self, number, amount, payment_type='received', **fields):
+        return Payment.objects.create(
+            payment_number=number, payment_type=payment_type, payment_date=date(2024, 2, 1),
+            amount=Decimal(amount), payment_method='cash', **fields,
+        )
+
+    def assertPaid(self, document, paid_amount, status):
+        document.refresh_from_db()
+        self.assertEqual((document.paid_amount, document.status), (Decimal(paid_amount), status))
+
+    def test_partial_allocation(self):
+        invoice = self.create_invoice('INV-1', '100.00')
+        payment = self.create_payment('PAY-1', '40.00')
+        allocate_payment(payment, [(invoice, Decimal('40.00'))])
+        self.assertPaid(invoice, '40.00', 'sent')
+        allocate_payment(self.create_payment('PAY-2', '60.00'), [(invoice, Decimal('60.00'))])
+        self.assertPaid(invoice, '100.00', 'paid')
+
+    def test_payment_split_over_several_invoices(self):
+        first = self.create_invoice('INV-1', '100.00')
+        overdue = self.create_invoice('INV-2', '50.00', due_date=date(2020, 1, 31))
+        payment = self.create_payment('PAY-1', '120.00')
+        allocate_payment(payment, [(first, Decimal('100.00')), (overdue, Decimal('20.00'))])
+        self.assertPaid(first, '100.00', 'paid')
+        self.assertPaid(overdue, '20.00', 'overdue')
+
+        with self.assertRaises(ValueError):
+            allocate_payment(payment, [(overdue, Decimal('1.00'))])
+        with self.assertRaises(ValueError):
+            allocate_payment(self.create_payment('PAY-2', '100.00'), [(overdue, Decimal('31.00'))])
+        self.assertEqual(PaymentAllocation.objects.count(), 2)
+
+        payment.delete()
+        self.assertPaid(first, '0.00', 'sent')
+        self.assertPaid(overdue, '0.00', 'overdue')
+
+    def test_payments_only_pay_their_document_type(self):
+        bill = Bill.objects.create(
+            bill_number='BILL-1', vendor_name='Vendor', bill_date=date(2024, 1, 1),
+            due_date=date(2099, 1, 31), status='pending', total_amount=Decimal('80.00'),
+        )
+        with self.assertRaises(ValueError):
+            allocate_payment(self.create_payment('PAY-1', '80.00'), [(bill, Decimal('80.00'))])
+        allocate_payment(self.create_payment('PAY-2', '80.00', payment_type='made'), [(bill, Decimal('80.00'))])
+        self.assertPaid(bill, '80.00', 'paid')
+
+    def test_payment_entered_against_an_invoice(self):
+        invoice = self.create_invoice('INV-1', '100.00')
+        self.create_payment('PAY-1', '150.00', invoice=invoice)
+        self.assertPaid(invoice, '100.00', 'paid')
+
+    def test_editing_a_payment_moves_its_allocation(self):
+        first = self.create_invoice('INV-1', '100.00')
+        second = self.create_invoice('INV-2', '100.00')
+        payment = self.create_payment('PAY-1', '100.00', invoice=first)
+        self.assertPaid(first, '100.00', 'paid')
+
+        payment.invoice = second
+        payment.amount = Decimal('40.00')
+        payment.save()
+        self.assertPaid(first, '0.00', 'sent')
+        self.assertPaid(second, '40.00', 'sent')
+
+        payment.amount = Decimal('60.00')
+        payment.save()
+        self.assertPaid(second, '60.00', 'sent')
+
+    def test_editing_a_split_payment_keeps_its_allocations(self):
+        first = self.create_invoice('INV-1', '100.00')
+        second = self.create_invoice('INV-2', '100.00')
+        payment = self.create_payment('PAY-1', '50.00')
+        allocate_payment(payment, [(first, Decimal('20.00')), (second, Decimal('30.00'))])
+        payment.amount = Decimal('55.00')
+        payment.save()
+        self.assertPaid(first, '20.00', 'sent')
+        self.assertPaid(second, '30.00', 'sent')
+
+    def test_reconcile_by_reference_then_amount(self):
+        by_reference = self.create_invoice('INV-1', '100.00')
+        by_amount = self.create_invoice('INV-2', '75.00')
+        self.create_payment('PAY-1', '30.00', reference_number=' inv-1 ', customer=self.customer)
+        self.create_payment('PAY-2', '75.00', customer=self.customer)
+        self.create_payment('PAY-3', '75.00', customer=self.customer)
+        result = reconcile_payments()
+        self.assertEqual((result.by_reference, result.by_amount), (1, 1))
+        self.assertPaid(by_reference, '30.00', 'sent')
+        self.assertPaid(by_amount, '75.00', 'paid')
+        result = reconcile_payments()
+        self.assertEqual((result.by_reference, result.by_amount), (0, 0))
@@ -7,6 +7,18 @@ urlpatterns = [
     # Dashboard
     path('', views.financial_dashboard, name='dashboard'),
     
+    # Reports
+    path('reports/trial-balance/', views.trial_balance, name='trial_balance'),
+    path('reports/income-statement/', views.income_statement, name='income_statement'),
+    path('reports/balance-sheet/', views.balance_sheet, name='balance_sheet'),
+    path('reports/ar-aging/', views.ar_aging, name='ar_aging'),
+    path('reports/ar-aging/csv/', views.ar_aging_csv, name='ar_aging_csv'),
+    
+    # Period close
+    path('period-close/', views.PeriodCloseListView.as_view(), name='period_close_list'),
+    path('period-close/close/', views.close_books, name='close_books'),
+    path('period-close/reopen/', views.reopen_books, name='reopen_books'),
+    
     # Accounts
     path('accounts/', views.AccountListView.as_view(), name='account_list'),
     path('accounts/create/', views.AccountCreateView.as_view(), name='account_create'),
@@ -1,3 +1,6 @@
+import csv
+
+from django.http import StreamingHttpResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
@@ -7,11 +10,17 @@ from django.urls import reverse_lazy
 from django.db.models import Q, Sum, Count
 from decimal import Decimal
 from datetime import datetime, timedelta
+from django.utils import timezone
+from django.utils.dateparse import parse_date
 
 from .models import (
     Account, Customer, Invoice, InvoiceItem, Bill, Payment,
-    JournalEntry, JournalEntryLine, Expense, Budget
+    JournalEntry, JournalEntryLine, Expense, Budget, PeriodClose
 )
+from .aging import BUCKETS, get_aging, iter_aging, with_invoice_totals
+from .ledger import with_balances
+from .periods import close_period, reopen_period
+from . import reports
 
 
 # ==================== DASHBOARD ====================
@@ -42,6 +51,8 @@ def financial_dashboard(request):
     # Status counts
     invoice_counts = Invoice.objects.values('status').annotate(count=Count('id'))
     
+    aging = get_aging(timezone.localdate())
+    
     context = {
         'total_revenue': total_revenue,
         'total_expenses': total_expenses,
@@ -52,11 +63,131 @@ def financial_dashboard(request):
         'recent_payments': recent_payments,
         'recent_expenses': recent_expenses,
         'invoice_counts': invoice_counts,
+        'aging_buckets': [(label, aging['totals'][key]) for key, label in BUCKETS],
     }
     
     return render(request, 'financial/dashboard.html', context)
 
 
+# ==================== REPORTS ====================
+
+def _report_dates(request):
+    """Start and end dates from the query string, defaulting to year to date"""
+    today = timezone.localdate()
+    start = parse_date(request.GET.get('start') or '') or today.replace(month=1, day=1)
+    end = parse_date(request.GET.get('end') or '') or today
+    return start, end
+
+
+@login_required
+def trial_balance(request):
+    """Trial balance as of the end date"""
+    start, end = _report_dates(request)
+    context = reports.trial_balance(end=end)
+    context['start'] = start
+    return render(request, 'financial/trial_balance.html', context)
+
+
+@login_required
+def income_statement(request):
+    """Profit and loss for the selected period"""
+    start, end = _report_dates(request)
+    context = reports.income_statement(start=start, end=end)
+    return render(request, 'financial/income_statement.html', context)
+
+
+@login_required
+def balance_sheet(request):
+    """Balance sheet as of the end date"""
+    start, end = _report_dates(request)
+    context = reports.balance_sheet(as_of=end)
+    context.update(start=start, end=end)
+    return render(request, 'financial/balance_sheet.html', context)
+
+
+@login_required
+def ar_aging(request):
+    """Accounts receivable aging by customer"""
+    as_of = parse_date(request.GET.get('as_of') or '') or timezone.localdate()
+    context = get_aging(as_of)
+    context['buckets'] = BUCKETS
+    return render(request, 'financial/ar_aging.html', context)
+
+
+class Echo:
+    """File-like object that returns what is written, for streaming csv"""
+    def write(self, value):
+        return value
+
+
+@login_required
+def ar_aging_csv(request):
+    """Stream the AR aging report as CSV"""
+    as_of = parse_date(request.GET.get('as_of') or '') or timezone.localdate()
+    writer = csv.writer(Echo())
+    
+    def stream():
+        yield writer.writerow(['Customer ID', 'Customer'] + [f'{label} days' for _, label in BUCKETS] + ['Total'])
+        for row in iter_aging(as_of):
+            yield writer.writerow(row)
+    
+    response = StreamingHttpResponse(stream(), content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="ar-aging-{as_of.isoformat()}.csv"'
+    return response
+
+
+# ==================== PERIOD CLOSE ====================
+
+class PeriodCloseListView(LoginRequiredMixin, ListView):
+    model = PeriodClose
+    template_name = 'financial/period_close_list.html'
+    context_object_name = 'closes'
+    paginate_by = 24
+    
+    def get_queryset(self):
+        return (
+            PeriodClose.objects.select_related('closed_by')
+            .annotate(accounts=Count('balances'))
+            .order_by('-period_end')
+        )
+    
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['lock_date'] = PeriodClose.get_lock_date()
+        # Suggest closing the month before the current one
+        context['next_period_end'] = timezone.localdate().replace(day=1) - timedelta(days=1)
+        return context
+
+
+@login_required
+def close_books(request):
+    """Close the books through the posted month end"""
+    if request.method == 'POST':
+        period_end = parse_date(request.POST.get('period_end') or '')
+        if period_end is None:
+            messages.error(request, 'Enter the last day of the month to close.')
+        else:
+            try:
+                close_period(period_end, user=request.user, notes=request.POST.get('notes', ''))
+            except ValueError as e:
+                messages.error(request, str(e))
+            else:
+                messages.success(request, f'Books closed through {period_end}.')
+    return redirect('financial:period_close_list')
+
+
+@login_required
+def reopen_books(request):
+    """Reopen the latest closed period"""
+    if request.method == 'POST':
+        period_end = reopen_period()
+        if period_end is None:
+            messages.warning(request, 'No closed period to reopen.')
+        else:
+            messages.success(request, f'Period ending {period_end} reopened.')
+    return redirect('financial:period_close_list')
+
+
 # ==================== ACCOUNTS ====================
 
 class AccountListView(LoginRequiredMixin, ListView):
@@ -66,7 +197,7 @@ class AccountListView(LoginRequiredMixin, ListView):
     paginate_by = 50
     
     def get_queryset(self):
-        queryset = Account.objects.all()
+        queryset = with_balances(Account.objects.order_by('code'))
         
         # Search
         search = self.request.GET.get('search')
@@ -96,6 +227,14 @@ class AccountDetailView(LoginRequiredMixin, DetailView):
     model = Account
     template_name = 'financial/account_detail.html'
     context_object_name = 'account'
+    
+    def get_queryset(self):
+        return with_balances(Account.objects.all())
+    
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['balances'] = self.object.balances.order_by('-period_start')[:12]
+        return context
 
 
 class AccountCreateView(LoginRequiredMixin, CreateView):
@@ -139,7 +278,7 @@ class CustomerListView(LoginRequiredMixin, ListView):
     paginate_by = 20
     
     def get_queryset(self):
-        queryset = Customer.objects.all()
+        queryset = with_invoice_totals(Customer.objects.order_by('name'))
         
         search = self.request.GET.get('search')
         if search:
@@ -156,6 +295,9 @@ class CustomerDetailView(LoginRequiredMixin, DetailView):
     model = Customer
     template_name = 'financial/customer_detail.html'
     context_object_name = 'customer'
+    
+    def get_queryset(self):
+        return with_invoice_totals(Customer.objects.all())
 
 
 class CustomerCreateView(LoginRequiredMixin, CreateView):
@@ -468,7 +610,7 @@ class BudgetDetailView(LoginRequiredMixin, DetailView):
 class BudgetCreateView(LoginRequiredMixin, CreateView):
     model = Budget
     template_name = 'financial/budget_form.html'
-    fields = ['name', 'period_type', 'start_date', 'end_date', 'account', 'budgeted_amount', 'actual_amount', 'notes', 'is_active']
+    fields = ['name', 'period_type', 'start_date', 'end_date', 'account', 'budgeted_amount', 'notes', 'is_active']
     success_url = reverse_lazy('financial:budget_list')
     
     def form_valid(self, form):
@@ -480,7 +622,7 @@ class BudgetCreateView(LoginRequiredMixin, CreateView):
 class BudgetUpdateView(LoginRequiredMixin, UpdateView):
     model = Budget
     template_name = 'financial/budget_form.html'
-    fields = ['name', 'period_type', 'start_date', 'end_date', 'account', 'budgeted_amount', 'actual_amount', 'notes', 'is_active']
+    fields = ['name', 'period_type', 'start_date', 'end_date', 'account', 'budgeted_amount', 'notes', 'is_active']
     success_url = reverse_lazy('financial:budget_list')
 
 
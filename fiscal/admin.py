@@ -1,5 +1,10 @@
-from django.contrib import admin
-from .models import TaxRate, FiscalYear, Invoice, InvoiceItem, Payment, TaxReport
+from django.contrib import admin, messages
+from .models import (
+    TaxRate, FiscalYear, Invoice, InvoiceItem, Payment, TaxReport, TaxReportLine,
+    ArchivedInvoice, ArchivedInvoiceItem, ArchivedPayment
+)
+from .pricing import reprice_invoices
+from .taxes import generate_tax_report
 
 
 @admin.register(TaxRate)
@@ -13,18 +18,30 @@ class TaxRateAdmin(admin.ModelAdmin):
 
 @admin.register(FiscalYear)
 class FiscalYearAdmin(admin.ModelAdmin):
-    list_display = ['name', 'start_date', 'end_date', 'status', 'created_by', 'created_at']
+    list_display = ['name', 'start_date', 'end_date', 'status', 'archived_at', 'created_by', 'created_at']
     list_filter = ['status']
     search_fields = ['name', 'description']
     date_hierarchy = 'start_date'
     ordering = ['-start_date']
+    readonly_fields = ['archived_at']
 
 
 class InvoiceItemInline(admin.TabularInline):
     model = InvoiceItem
     extra = 1
-    fields = ['description', 'quantity', 'unit_price', 'tax_rate', 'discount_percent', 'line_total']
-    readonly_fields = ['line_total']
+    fields = ['description', 'quantity', 'unit_price', 'tax_rate', 'discount_percent', 'tax_amount', 'line_total']
+    readonly_fields = ['tax_amount', 'line_total']
+
+
+class TaxReportLineInline(admin.TabularInline):
+    model = TaxReportLine
+    extra = 0
+    fields = ['tax_rate', 'rate', 'taxable_sales', 'tax_collected', 'taxable_purchases', 'tax_paid']
+    readonly_fields = fields
+    can_delete = False
+    
+    def has_add_permission(self, request, obj=None):
+        return False
 
 
 @admin.register(Invoice)
@@ -35,6 +52,7 @@ class InvoiceAdmin(admin.ModelAdmin):
     date_hierarchy = 'invoice_date'
     ordering = ['-invoice_date']
     inlines = [InvoiceItemInline]
+    actions = ['reprice_lines']
     
     fieldsets = (
         ('Invoice Information', {
@@ -51,6 +69,11 @@ class InvoiceAdmin(admin.ModelAdmin):
         }),
     )
     readonly_fields = ['balance', 'created_by']
+    
+    @admin.action(description='Reprice lines with current tax rates')
+    def reprice_lines(self, request, queryset):
+        lines = reprice_invoices(queryset)
+        self.message_user(request, f"Repriced {lines} lines.", messages.SUCCESS)
 
 
 @admin.register(Payment)
@@ -69,4 +92,52 @@ class TaxReportAdmin(admin.ModelAdmin):
     search_fields = ['report_number']
     date_hierarchy = 'period_end'
     ordering = ['-period_end']
-    readonly_fields = ['net_tax']
+    readonly_fields = ['total_sales', 'total_purchases', 'tax_collected', 'tax_paid', 'net_tax']
+    inlines = [TaxReportLineInline]
+    actions = ['regenerate']
+    
+    @admin.action(description='Regenerate from invoices')
+    def regenerate(self, request, queryset):
+        drafts = [report for report in queryset if report.status == 'draft']
+        for report in drafts:
+            generate_tax_report(report)
+        self.message_user(request, f"Regenerated {len(drafts)} tax reports.", messages.SUCCESS)
+        if len(drafts) < len(queryset):
+            self.message_user(request, f"{len(queryset) - len(drafts)} reports were not regenerated (not drafts).", messages.WARNING)
+
+
+class ReadOnlyInline(admin.TabularInline):
+    extra = 0
+    can_delete = False
+    
+    def has_add_permission(self, request, obj=None):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+class ArchivedInvoiceItemInline(ReadOnlyInline):
+    model = ArchivedInvoiceItem
+    fields = ['description', 'quantity', 'unit_price', 'tax_rate', 'discount_percent', 'tax_amount', 'line_total']
+
+
+class ArchivedPaymentInline(ReadOnlyInline):
+    model = ArchivedPayment
+    fields = ['payment_number', 'payment_date', 'amount', 'payment_method', 'status', 'reference_number']
+
+
+@admin.register(ArchivedInvoice)
+class ArchivedInvoiceAdmin(admin.ModelAdmin):
+    list_display = ['invoice_number', 'invoice_type', 'customer_name', 'total_amount', 'status', 'invoice_date', 'fiscal_year', 'archived_at']
+    list_filter = ['fiscal_year', 'invoice_type', 'status']
+    search_fields = ['invoice_number', 'customer_name', 'customer_email']
+    date_hierarchy = 'invoice_date'
+    ordering = ['-invoice_date']
+    inlines = [ArchivedInvoiceItemInline, ArchivedPaymentInline]
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
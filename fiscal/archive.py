@@ -0,0 +1,83 @@
+"""
+Fiscal year archiving - moves the invoices, lines and payments of closed
+fiscal years out of the live tables into the archive tables.
+
+An invoice belongs to the fiscal year its invoice date falls in, the same
+rule ``FiscalYearQuerySet.for_fiscal_year`` scopes the live lists with.
+Invoices are moved together with their lines and payments, keeping their
+ids, ``chunk_size`` invoices per transaction, so an interrupted run leaves
+every invoice either live or archived and can simply be run again. Archived
+rows stay queryable through ArchivedInvoice, ArchivedInvoiceItem and
+ArchivedPayment.
+"""
+from collections import Counter
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import (
+    ArchivedInvoice, ArchivedInvoiceItem, ArchivedPayment, FiscalYear, Invoice, InvoiceItem, Payment,
+)
+
+# (live model, archive model) in insert order
+ARCHIVES = [
+    (Invoice, ArchivedInvoice),
+    (InvoiceItem, ArchivedInvoiceItem),
+    (Payment, ArchivedPayment),
+]
+
+
+def copy_rows(queryset, archive_model, using='default', **values):
+    """Insert the rows of ``queryset`` into ``archive_model`` with their ids, overriding ``values``"""
+    columns = [field.attname for field in queryset.model._meta.concrete_fields]
+    rows = [
+        archive_model(**dict(row, **values))
+        for row in queryset.order_by().values(*columns)
+    ]
+    archive_model.objects.using(using).bulk_create(rows)
+    return len(rows)
+
+
+def archive_batch(fiscal_year, invoice_ids, using='default'):
+    """Move one batch of invoices with their lines and payments to the archive"""
+    counts = Counter()
+    with transaction.atomic(using=using):
+        for model, archive_model in ARCHIVES:
+            rows = model.objects.using(using)
+            if model is Invoice:
+                rows = rows.filter(pk__in=invoice_ids)
+                extra = {'fiscal_year_id': fiscal_year.pk}
+            else:
+                rows = rows.filter(invoice_id__in=invoice_ids)
+                extra = {}
+            counts[model._meta.model_name] += copy_rows(rows, archive_model, using=using, **extra)
+        # Children first, so the invoice delete finds nothing left to cascade
+        for model, _ in reversed(ARCHIVES):
+            lookup = 'pk__in' if model is Invoice else 'invoice_id__in'
+            model.objects.using(using).filter(**{lookup: invoice_ids}).delete()
+    return counts
+
+
+def archive_fiscal_year(fiscal_year, chunk_size=1000, using='default'):
+    """
+    Archive the invoices and payments of a closed fiscal year. Returns a
+    Counter of archived invoices, invoice items and payments.
+    """
+    if fiscal_year.status != 'closed':
+        raise ValueError(f'Fiscal year {fiscal_year} is not closed.')
+    invoices = Invoice.objects.using(using).for_fiscal_year(fiscal_year).order_by('pk').values_list('pk', flat=True)
+    counts = Counter()
+    while True:
+        # Archived invoices leave the table, so the next chunk is always the first
+        chunk = list(invoices[:chunk_size])
+        if not chunk:
+            break
+        counts.update(archive_batch(fiscal_year, chunk, using=using))
+    fiscal_year.archived_at = timezone.now()
+    fiscal_year.save(using=using, update_fields=['archived_at', 'updated_at'])
+    return counts
+
+
+def archivable_years(using='default'):
+    """Closed fiscal years not archived yet, oldest first"""
+    return FiscalYear.objects.using(using).filter(status='closed', archived_at__isnull=True).order_by('start_date')
@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from fiscal.archive import archivable_years, archive_fiscal_year
+from fiscal.models import FiscalYear
+
+
+class Command(BaseCommand):
+    help = 'Move the invoices and payments of closed fiscal years into the archive tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--year', type=int, action='append', dest='years',
+                            help='Fiscal year id to archive (repeatable), default every closed year not archived yet')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Invoices moved per transaction')
+
+    def handle(self, *args, **options):
+        if options['years']:
+            years = FiscalYear.objects.filter(pk__in=options['years']).order_by('start_date')
+        else:
+            years = archivable_years()
+
+        for fiscal_year in years:
+            started = time.perf_counter()
+            try:
+                counts = archive_fiscal_year(fiscal_year, chunk_size=options['chunk_size'])
+            except ValueError as e:
+                raise CommandError(str(e))
+            elapsed = time.perf_counter() - started
+            self.stdout.write(self.style.SUCCESS(
+                f"Archived {fiscal_year}: {counts['invoice']} invoices, {counts['invoiceitem']} lines "
+                f"and {counts['payment']} payments in {elapsed:.2f}s"
+            ))
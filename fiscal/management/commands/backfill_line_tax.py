@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from fiscal.taxes import backfill_line_tax
+
+
+class Command(BaseCommand):
+    help = (
+        'Store the tax amount of live and archived invoice lines priced before '
+        'tax amounts were stored, from their line total and tax rate'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Lines updated per query')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        lines = backfill_line_tax(chunk_size=options['chunk_size'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f"Stored the tax of {lines} invoice lines in {elapsed:.2f}s"))
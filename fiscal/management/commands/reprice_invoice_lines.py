@@ -0,0 +1,18 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from fiscal.pricing import reprice_invoices
+
+
+class Command(BaseCommand):
+    help = 'Price every fiscal invoice line again with the current tax rates and refresh the invoice totals'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Invoices priced per transaction')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        lines = reprice_invoices(chunk_size=options['chunk_size'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f"Priced {lines} invoice lines in {elapsed:.2f}s"))
@@ -1,6 +1,7 @@
 from django.db import models
 from django.contrib.auth import get_user_model
 from django.urls import reverse
+from django.utils import timezone
 from decimal import Decimal
 
 User = get_user_model()
@@ -54,6 +55,7 @@ class FiscalYear(models.Model):
     end_date = models.DateField()
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='draft')
     description = models.TextField(blank=True)
+    archived_at = models.DateTimeField(null=True, blank=True, help_text="When the year's invoices and payments were moved to the archive")
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='fiscal_years_created')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -68,10 +70,28 @@ class FiscalYear(models.Model):
     
     def get_absolute_url(self):
         return reverse('fiscal:fiscalyear_detail', kwargs={'pk': self.pk})
+    
+    @classmethod
+    def get_current(cls):
+        """The active fiscal year containing today, else the latest active one"""
+        today = timezone.localdate()
+        years = cls.objects.filter(status='active').order_by('-start_date')
+        return years.filter(start_date__lte=today, end_date__gte=today).first() or years.first()
 
 
-class Invoice(models.Model):
-    """Invoice Management"""
+class FiscalYearQuerySet(models.QuerySet):
+    """Dated fiscal documents, scoped by fiscal year on the model's ``fiscal_date_field``"""
+    
+    def for_fiscal_year(self, fiscal_year):
+        date_field = self.model.fiscal_date_field
+        return self.filter(**{
+            f'{date_field}__gte': fiscal_year.start_date,
+            f'{date_field}__lte': fiscal_year.end_date,
+        })
+
+
+class InvoiceRecord(models.Model):
+    """Invoice columns shared by live and archived invoices"""
     INVOICE_TYPE_CHOICES = [
         ('sales', 'Sales Invoice'),
         ('purchase', 'Purchase Invoice'),
@@ -89,6 +109,8 @@ class Invoice(models.Model):
         ('cancelled', 'Cancelled'),
     ]
     
+    fiscal_date_field = 'invoice_date'
+    
     invoice_number = models.CharField(max_length=50, unique=True)
     invoice_type = models.CharField(max_length=20, choices=INVOICE_TYPE_CHOICES)
     invoice_date = models.DateField()
@@ -113,6 +135,21 @@ class Invoice(models.Model):
     notes = models.TextField(blank=True)
     terms_conditions = models.TextField(blank=True)
     
+    objects = FiscalYearQuerySet.as_manager()
+    
+    class Meta:
+        abstract = True
+    
+    def __str__(self):
+        return f"{self.invoice_number} - {self.customer_name}"
+    
+    def calculate_balance(self):
+        """Calculate remaining balance"""
+        return self.total_amount - self.paid_amount
+
+
+class Invoice(InvoiceRecord):
+    """Invoice Management"""
     # Fiscal Information
     fiscal_year = models.ForeignKey(FiscalYear, on_delete=models.SET_NULL, null=True, blank=True)
     
@@ -125,53 +162,70 @@ class Invoice(models.Model):
         ordering = ['-invoice_date', '-invoice_number']
         verbose_name = 'Invoice'
         verbose_name_plural = 'Invoices'
-    
-    def __str__(self):
-        return f"{self.invoice_number} - {self.customer_name}"
+        indexes = [
+            # Fiscal year scoped lists and status filters
+            models.Index(fields=['invoice_date', 'status']),
+        ]
     
     def get_absolute_url(self):
         return reverse('fiscal:invoice_detail', kwargs={'pk': self.pk})
     
-    def calculate_balance(self):
-        """Calculate remaining balance"""
-        return self.total_amount - self.paid_amount
-    
     def save(self, *args, **kwargs):
         self.balance = self.calculate_balance()
         super().save(*args, **kwargs)
 
 
-class InvoiceItem(models.Model):
-    """Invoice Line Items"""
-    invoice = models.ForeignKey(Invoice, on_delete=models.CASCADE, related_name='items')
+class InvoiceItemRecord(models.Model):
+    """Invoice line columns shared by live and archived lines"""
     description = models.CharField(max_length=500)
     quantity = models.DecimalField(max_digits=10, decimal_places=2)
     unit_price = models.DecimalField(max_digits=12, decimal_places=2)
-    tax_rate = models.ForeignKey(TaxRate, on_delete=models.SET_NULL, null=True, blank=True)
     discount_percent = models.DecimalField(max_digits=5, decimal_places=2, default=0)
+    tax_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0, help_text="Tax included in the line total")
     line_total = models.DecimalField(max_digits=12, decimal_places=2)
     
+    class Meta:
+        abstract = True
+    
     def __str__(self):
         return f"{self.invoice.invoice_number} - {self.description}"
+
+
+class InvoiceItem(InvoiceItemRecord):
+    """Invoice Line Items"""
+    invoice = models.ForeignKey(Invoice, on_delete=models.CASCADE, related_name='items')
+    tax_rate = models.ForeignKey(TaxRate, on_delete=models.SET_NULL, null=True, blank=True)
     
-    def calculate_line_total(self):
-        """Calculate line total with tax and discount"""
+    def calculate_tax(self, rate=None):
+        """
+        Calculate the line's net amount after discount and its tax. ``rate``
+        is the tax percentage, read from ``tax_rate`` when not given.
+        """
         subtotal = self.quantity * self.unit_price
-        discount = subtotal * (self.discount_percent / 100)
+        # Unsaved lines built without a discount carry the int default
+        discount = subtotal * (Decimal(self.discount_percent) / 100)
         subtotal_after_discount = subtotal - discount
         
-        if self.tax_rate:
-            tax = subtotal_after_discount * (self.tax_rate.rate / 100)
-            return subtotal_after_discount + tax
-        return subtotal_after_discount
+        if rate is None and self.tax_rate_id:
+            rate = self.tax_rate.rate
+        if rate:
+            return subtotal_after_discount, subtotal_after_discount * (rate / 100)
+        return subtotal_after_discount, Decimal('0.00')
+    
+    def calculate_line_total(self):
+        """Calculate line total with tax and discount"""
+        net, tax = self.calculate_tax()
+        return net + tax
     
     def save(self, *args, **kwargs):
-        self.line_total = self.calculate_line_total()
+        net, tax = self.calculate_tax()
+        self.tax_amount = tax.quantize(Decimal('0.01'))
+        self.line_total = net + tax
         super().save(*args, **kwargs)
 
 
-class Payment(models.Model):
-    """Payment Records"""
+class PaymentRecord(models.Model):
+    """Payment columns shared by live and archived payments"""
     PAYMENT_METHOD_CHOICES = [
         ('cash', 'Cash'),
         ('check', 'Check'),
@@ -189,8 +243,9 @@ class Payment(models.Model):
         ('cancelled', 'Cancelled'),
     ]
     
+    fiscal_date_field = 'payment_date'
+    
     payment_number = models.CharField(max_length=50, unique=True)
-    invoice = models.ForeignKey(Invoice, on_delete=models.CASCADE, related_name='payments')
     payment_date = models.DateField()
     amount = models.DecimalField(max_digits=12, decimal_places=2)
     payment_method = models.CharField(max_length=20, choices=PAYMENT_METHOD_CHOICES)
@@ -198,6 +253,19 @@ class Payment(models.Model):
     reference_number = models.CharField(max_length=100, blank=True)
     notes = models.TextField(blank=True)
     
+    objects = FiscalYearQuerySet.as_manager()
+    
+    class Meta:
+        abstract = True
+    
+    def __str__(self):
+        return f"{self.payment_number} - ${self.amount}"
+
+
+class Payment(PaymentRecord):
+    """Payment Records"""
+    invoice = models.ForeignKey(Invoice, on_delete=models.CASCADE, related_name='payments')
+    
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='payments_created')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -206,9 +274,10 @@ class Payment(models.Model):
         ordering = ['-payment_date']
         verbose_name = 'Payment'
         verbose_name_plural = 'Payments'
-    
-    def __str__(self):
-        return f"{self.payment_number} - ${self.amount}"
+        indexes = [
+            # Fiscal year scoped lists and status filters
+            models.Index(fields=['payment_date', 'status']),
+        ]
     
     def get_absolute_url(self):
         return reverse('fiscal:payment_detail', kwargs={'pk': self.pk})
@@ -269,3 +338,63 @@ class TaxReport(models.Model):
     def save(self, *args, **kwargs):
         self.net_tax = self.calculate_net_tax()
         super().save(*args, **kwargs)
+
+
+class TaxReportLine(models.Model):
+    """Per tax rate breakdown of a generated tax report"""
+    report = models.ForeignKey(TaxReport, on_delete=models.CASCADE, related_name='lines')
+    tax_rate = models.ForeignKey(TaxRate, on_delete=models.SET_NULL, null=True, blank=True)
+    rate = models.DecimalField(max_digits=5, decimal_places=2, default=0, help_text="Rate at generation time")
+    
+    taxable_sales = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    tax_collected = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    taxable_purchases = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    tax_paid = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    
+    class Meta:
+        ordering = ['report', '-rate']
+        verbose_name = 'Tax Report Line'
+        verbose_name_plural = 'Tax Report Lines'
+    
+    def __str__(self):
+        return f"{self.report.report_number} - {self.tax_rate or 'No tax'}"
+    
+    @property
+    def net_tax(self):
+        return self.tax_collected - self.tax_paid
+
+
+class ArchivedInvoice(InvoiceRecord):
+    """Invoice of an archived fiscal year, moved out of the live invoice table"""
+    fiscal_year = models.ForeignKey(FiscalYear, on_delete=models.PROTECT, related_name='archived_invoices')
+    
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='+')
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-invoice_date', '-invoice_number']
+        verbose_name = 'Archived Invoice'
+        verbose_name_plural = 'Archived Invoices'
+
+
+class ArchivedInvoiceItem(InvoiceItemRecord):
+    """Line of an archived invoice"""
+    invoice = models.ForeignKey(ArchivedInvoice, on_delete=models.CASCADE, related_name='items')
+    tax_rate = models.ForeignKey(TaxRate, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+
+
+class ArchivedPayment(PaymentRecord):
+    """Payment of an archived invoice"""
+    invoice = models.ForeignKey(ArchivedInvoice, on_delete=models.CASCADE, related_name='payments')
+    
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='+')
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-payment_date']
+        verbose_name = 'Archived Payment'
+        verbose_name_plural = 'Archived Payments'
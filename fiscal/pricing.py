@@ -0,0 +1,123 @@
+"""
+Batch invoice line pricing - prices many invoice lines against one in-memory
+tax rate lookup and refreshes the totals of their invoices.
+
+``InvoiceItem.save`` prices one line and reads its TaxRate; pricing a batch
+loads every rate the lines use in one query, computes discount, tax and
+line total in Decimal for each line, writes the lines with ``bulk_create``
+and ``bulk_update`` and then recomputes each affected invoice once with a
+set-based UPDATE.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .models import Invoice, InvoiceItem, TaxRate
+
+ZERO = Decimal('0.00')
+CENT = Decimal('0.01')
+AMOUNT = DecimalField(max_digits=12, decimal_places=2)
+
+PRICED_FIELDS = ['tax_amount', 'line_total']
+LINE_FIELDS = ['description', 'quantity', 'unit_price', 'tax_rate', 'discount_percent'] + PRICED_FIELDS
+
+
+class TaxRateCache:
+    """Tax rate percentages by TaxRate id, loaded on first use"""
+
+    def __init__(self, using='default'):
+        self.using = using
+        self.rates = {}
+
+    def load(self, rate_ids):
+        missing = {pk for pk in rate_ids if pk is not None and pk not in self.rates}
+        if missing:
+            self.rates.update(
+                TaxRate.objects.using(self.using).filter(pk__in=missing).values_list('pk', 'rate')
+            )
+
+    def get(self, rate_id):
+        if rate_id is None:
+            return None
+        self.load([rate_id])
+        return self.rates.get(rate_id)
+
+
+def price_lines(items, rates=None):
+    """Set ``tax_amount`` and ``line_total`` on every line, reading only the tax rates"""
+    items = list(items)
+    rates = rates or TaxRateCache()
+    rates.load({item.tax_rate_id for item in items})
+    for item in items:
+        net, tax = item.calculate_tax(rate=rates.get(item.tax_rate_id) or ZERO)
+        item.tax_amount = tax.quantize(CENT)
+        item.line_total = (net + tax).quantize(CENT)
+    return items
+
+
+def refresh_invoice_totals(invoice_ids, using='default'):
+    """Recompute subtotal, tax, total and balance of invoices from their lines in one UPDATE"""
+    invoice_ids = list(set(invoice_ids))
+    if not invoice_ids:
+        return 0
+
+    def line_sum(expression):
+        total = (
+            InvoiceItem.objects.filter(invoice=OuterRef('pk'))
+            .order_by()
+            .values('invoice')
+            .annotate(total=Sum(expression))
+            .values('total')
+        )
+        return Coalesce(Subquery(total, output_field=AMOUNT), Value(ZERO), output_field=AMOUNT)
+
+    tax_amount = line_sum('tax_amount')
+    subtotal = line_sum(F('line_total') - F('tax_amount'))
+    total_amount = subtotal + tax_amount - F('discount_amount')
+    return Invoice.objects.using(using).filter(pk__in=invoice_ids).update(
+        subtotal=subtotal,
+        tax_amount=tax_amount,
+        total_amount=total_amount,
+        balance=total_amount - F('paid_amount'),
+    )
+
+
+def save_lines(items, rates=None, fields=LINE_FIELDS, batch_size=1000, using='default'):
+    """
+    Price ``items`` and write them, inserting new lines and updating
+    ``fields`` of existing ones in bulk, then refresh the totals of their
+    invoices. Returns the priced lines.
+    """
+    items = price_lines(items, rates or TaxRateCache(using))
+    new = [item for item in items if item.pk is None]
+    existing = [item for item in items if item.pk is not None]
+    with transaction.atomic(using=using):
+        InvoiceItem.objects.using(using).bulk_create(new, batch_size=batch_size)
+        InvoiceItem.objects.using(using).bulk_update(existing, fields, batch_size=batch_size)
+        refresh_invoice_totals({item.invoice_id for item in items}, using=using)
+    return items
+
+
+def reprice_invoices(invoices=None, chunk_size=2000, using='default'):
+    """
+    Price the lines of ``invoices`` (every invoice by default) again with
+    the current tax rates, ``chunk_size`` invoices per transaction.
+    Returns the number of lines priced.
+    """
+    if invoices is None:
+        invoices = Invoice.objects.using(using)
+    rates = TaxRateCache(using)
+    ids = invoices.order_by('pk').values_list('pk', flat=True)
+    priced = 0
+    last_pk = 0
+    while True:
+        chunk = list(ids.filter(pk__gt=last_pk)[:chunk_size])
+        if not chunk:
+            break
+        last_pk = chunk[-1]
+        # Invoices without lines keep their totals
+        items = InvoiceItem.objects.using(using).filter(invoice_id__in=chunk).order_by()
+        priced += len(save_lines(items, rates, fields=PRICED_FIELDS, using=using))
+    return priced
@@ -0,0 +1,162 @@
+"""
+Tax report generation - tax collected on sales and paid on purchases for a
+period, per tax rate.
+
+All figures come from one grouped query over the invoice lines of the
+period (plus one over the lines of archived fiscal years), using the tax
+amount stored on each line when it was priced rather than pricing the lines
+again. Lines priced before tax amounts were stored (a tax rate but no tax
+amount) count the tax included in their line total at their rate, until
+``backfill_line_tax`` stores it. Sales invoices and debit notes count as sales,
+credit notes reduce sales and purchase invoices count as purchases; drafts,
+cancelled and proforma invoices are left out.
+"""
+from collections import namedtuple
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import DecimalField, ExpressionWrapper, F, Q, Sum
+
+from .models import ArchivedInvoiceItem, InvoiceItem, TaxRate, TaxReportLine
+
+ZERO = Decimal('0.00')
+CENT = Decimal('0.01')
+
+EXCLUDED_STATUSES = ['draft', 'cancelled']
+SALES_TYPES = ['sales', 'debit_note']
+CREDIT_TYPES = ['credit_note']
+PURCHASE_TYPES = ['purchase']
+
+AMOUNT_KEYS = ['sales', 'sales_tax', 'credits', 'credits_tax', 'purchases', 'purchases_tax']
+# type group -> invoice types, for the line totals without a stored tax amount
+UNPRICED_KEYS = {'sales': SALES_TYPES, 'credits': CREDIT_TYPES, 'purchases': PURCHASE_TYPES}
+
+RateSummary = namedtuple('RateSummary', [
+    'tax_rate_id', 'name', 'rate', 'taxable_sales', 'tax_collected', 'taxable_purchases', 'tax_paid',
+])
+
+
+def _sum(value, invoice_types, *conditions):
+    return Sum(value, filter=Q(invoice__invoice_type__in=invoice_types, *conditions))
+
+
+def unpriced():
+    """Lines with a tax rate but no stored tax amount, priced before it was stored"""
+    return Q(tax_amount=0, tax_rate__rate__gt=0)
+
+
+def included_tax(line_total, rate):
+    """Tax included in a line total at ``rate`` percent"""
+    return line_total * rate / (rate + 100)
+
+
+def rate_totals(model, period_start, period_end, using='default'):
+    """Line totals per tax rate and invoice type group for one invoice line table"""
+    net = ExpressionWrapper(F('line_total') - F('tax_amount'),
+                            output_field=DecimalField(max_digits=12, decimal_places=2))
+    return (
+        model.objects.using(using)
+        .filter(invoice__invoice_date__gte=period_start, invoice__invoice_date__lte=period_end,
+                invoice__invoice_type__in=SALES_TYPES + CREDIT_TYPES + PURCHASE_TYPES)
+        .exclude(invoice__status__in=EXCLUDED_STATUSES)
+        .values('tax_rate_id', 'tax_rate__name', 'tax_rate__rate')
+        .annotate(
+            sales=_sum(net, SALES_TYPES),
+            sales_tax=_sum('tax_amount', SALES_TYPES),
+            credits=_sum(net, CREDIT_TYPES),
+            credits_tax=_sum('tax_amount', CREDIT_TYPES),
+            purchases=_sum(net, PURCHASE_TYPES),
+            purchases_tax=_sum('tax_amount', PURCHASE_TYPES),
+            **{f'{key}_unpriced': _sum('line_total', invoice_types, unpriced())
+               for key, invoice_types in UNPRICED_KEYS.items()},
+        )
+        .order_by()
+    )
+
+
+def summarize_taxes(period_start, period_end, using='default'):
+    """RateSummary rows for invoices dated ``period_start..period_end``, highest rate first"""
+    rates = {}
+    for model in (InvoiceItem, ArchivedInvoiceItem):
+        for row in rate_totals(model, period_start, period_end, using=using):
+            totals = rates.setdefault(row['tax_rate_id'], {
+                'name': row['tax_rate__name'] or 'No tax',
+                'rate': row['tax_rate__rate'],
+                **{key: ZERO for key in AMOUNT_KEYS},
+            })
+            for key in AMOUNT_KEYS:
+                # SQLite sums decimals as floats, round back to cents
+                totals[key] += Decimal(row[key] or 0).quantize(CENT)
+            for key in UNPRICED_KEYS:
+                # Move the tax included in unpriced line totals from net to tax
+                gross = Decimal(row[f'{key}_unpriced'] or 0)
+                if gross:
+                    tax = included_tax(gross, row['tax_rate__rate']).quantize(CENT)
+                    totals[key] -= tax
+                    totals[f'{key}_tax'] += tax
+
+    # Highest rate first, lines without a tax rate last
+    ordered = sorted(rates.items(), key=lambda item: (
+        item[1]['rate'] is None, -(item[1]['rate'] or 0), item[0] or 0,
+    ))
+    return [
+        RateSummary(
+            tax_rate_id, totals['name'], totals['rate'] or ZERO,
+            totals['sales'] - totals['credits'],
+            totals['sales_tax'] - totals['credits_tax'],
+            totals['purchases'],
+            totals['purchases_tax'],
+        )
+        for tax_rate_id, totals in ordered
+    ]
+
+
+def generate_tax_report(report, using='default'):
+    """
+    Fill ``report``'s totals and per-rate lines from the invoices of its
+    period, replacing any earlier figures. Returns the RateSummary rows.
+    Raises ValueError for reports that are no longer drafts, their figures
+    are the ones filed.
+    """
+    if report.status != 'draft':
+        raise ValueError(f"Tax report {report.report_number} is {report.get_status_display().lower()}, "
+                         f"only draft reports can be regenerated.")
+    summary = summarize_taxes(report.period_start, report.period_end, using=using)
+    report.total_sales = sum((row.taxable_sales for row in summary), ZERO)
+    report.total_purchases = sum((row.taxable_purchases for row in summary), ZERO)
+    report.tax_collected = sum((row.tax_collected for row in summary), ZERO)
+    report.tax_paid = sum((row.tax_paid for row in summary), ZERO)
+    with transaction.atomic(using=using):
+        report.save(using=using)
+        report.lines.all().delete()
+        TaxReportLine.objects.using(using).bulk_create([
+            TaxReportLine(
+                report=report, tax_rate_id=row.tax_rate_id, rate=row.rate,
+                taxable_sales=row.taxable_sales, tax_collected=row.tax_collected,
+                taxable_purchases=row.taxable_purchases, tax_paid=row.tax_paid,
+            )
+            for row in summary
+        ])
+    return summary
+
+
+def backfill_line_tax(chunk_size=2000, using='default'):
+    """
+    Store the tax of live and archived lines priced before tax amounts were
+    stored, from their line total and tax rate. Returns the lines updated.
+    """
+    rates = dict(TaxRate.objects.using(using).values_list('pk', 'rate'))
+    updated = 0
+    for model in (InvoiceItem, ArchivedInvoiceItem):
+        lines = model.objects.using(using).filter(unpriced()).order_by('pk').only('line_total', 'tax_rate_id')
+        last_pk = 0
+        while True:
+            chunk = list(lines.filter(pk__gt=last_pk)[:chunk_size])
+            if not chunk:
+                break
+            last_pk = chunk[-1].pk
+            for line in chunk:
+                line.tax_amount = included_tax(line.line_total, rates[line.tax_rate_id]).quantize(CENT)
+            model.objects.using(using).bulk_update(chunk, ['tax_amount'])
+            updated += len(chunk)
+    return updated
@@ -36,5 +36,6 @@ urlpatterns = [
     path('tax-reports/create/', views.TaxReportCreateView.as_view(), name='taxreport_create'),
     path('tax-reports/<int:pk>/', views.TaxReportDetailView.as_view(), name='taxreport_detail'),
     path('tax-reports/<int:pk>/update/', views.TaxReportUpdateView.as_view(), name='taxreport_update'),
+    path('tax-reports/<int:pk>/generate/', views.taxreport_generate, name='taxreport_generate'),
     path('tax-reports/<int:pk>/delete/', views.TaxReportDeleteView.as_view(), name='taxreport_delete'),
 ]
@@ -1,10 +1,12 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView
+from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib import messages
 from django.urls import reverse_lazy
-from django.db.models import Q, Sum
+from django.db.models import Count, Q, Sum
 from .models import TaxRate, FiscalYear, Invoice, InvoiceItem, Payment, TaxReport
+from .taxes import generate_tax_report
 from datetime import datetime, date
 
 
@@ -125,15 +127,43 @@ class FiscalYearDeleteView(LoginRequiredMixin, DeleteView):
         return super().delete(request, *args, **kwargs)
 
 
+class FiscalYearScopeMixin:
+    """
+    Scope a list to the fiscal year picked with ``?fiscal_year=<id>``, the
+    current fiscal year by default and everything with ``?fiscal_year=all``
+    """
+    
+    def get_fiscal_year(self):
+        if not hasattr(self, '_fiscal_year'):
+            value = self.request.GET.get('fiscal_year', '')
+            if value == 'all':
+                self._fiscal_year = None
+            elif value.isdigit():
+                self._fiscal_year = FiscalYear.objects.filter(pk=value).first()
+            else:
+                self._fiscal_year = FiscalYear.get_current()
+        return self._fiscal_year
+    
+    def scope_queryset(self, queryset):
+        fiscal_year = self.get_fiscal_year()
+        return queryset.for_fiscal_year(fiscal_year) if fiscal_year else queryset
+    
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['fiscal_year'] = self.get_fiscal_year()
+        context['fiscal_years'] = FiscalYear.objects.filter(archived_at__isnull=True)
+        return context
+
+
 # Invoice Views
-class InvoiceListView(LoginRequiredMixin, ListView):
+class InvoiceListView(LoginRequiredMixin, FiscalYearScopeMixin, ListView):
     model = Invoice
     template_name = 'fiscal/invoice_list.html'
     context_object_name = 'invoices'
     paginate_by = 20
     
     def get_queryset(self):
-        queryset = Invoice.objects.all()
+        queryset = self.scope_queryset(Invoice.objects.all())
         search = self.request.GET.get('search')
         invoice_type = self.request.GET.get('invoice_type')
         status = self.request.GET.get('status')
@@ -152,12 +182,14 @@ class InvoiceListView(LoginRequiredMixin, ListView):
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['stats'] = {
-            'total_invoices': Invoice.objects.count(),
-            'total_amount': Invoice.objects.aggregate(Sum('total_amount'))['total_amount__sum'] or 0,
-            'paid_invoices': Invoice.objects.filter(status='paid').count(),
-            'overdue_invoices': Invoice.objects.filter(status='overdue').count(),
-        }
+        stats = self.scope_queryset(Invoice.objects.all()).aggregate(
+            total_invoices=Count('pk'),
+            total_amount=Sum('total_amount'),
+            paid_invoices=Count('pk', filter=Q(status='paid')),
+            overdue_invoices=Count('pk', filter=Q(status='overdue')),
+        )
+        stats['total_amount'] = stats['total_amount'] or 0
+        context['stats'] = stats
         return context
 
 
@@ -205,18 +237,23 @@ class InvoiceDeleteView(LoginRequiredMixin, DeleteView):
 
 
 # Payment Views
-class PaymentListView(LoginRequiredMixin, ListView):
+class PaymentListView(LoginRequiredMixin, FiscalYearScopeMixin, ListView):
     model = Payment
     template_name = 'fiscal/payment_list.html'
     context_object_name = 'payments'
     paginate_by = 20
     
+    def get_queryset(self):
+        return self.scope_queryset(Payment.objects.select_related('invoice'))
+    
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['stats'] = {
-            'total_payments': Payment.objects.filter(status='completed').count(),
-            'total_amount': Payment.objects.filter(status='completed').aggregate(Sum('amount'))['amount__sum'] or 0,
-        }
+        stats = self.scope_queryset(Payment.objects.filter(status='completed')).aggregate(
+            total_payments=Count('pk'),
+            total_amount=Sum('amount'),
+        )
+        stats['total_amount'] = stats['total_amount'] or 0
+        context['stats'] = stats
         return context
 
 
@@ -266,29 +303,53 @@ class TaxReportDetailView(LoginRequiredMixin, DetailView):
     model = TaxReport
     template_name = 'fiscal/taxreport_detail.html'
     context_object_name = 'tax_report'
+    
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['report_lines'] = self.object.lines.select_related('tax_rate')
+        return context
 
 
 class TaxReportCreateView(LoginRequiredMixin, CreateView):
     model = TaxReport
     template_name = 'fiscal/taxreport_form.html'
-    fields = ['report_number', 'report_type', 'fiscal_year', 'period_start', 'period_end',
-              'total_sales', 'total_purchases', 'tax_collected', 'tax_paid', 'status', 'notes']
+    fields = ['report_number', 'report_type', 'fiscal_year', 'period_start', 'period_end', 'status', 'notes']
     
     def form_valid(self, form):
         form.instance.created_by = self.request.user
+        response = super().form_valid(form)
+        if self.object.status == 'draft':
+            generate_tax_report(self.object)
         messages.success(self.request, 'Tax report created successfully!')
-        return super().form_valid(form)
+        return response
 
 
 class TaxReportUpdateView(LoginRequiredMixin, UpdateView):
     model = TaxReport
     template_name = 'fiscal/taxreport_form.html'
-    fields = ['report_number', 'report_type', 'fiscal_year', 'period_start', 'period_end',
-              'total_sales', 'total_purchases', 'tax_collected', 'tax_paid', 'status', 'notes']
+    fields = ['report_number', 'report_type', 'fiscal_year', 'period_start', 'period_end', 'status', 'notes']
     
     def form_valid(self, form):
+        response = super().form_valid(form)
+        # Submitted and approved reports keep their filed figures
+        if self.object.status == 'draft':
+            generate_tax_report(self.object)
         messages.success(self.request, 'Tax report updated successfully!')
-        return super().form_valid(form)
+        return response
+
+
+@login_required
+def taxreport_generate(request, pk):
+    """Recompute a tax report from the invoices of its period"""
+    tax_report = get_object_or_404(TaxReport, pk=pk)
+    if request.method == 'POST':
+        try:
+            generate_tax_report(tax_report)
+        except ValueError as e:
+            messages.error(request, str(e))
+        else:
+            messages.success(request, 'Tax report regenerated successfully!')
+    return redirect(tax_report.get_absolute_url())
 
 
 class TaxReportDeleteView(LoginRequiredMixin, DeleteView):
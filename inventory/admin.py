@@ -1,12 +1,16 @@
 from django.contrib import admin
-from .models import Product, Category, Unit, Location, StockMovement, ProductLocation
+from .models import (
+    Product, Category, Unit, Location, StockMovement, ProductLocation, StockSnapshot,
+    InventoryValuation
+)
 
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
-    list_display = ['name', 'parent', 'created_at']
+    list_display = ['name', 'full_name', 'depth', 'created_at']
     search_fields = ['name', 'description']
     list_filter = ['created_at']
+    readonly_fields = ['path', 'depth', 'full_name']
 
 
 @admin.register(Unit)
@@ -45,6 +49,18 @@ class ProductAdmin(admin.ModelAdmin):
         }),
     )
 
+    def get_readonly_fields(self, request, obj=None):
+        # Stock of existing products changes through stock movements
+        if obj is not None:
+            return [*self.readonly_fields, 'current_stock']
+        return super().get_readonly_fields(request, obj)
+
+    def save_model(self, request, obj, form, change):
+        if change:
+            obj.save_details()
+        else:
+            super().save_model(request, obj, form, change)
+
 
 @admin.register(Location)
 class LocationAdmin(admin.ModelAdmin):
@@ -63,6 +79,12 @@ class StockMovementAdmin(admin.ModelAdmin):
     raw_id_fields = ['product', 'created_by']
     readonly_fields = ['stock_before', 'stock_after', 'created_at']
 
+    def get_readonly_fields(self, request, obj=None):
+        # Posted movements are corrected with a reversing movement
+        if obj is not None:
+            return [*StockMovement.POSTING_FIELDS, 'created_at']
+        return super().get_readonly_fields(request, obj)
+
 
 @admin.register(ProductLocation)
 class ProductLocationAdmin(admin.ModelAdmin):
@@ -70,3 +92,20 @@ class ProductLocationAdmin(admin.ModelAdmin):
     list_filter = ['location', 'last_updated']
     search_fields = ['product__code', 'product__name', 'location__name']
     raw_id_fields = ['product', 'location']
+
+
+@admin.register(StockSnapshot)
+class StockSnapshotAdmin(admin.ModelAdmin):
+    list_display = ['snapshot_date', 'product', 'location', 'quantity', 'created_at']
+    list_filter = ['snapshot_date', 'location']
+    search_fields = ['product__code', 'product__name']
+    date_hierarchy = 'snapshot_date'
+    raw_id_fields = ['product', 'location']
+
+
+@admin.register(InventoryValuation)
+class InventoryValuationAdmin(admin.ModelAdmin):
+    list_display = ['product', 'quantity', 'average_cost', 'total_value', 'updated_at']
+    search_fields = ['product__code', 'product__name']
+    raw_id_fields = ['product']
+    readonly_fields = ['quantity', 'average_cost', 'total_value', 'updated_at']
@@ -0,0 +1,148 @@
+"""
+In-process barcode lookup cache for the scan endpoint.
+
+Maps barcode, SKU and product code to a small dict of product id, name and
+stock. Hits are a dictionary lookup with no ORM model instantiation; misses
+and expired entries read that one product with ``values()``. The cache is
+bounded (least recently used entries are evicted), warmed with the catalogue
+up to its size in a background thread when the process serves its first
+request, and invalidated from product saves and stock postings in this
+process. Entries expire after ``BARCODE_CACHE_TTL`` seconds so other worker
+processes pick up changes.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+from django.db.models import Q
+
+from .models import Product
+
+SCAN_FIELDS = ('pk', 'code', 'name', 'barcode', 'sku', 'current_stock', 'selling_price', 'is_active')
+
+# Warmed products stored per lock acquisition
+WARM_CHUNK = 1000
+
+logger = logging.getLogger(__name__)
+
+
+class BarcodeCache:
+    def __init__(self, maxsize=100000, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires, product)
+        self._keys = {}  # product id -> set of keys
+        self._lock = threading.Lock()
+        self._warm_lock = threading.Lock()
+        self._warm_started = False
+        self._invalidated = None  # product ids invalidated during a warm-up
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def _product_keys(product):
+        return {key for key in (product['barcode'], product['sku'], product['code']) if key}
+
+    def _store(self, product, expires):
+        # Caller holds the lock
+        keys = self._product_keys(product)
+        for key in keys:
+            self._entries[key] = (expires, product)
+            self._entries.move_to_end(key)
+        self._keys.setdefault(product['pk'], set()).update(keys)
+        while len(self._entries) > self.maxsize:
+            key, (_, evicted) = self._entries.popitem(last=False)
+            product_keys = self._keys.get(evicted['pk'])
+            if product_keys is not None:
+                product_keys.discard(key)
+                if not product_keys:
+                    del self._keys[evicted['pk']]
+
+    def warm(self):
+        """
+        Load up to ``maxsize`` active products, the most recently updated ones.
+        Returns at once when another thread is already warming.
+        """
+        if not self._warm_lock.acquire(blocking=False):
+            return
+        try:
+            with self._lock:
+                self._invalidated = set()
+            expires = time.monotonic() + self.ttl
+            products = list(
+                Product.objects.filter(is_active=True)
+                .order_by('-updated_at')
+                .values(*SCAN_FIELDS)[:self.maxsize]
+            )
+            # Least recently updated first, so they are the first evicted
+            products.reverse()
+            for start in range(0, len(products), WARM_CHUNK):
+                with self._lock:
+                    for product in products[start:start + WARM_CHUNK]:
+                        # Rows read before an invalidation are stale
+                        if product['pk'] not in self._invalidated:
+                            self._store(product, expires)
+        finally:
+            with self._lock:
+                self._invalidated = None
+            self._warm_lock.release()
+
+    def warm_in_background(self):
+        """Warm the cache in a daemon thread, once per process"""
+        with self._lock:
+            if self._warm_started:
+                return
+            self._warm_started = True
+        threading.Thread(target=self._warm_thread, name='barcode-cache-warm', daemon=True).start()
+
+    def _warm_thread(self):
+        try:
+            self.warm()
+        except DatabaseError as error:
+            # Scans still work, they read the products they miss
+            logger.warning('Barcode cache not warmed: %s', error)
+        finally:
+            connections.close_all()
+
+    def lookup(self, key):
+        """Return the product dict for a barcode, SKU or code, or None"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                return entry[1]
+
+        product = (
+            Product.objects.filter(Q(barcode=key) | Q(code=key) | Q(sku=key))
+            .order_by('pk')
+            .values(*SCAN_FIELDS)
+            .first()
+        )
+        if product is not None:
+            with self._lock:
+                self._store(product, now + self.ttl)
+        return product
+
+    def invalidate(self, product_ids):
+        with self._lock:
+            if self._invalidated is not None:
+                self._invalidated.update(product_ids)
+            for product_id in product_ids:
+                for key in self._keys.pop(product_id, ()):
+                    self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys.clear()
+
+
+barcode_cache = BarcodeCache(
+    maxsize=getattr(settings, 'BARCODE_CACHE_SIZE', 100000),
+    ttl=getattr(settings, 'BARCODE_CACHE_TTL', 60),
+)
@@ -0,0 +1,47 @@
+"""
+Inventory dashboard counters - computed in one conditional aggregation pass and
+cached until products, stock, categories or locations change.
+
+The invalidation only reaches the cache of the process that made the change
+when the default per-process cache is used, so entries also expire after
+``CACHE_TIMEOUT`` seconds, bounding how stale other workers' counters get.
+"""
+from django.core.cache import cache
+from django.db.models import Count, F, Q
+
+from .models import Category, Location, Product
+from .valuation import total_inventory_value
+
+CACHE_KEY = 'inventory:counters'
+CACHE_TIMEOUT = 30
+
+
+def compute_counters():
+    """Compute every counter with one aggregate per table"""
+    low_stock = Q(current_stock__lte=F('minimum_stock'))
+    out_of_stock = Q(current_stock=0)
+    counters = Product.objects.aggregate(
+        total_products=Count('pk'),
+        active_products=Count('pk', filter=Q(is_active=True)),
+        low_stock=Count('pk', filter=low_stock),
+        out_of_stock=Count('pk', filter=out_of_stock),
+        tracked_low_stock=Count('pk', filter=low_stock & Q(track_inventory=True)),
+        tracked_out_of_stock=Count('pk', filter=out_of_stock & Q(track_inventory=True)),
+    )
+    counters['total_categories'] = Category.objects.count()
+    counters['active_locations'] = Location.objects.filter(is_active=True).count()
+    counters['total_inventory_value'] = total_inventory_value()
+    return counters
+
+
+def get_counters():
+    """Return cached counters, computing them on a miss"""
+    counters = cache.get(CACHE_KEY)
+    if counters is None:
+        counters = compute_counters()
+        cache.set(CACHE_KEY, counters, CACHE_TIMEOUT)
+    return counters
+
+
+def invalidate_counters():
+    cache.delete(CACHE_KEY)
@@ -0,0 +1,121 @@
+"""
+Stock ledger - posts StockMovement quantities against Product.current_stock.
+
+Every posting locks the product row, reads the stock level from the database
+and writes back only ``current_stock`` and ``updated_at``. Concurrent goods-in
+and goods-out traffic is therefore serialized per product without losing
+updates or overwriting columns edited elsewhere.
+"""
+from decimal import Decimal
+
+from django.db import connections, transaction
+from django.db.models import F
+from django.dispatch import Signal
+from django.utils import timezone
+
+from .models import Product, StockMovement
+
+ZERO = Decimal('0.00')
+
+# Sent inside the posting transaction with ``movements`` (saved StockMovement
+# objects, stock_before/stock_after filled in) and ``using``
+stock_posted = Signal()
+
+
+def apply_movement(movement_type, stock, quantity):
+    """Return the stock level after applying a movement to ``stock``"""
+    if movement_type == 'in':
+        return stock + quantity
+    if movement_type == 'out':
+        # Stock never goes negative
+        return max(stock - quantity, ZERO)
+    if movement_type == 'adjustment':
+        # quantity field stores the new stock level for adjustments
+        return quantity
+    # Transfers move stock between locations, the product total is unchanged
+    return stock
+
+
+def lock_product_stock(product_ids, using='default'):
+    """
+    Lock the given product rows and return ``{product_id: current_stock}``.
+
+    Must be called inside ``transaction.atomic``. Rows are locked in primary
+    key order, so concurrent postings touching the same products can't
+    deadlock. Backends without row locks (SQLite) take the database write
+    lock up front with a no-op UPDATE, so the read below cannot interleave
+    with another writer.
+    """
+    queryset = Product.objects.using(using).filter(pk__in=product_ids)
+    if connections[using].features.has_select_for_update:
+        queryset = queryset.select_for_update()
+    else:
+        queryset.update(current_stock=F('current_stock'))
+    return dict(queryset.order_by('pk').values_list('pk', 'current_stock'))
+
+
+def set_product_stock(product_id, stock, using='default'):
+    """Write a new stock level without touching unrelated Product columns"""
+    Product.objects.using(using).filter(pk=product_id).update(
+        current_stock=stock,
+        updated_at=timezone.now(),
+    )
+
+
+def post_stock(product_id, movement_type, quantity, using='default'):
+    """
+    Post one movement against its product and return ``(stock_before, stock_after)``.
+
+    Must be called inside ``transaction.atomic``; the row lock is held until
+    the surrounding transaction commits.
+    """
+    try:
+        stock_before = lock_product_stock([product_id], using=using)[product_id]
+    except KeyError:
+        raise Product.DoesNotExist(f"Product {product_id} does not exist")
+    stock_after = apply_movement(movement_type, stock_before, quantity)
+    if stock_after != stock_before:
+        set_product_stock(product_id, stock_after, using=using)
+    return stock_before, stock_after
+
+
+def post_movements(movements, using='default', batch_size=1000):
+    """
+    Post many unsaved StockMovement objects in one transaction.
+
+    Movements are applied in the given order. Running ``stock_before`` and
+    ``stock_after`` values are computed in memory from the locked product
+    rows, the movements are written with ``bulk_create`` and every touched
+    product gets a single stock update. Returns the created movements.
+    """
+    movements = list(movements)
+    if not movements:
+        return movements
+
+    # Sorted, so every batch locks its products in the same order
+    product_ids = sorted({movement.product_id for movement in movements})
+    with transaction.atomic(using=using):
+        stock = {}
+        for start in range(0, len(product_ids), batch_size):
+            stock.update(lock_product_stock(product_ids[start:start + batch_size], using=using))
+        missing = set(product_ids) - set(stock)
+        if missing:
+            raise Product.DoesNotExist(f"Products do not exist: {sorted(missing)}")
+
+        for movement in movements:
+            movement.stock_before = stock[movement.product_id]
+            movement.stock_after = apply_movement(
+                movement.movement_type, movement.stock_before, movement.quantity
+            )
+            stock[movement.product_id] = movement.stock_after
+
+        created = StockMovement.objects.using(using).bulk_create(movements, batch_size=batch_size)
+
+        now = timezone.now()
+        Product.objects.using(using).bulk_update(
+            [Product(pk=pk, current_stock=value, updated_at=now) for pk, value in stock.items()],
+            ['current_stock', 'updated_at'],
+            batch_size=batch_size,
+        )
+        stock_posted.send(sender=StockMovement, movements=created, using=using)
+    return created
@@ -0,0 +1,97 @@
+import threading
+import time
+import uuid
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from inventory.models import Product, StockMovement
+
+
+class Command(BaseCommand):
+    help = (
+        'Post concurrent stock movements against a single product and verify '
+        'that no update was lost'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8, help='Concurrent posting threads')
+        parser.add_argument('--movements', type=int, default=250, help='Movements posted per worker')
+        parser.add_argument('--keep', action='store_true', help='Keep the benchmark product and its movements')
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        per_worker = options['movements']
+
+        opening_stock = Decimal(workers * per_worker)
+        product = Product.objects.create(
+            code=f"BENCH-{uuid.uuid4().hex[:10].upper()}",
+            name='Stock posting benchmark',
+            current_stock=opening_stock,
+            selling_price=Decimal('9.99'),
+        )
+        errors = []
+
+        def worker(index):
+            try:
+                for i in range(per_worker):
+                    # Alternate goods-in and goods-out on the same row
+                    movement_type = 'in' if (index + i) % 2 else 'out'
+                    StockMovement.objects.create(
+                        product_id=product.pk,
+                        movement_type=movement_type,
+                        quantity=Decimal('1.00'),
+                        reference='benchmark',
+                    )
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(workers)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        try:
+            if errors:
+                raise CommandError(f"{len(errors)} worker(s) failed: {errors[0]!r}")
+            self._verify(product, opening_stock)
+        finally:
+            if not options['keep']:
+                product.delete()
+
+        total = workers * per_worker
+        self.stdout.write(self.style.SUCCESS(
+            f"Posted {total} movements with {workers} workers in {elapsed:.2f}s "
+            f"({total / elapsed:.0f} movements/s), no lost updates"
+        ))
+
+    def _verify(self, product, opening_stock):
+        movements = StockMovement.objects.filter(product=product)
+        ins = movements.filter(movement_type='in').count()
+        outs = movements.filter(movement_type='out').count()
+        expected = opening_stock + ins - outs
+
+        product.refresh_from_db(fields=['current_stock', 'selling_price'])
+        if product.current_stock != expected:
+            raise CommandError(
+                f"Lost updates: stock is {product.current_stock}, expected {expected}"
+            )
+        if product.selling_price != Decimal('9.99'):
+            raise CommandError('Unrelated product columns were overwritten')
+
+        # Movements are inserted while the product row is locked, so in
+        # primary key order each one must start where the previous one ended
+        stock = opening_stock
+        chain = movements.order_by('pk').values_list('stock_before', 'stock_after')
+        for stock_before, stock_after in chain.iterator():
+            if stock_before != stock:
+                raise CommandError(
+                    f"Broken stock chain: movement starts at {stock_before}, expected {stock}"
+                )
+            stock = stock_after
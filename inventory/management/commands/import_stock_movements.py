@@ -0,0 +1,124 @@
+import csv
+import json
+import time
+from decimal import Decimal, InvalidOperation
+from pathlib import Path
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from inventory.ledger import post_movements
+from inventory.models import Location, Product, StockMovement
+
+
+class Command(BaseCommand):
+    help = (
+        'Import stock movements from a CSV or JSONL file and post them in a '
+        'single transaction. Columns: product (code), movement_type, quantity, '
+        'unit_cost, reference, notes, location_from, location_to (location codes)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or JSONL file')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Defaults to the file extension')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--user', help='Username recorded as created_by')
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        if not path.exists():
+            raise CommandError(f"File not found: {path}")
+        file_format = options['format'] or ('jsonl' if path.suffix in ('.jsonl', '.json') else 'csv')
+        batch_size = options['batch_size']
+
+        created_by = None
+        if options['user']:
+            try:
+                created_by = get_user_model().objects.get(username=options['user'])
+            except get_user_model().DoesNotExist:
+                raise CommandError(f"User not found: {options['user']}")
+
+        self.locations = dict(Location.objects.values_list('code', 'pk'))
+        self.movement_types = {choice for choice, _ in StockMovement.MOVEMENT_TYPE_CHOICES}
+
+        started = time.perf_counter()
+        total = 0
+        with path.open(newline='', encoding='utf-8') as handle:
+            rows = self._read_rows(handle, file_format)
+            with transaction.atomic():
+                batch = []
+                for line, row in rows:
+                    batch.append((line, row))
+                    if len(batch) >= batch_size:
+                        total += self._post_batch(batch, created_by)
+                        batch = []
+                if batch:
+                    total += self._post_batch(batch, created_by)
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {total} stock movements in {elapsed:.2f}s"
+        ))
+
+    def _read_rows(self, handle, file_format):
+        if file_format == 'csv':
+            # Line 1 is the header
+            for line, row in enumerate(csv.DictReader(handle), start=2):
+                yield line, row
+        else:
+            for line, raw in enumerate(handle, start=1):
+                if raw.strip():
+                    try:
+                        yield line, json.loads(raw)
+                    except ValueError as exc:
+                        raise CommandError(f"Line {line}: invalid JSON ({exc})")
+
+    def _post_batch(self, batch, created_by):
+        codes = {str(row.get('product', '')).strip() for _, row in batch}
+        products = dict(Product.objects.filter(code__in=codes).values_list('code', 'pk'))
+
+        movements = []
+        for line, row in batch:
+            code = str(row.get('product', '')).strip()
+            if code not in products:
+                raise CommandError(f"Line {line}: unknown product {code!r}")
+            movement_type = str(row.get('movement_type', '')).strip()
+            if movement_type not in self.movement_types:
+                raise CommandError(f"Line {line}: invalid movement type {movement_type!r}")
+            movements.append(StockMovement(
+                product_id=products[code],
+                movement_type=movement_type,
+                quantity=self._decimal(line, row, 'quantity', positive=True),
+                unit_cost=self._decimal(line, row, 'unit_cost', default='0.00'),
+                reference=row.get('reference') or None,
+                notes=row.get('notes') or None,
+                location_from_id=self._location(line, row, 'location_from'),
+                location_to_id=self._location(line, row, 'location_to'),
+                created_by=created_by,
+            ))
+        return len(post_movements(movements))
+
+    def _decimal(self, line, row, field, default=None, positive=False):
+        value = row.get(field)
+        if value in (None, ''):
+            if default is None:
+                raise CommandError(f"Line {line}: {field} is required")
+            value = default
+        try:
+            value = Decimal(str(value)).quantize(Decimal('0.01'))
+        except InvalidOperation:
+            raise CommandError(f"Line {line}: invalid {field} {value!r}")
+        if positive and value <= 0:
+            raise CommandError(f"Line {line}: {field} must be positive")
+        if value < 0:
+            raise CommandError(f"Line {line}: {field} cannot be negative")
+        return value
+
+    def _location(self, line, row, field):
+        code = row.get(field)
+        if not code:
+            return None
+        if code not in self.locations:
+            raise CommandError(f"Line {line}: unknown location {code!r}")
+        return self.locations[code]
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from inventory.models import Category
+
+
+class Command(BaseCommand):
+    help = 'Recompute the materialized path, depth and breadcrumb of every category'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            categories = list(Category.objects.all())
+            children = {}
+            for category in categories:
+                children.setdefault(category.parent_id, []).append(category)
+
+            # Walk the tree from the roots so parents are built first
+            pending = [(None, root) for root in children.get(None, [])]
+            built = []
+            while pending:
+                parent, category = pending.pop()
+                category.build_path(parent)
+                built.append(category)
+                pending.extend((category, child) for child in children.get(category.pk, []))
+
+            Category.objects.bulk_update(built, ['path', 'depth', 'full_name'], batch_size=1000)
+
+        orphans = len(categories) - len(built)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt paths for {len(built)} categories"))
+        if orphans:
+            self.stdout.write(self.style.WARNING(
+                f"{orphans} categories are part of a parent cycle and were skipped"
+            ))
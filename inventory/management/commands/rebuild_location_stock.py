@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from inventory.projections import rebuild_location_stock
+
+
+class Command(BaseCommand):
+    help = 'Rebuild ProductLocation quantities by replaying the stock movement history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=10000, help='Movements fetched per chunk')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        rows = rebuild_location_stock(chunk_size=options['chunk_size'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {rows} product location rows in {elapsed:.2f}s"
+        ))
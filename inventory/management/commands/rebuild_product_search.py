@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from inventory.search import get_backend, setup_search_index
+
+
+class Command(BaseCommand):
+    help = 'Create the product search index if needed and re-index every product'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default', help='Database alias')
+
+    def handle(self, *args, **options):
+        using = options['database']
+        started = time.perf_counter()
+        setup_search_index(using)
+        backend = get_backend(using)
+        products = backend.rebuild()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Indexed {products} products with {type(backend).__name__} in {elapsed:.2f}s"
+        ))
@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from inventory.valuation import rebuild_valuation
+
+
+class Command(BaseCommand):
+    help = 'Rebuild moving average inventory valuation from the stock movement history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=10000, help='Movements fetched per chunk')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        products = rebuild_valuation(chunk_size=options['chunk_size'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Valued {products} products in {elapsed:.2f}s"
+        ))
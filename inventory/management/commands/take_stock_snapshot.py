@@ -0,0 +1,40 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from inventory.snapshots import take_snapshot
+
+
+class Command(BaseCommand):
+    help = (
+        'Materialize product and location stock at the end of a day. '
+        'Defaults to yesterday; schedule daily or with --month-end'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Snapshot date (YYYY-MM-DD)')
+        parser.add_argument(
+            '--month-end', action='store_true',
+            help='Snapshot the last day of the previous month'
+        )
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        if options['date']:
+            try:
+                snapshot_date = date.fromisoformat(options['date'])
+            except ValueError:
+                raise CommandError(f"Invalid date: {options['date']}")
+        elif options['month_end']:
+            snapshot_date = today.replace(day=1) - timedelta(days=1)
+        else:
+            snapshot_date = today - timedelta(days=1)
+
+        if snapshot_date >= today:
+            raise CommandError('Only days that have already ended can be snapshotted')
+
+        rows = take_snapshot(snapshot_date)
+        self.stdout.write(self.style.SUCCESS(
+            f"Stored {rows} stock snapshot rows for {snapshot_date}"
+        ))
@@ -1,12 +1,16 @@
-from django.db import models
+from django.db import models, router, transaction
 from django.conf import settings
 from django.urls import reverse
+from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator
 from decimal import Decimal
 
 
 class Category(models.Model):
     """Product Category"""
+    PATH_SEPARATOR = '/'
+    BREADCRUMB_SEPARATOR = ' > '
+    
     name = models.CharField(max_length=100, unique=True)
     description = models.TextField(blank=True, null=True)
     parent = models.ForeignKey(
@@ -16,6 +20,19 @@ class Category(models.Model):
         blank=True,
         related_name='subcategories'
     )
+    
+    # Materialized tree, maintained on save
+    path = models.CharField(
+        max_length=255,
+        blank=True,
+        default='',
+        db_index=True,
+        editable=False,
+        help_text='Ancestor ids from the root, e.g. /1/4/9/'
+    )
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
+    full_name = models.CharField(max_length=500, blank=True, default='', editable=False)
+    
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -25,12 +42,79 @@ class Category(models.Model):
         ordering = ['name']
     
     def __str__(self):
-        if self.parent:
-            return f"{self.parent.name} > {self.name}"
-        return self.name
+        return self.full_name or self.name
     
     def get_absolute_url(self):
         return reverse('inventory:category_detail', kwargs={'pk': self.pk})
+    
+    def is_nested_under_itself(self, parent=None):
+        if not (self.pk and self.parent_id):
+            return False
+        parent = parent or self.parent
+        return parent.pk == self.pk or f"/{self.pk}/" in parent.path
+    
+    def clean(self):
+        if self.is_nested_under_itself():
+            raise ValidationError({'parent': 'A category cannot be nested under itself.'})
+    
+    def build_path(self, parent=None):
+        """Set path, depth and breadcrumb from the (already built) parent"""
+        if parent is not None:
+            self.path = f"{parent.path}{self.pk}/"
+            self.depth = parent.depth + 1
+            self.full_name = f"{parent.full_name or parent.name}{self.BREADCRUMB_SEPARATOR}{self.name}"
+        else:
+            self.path = f"/{self.pk}/"
+            self.depth = 0
+            self.full_name = self.name
+    
+    def save(self, *args, **kwargs):
+        # Read the parent fresh, a loaded instance may carry a stale path
+        parent = Category.objects.get(pk=self.parent_id) if self.parent_id else None
+        
+        if self.pk is None:
+            super().save(*args, **kwargs)
+            self.build_path(parent)
+            Category.objects.filter(pk=self.pk).update(
+                path=self.path, depth=self.depth, full_name=self.full_name
+            )
+            return
+        
+        if self.is_nested_under_itself(parent):
+            raise ValueError('A category cannot be nested under itself.')
+        old_path, old_full_name = Category.objects.filter(pk=self.pk).values_list(
+            'path', 'full_name'
+        ).first() or ('', '')
+        self.build_path(parent)
+        super().save(*args, **kwargs)
+        
+        if old_path and (old_path, old_full_name) != (self.path, self.full_name):
+            self.rebuild_descendants(old_path)
+    
+    def rebuild_descendants(self, old_path=None):
+        """Rewrite the materialized path of every category below this one"""
+        descendants = list(
+            Category.objects.filter(path__startswith=old_path or self.path)
+            .exclude(pk=self.pk)
+            .order_by('depth')
+        )
+        nodes = {self.pk: self}
+        for category in descendants:
+            category.build_path(nodes[category.parent_id])
+            nodes[category.pk] = category
+        Category.objects.bulk_update(descendants, ['path', 'depth', 'full_name'])
+    
+    def get_descendants(self, include_self=True):
+        """This category and its whole subtree, in one indexed query"""
+        queryset = Category.objects.filter(path__startswith=self.path)
+        if not include_self:
+            queryset = queryset.exclude(pk=self.pk)
+        return queryset
+    
+    def get_subtree_products(self):
+        """Products in this category or any of its descendants"""
+        return Product.objects.filter(category__path__startswith=self.path)
+
 
 class Warehouse(models.Model):
     name = models.CharField(max_length=100)
@@ -116,7 +200,7 @@ class Product(models.Model):
     
     # Additional Info
     barcode = models.CharField(max_length=100, blank=True, null=True, unique=True)
-    sku = models.CharField(max_length=100, blank=True, null=True)
+    sku = models.CharField(max_length=100, blank=True, null=True, db_index=True)
     manufacturer = models.CharField(max_length=200, blank=True, null=True)
     brand = models.CharField(max_length=100, blank=True, null=True)
     
@@ -144,6 +228,18 @@ class Product(models.Model):
     def get_absolute_url(self):
         return reverse('inventory:product_detail', kwargs={'pk': self.pk})
     
+    def save_details(self, using=None):
+        """
+        Save an edited product without writing current_stock, which only the
+        stock ledger changes, so concurrent postings are not overwritten
+        """
+        using = using or router.db_for_write(Product, instance=self)
+        self.refresh_from_db(using=using, fields=['current_stock'])
+        self.save(using=using, update_fields=[
+            field.name for field in self._meta.concrete_fields
+            if not field.primary_key and field.name != 'current_stock'
+        ])
+    
     def is_low_stock(self):
         """Check if product is below minimum stock"""
         if self.track_inventory and self.minimum_stock > 0:
@@ -206,6 +302,12 @@ class StockMovement(models.Model):
         ('transfer', 'Transfer'),
     ]
     
+    # Fields fixed once the movement is posted
+    POSTING_FIELDS = (
+        'movement_type', 'product', 'quantity', 'location_from', 'location_to', 'unit_cost',
+        'stock_before', 'stock_after',
+    )
+    
     movement_type = models.CharField(max_length=20, choices=MOVEMENT_TYPE_CHOICES)
     product = models.ForeignKey(
         Product,
@@ -261,6 +363,10 @@ class StockMovement(models.Model):
         verbose_name = 'Stock Movement'
         verbose_name_plural = 'Stock Movements'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_at']),
+            models.Index(fields=['product', 'created_at']),
+        ]
     
     def __str__(self):
         return f"{self.get_movement_type_display()} - {self.product.code} - {self.quantity}"
@@ -272,27 +378,38 @@ class StockMovement(models.Model):
         """Calculate total cost of movement"""
         return self.quantity * self.unit_cost
     
+    def posting_changed(self, using=None):
+        """Whether a posting field differs from the stored movement"""
+        stored = StockMovement.objects.using(using).filter(pk=self.pk).values_list(
+            *[self._meta.get_field(name).attname for name in self.POSTING_FIELDS]
+        ).first()
+        current = tuple(getattr(self, self._meta.get_field(name).attname) for name in self.POSTING_FIELDS)
+        return stored is not None and stored != current
+    
     def save(self, *args, **kwargs):
-        # Record stock before
-        self.stock_before = self.product.current_stock
+        using = kwargs.get('using') or router.db_for_write(StockMovement, instance=self)
+        if not self._state.adding:
+            # Stock was posted when the movement was created, corrections are
+            # new (reversing) movements
+            update_fields = kwargs.get('update_fields')
+            if (update_fields is None or set(update_fields) & set(self.POSTING_FIELDS)) \
+                    and self.posting_changed(using):
+                raise ValueError('Posted stock movements cannot be changed, post a reversing movement instead.')
+            return super().save(*args, **kwargs)
         
-        # Update product stock
-        if self.movement_type == 'in':
-            self.product.current_stock += self.quantity
-        elif self.movement_type == 'out':
-            self.product.current_stock -= self.quantity
-            if self.product.current_stock < 0:
-                self.product.current_stock = Decimal('0.00')
-        elif self.movement_type == 'adjustment':
-            # Adjustment can be positive or negative
-            # quantity field stores the new stock level for adjustments
-            self.product.current_stock = self.quantity
+        from .ledger import post_stock, stock_posted
         
-        # Record stock after
-        self.stock_after = self.product.current_stock
-        self.product.save()
+        with transaction.atomic(using=using):
+            # Record stock before/after as read from the locked product row
+            self.stock_before, self.stock_after = post_stock(
+                self.product_id, self.movement_type, self.quantity, using=using
+            )
+            super().save(*args, **kwargs)
+            stock_posted.send(sender=StockMovement, movements=[self], using=using)
         
-        super().save(*args, **kwargs)
+        # Keep an already loaded product in step with the database
+        if StockMovement.product.is_cached(self):
+            self.product.current_stock = self.stock_after
 
 
 class ProductLocation(models.Model):
@@ -323,3 +440,60 @@ class ProductLocation(models.Model):
     
     def __str__(self):
         return f"{self.product.code} at {self.location.code}: {self.quantity}"
+
+
+class StockSnapshot(models.Model):
+    """Materialized stock level at the end of a day"""
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name='stock_snapshots'
+    )
+    location = models.ForeignKey(
+        Location,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='stock_snapshots',
+        help_text='Empty for the product total'
+    )
+    snapshot_date = models.DateField()
+    quantity = models.DecimalField(max_digits=12, decimal_places=2)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = 'Stock Snapshot'
+        verbose_name_plural = 'Stock Snapshots'
+        unique_together = ['product', 'location', 'snapshot_date']
+        ordering = ['-snapshot_date', 'product']
+        indexes = [
+            models.Index(fields=['snapshot_date', 'product']),
+        ]
+    
+    def __str__(self):
+        where = self.location.code if self.location_id else 'all locations'
+        return f"{self.product.code} at {where} on {self.snapshot_date}: {self.quantity}"
+
+
+class InventoryValuation(models.Model):
+    """Moving weighted average valuation of a product's stock"""
+    product = models.OneToOneField(
+        Product,
+        on_delete=models.CASCADE,
+        related_name='valuation'
+    )
+    quantity = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    average_cost = models.DecimalField(max_digits=14, decimal_places=4, default=Decimal('0.0000'))
+    total_value = models.DecimalField(max_digits=15, decimal_places=2, default=Decimal('0.00'))
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = 'Inventory Valuation'
+        verbose_name_plural = 'Inventory Valuation'
+        ordering = ['-total_value']
+        indexes = [
+            models.Index(fields=['total_value']),
+        ]
+    
+    def __str__(self):
+        return f"{self.product.code}: {self.quantity} @ {self.average_cost} = {self.total_value}"
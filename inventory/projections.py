@@ -0,0 +1,136 @@
+"""
+Per-location stock projection - keeps ProductLocation.quantity in step with
+StockMovement postings.
+
+Each movement is reduced to signed quantity deltas per (product, location):
+goods-in add to ``location_to``, goods-out take from ``location_from``,
+transfers do both and adjustments apply the product level change to whichever
+location the movement names.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import ProductLocation, StockMovement
+
+ZERO = Decimal('0.00')
+
+# Movement columns needed to derive location deltas
+DELTA_FIELDS = (
+    'product_id', 'movement_type', 'quantity', 'stock_before', 'stock_after',
+    'location_from_id', 'location_to_id',
+)
+
+
+def movement_location_deltas(movement_type, quantity, stock_before, stock_after,
+                             location_from_id, location_to_id):
+    """Yield ``(location_id, delta)`` pairs for a single movement"""
+    if movement_type == 'transfer':
+        if location_from_id:
+            yield location_from_id, -quantity
+        if location_to_id:
+            yield location_to_id, quantity
+        return
+
+    # in/out/adjustment change the product total by stock_after - stock_before
+    # (out movements are clamped at zero by the ledger)
+    delta = stock_after - stock_before
+    if not delta:
+        return
+    if movement_type == 'in' or movement_type == 'adjustment':
+        location_id = location_to_id or location_from_id
+    else:
+        location_id = location_from_id or location_to_id
+    if location_id:
+        yield location_id, delta
+
+
+def collect_deltas(rows, deltas=None):
+    """
+    Fold movement rows into ``{(product_id, location_id): delta}``.
+
+    ``rows`` are tuples ordered as ``DELTA_FIELDS``.
+    """
+    if deltas is None:
+        deltas = defaultdict(lambda: ZERO)
+    for product_id, *values in rows:
+        for location_id, delta in movement_location_deltas(*values):
+            deltas[product_id, location_id] += delta
+    return deltas
+
+
+def apply_location_deltas(deltas, using='default'):
+    """
+    Add ``deltas`` to ProductLocation rows, creating missing rows.
+
+    Missing rows are inserted at zero with ``ignore_conflicts`` and every pair
+    is then incremented with an ``F()`` update, so the upsert is atomic even
+    when another transaction creates the same row concurrently.
+    """
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    manager = ProductLocation.objects.using(using)
+    with transaction.atomic(using=using):
+        manager.bulk_create(
+            [ProductLocation(product_id=product_id, location_id=location_id)
+             for product_id, location_id in deltas],
+            ignore_conflicts=True,
+        )
+        now = timezone.now()
+        for (product_id, location_id), delta in deltas.items():
+            manager.filter(product_id=product_id, location_id=location_id).update(
+                quantity=F('quantity') + delta,
+                last_updated=now,
+            )
+
+
+def project_movements(movements, using='default'):
+    """Apply freshly posted movements to the location projection"""
+    rows = (
+        tuple(getattr(movement, field) for field in DELTA_FIELDS)
+        for movement in movements
+        if movement.location_from_id or movement.location_to_id
+    )
+    apply_location_deltas(collect_deltas(rows), using=using)
+
+
+def rebuild_location_stock(chunk_size=10000, using='default'):
+    """
+    Recompute every ProductLocation quantity from the full movement history.
+
+    Movements are streamed in chunks and folded into per-location totals in
+    memory (one entry per product/location pair). Returns the number of
+    ProductLocation rows written.
+    """
+    manager = ProductLocation.objects.using(using)
+    with transaction.atomic(using=using):
+        rows = (
+            StockMovement.objects.using(using)
+            .filter(Q(location_from__isnull=False) | Q(location_to__isnull=False))
+            .order_by('pk')
+            .values_list(*DELTA_FIELDS)
+            .iterator(chunk_size=chunk_size)
+        )
+        totals = collect_deltas(rows)
+
+        now = timezone.now()
+        existing = {
+            (product_id, location_id): pk
+            for pk, product_id, location_id in manager.values_list('pk', 'product_id', 'location_id')
+        }
+        updates = [
+            ProductLocation(pk=pk, quantity=totals.get(key, ZERO), last_updated=now)
+            for key, pk in existing.items()
+        ]
+        manager.bulk_update(updates, ['quantity', 'last_updated'], batch_size=chunk_size)
+        manager.bulk_create(
+            [ProductLocation(product_id=product_id, location_id=location_id, quantity=quantity)
+             for (product_id, location_id), quantity in totals.items()
+             if (product_id, location_id) not in existing],
+            batch_size=chunk_size,
+        )
+    return len(updates) + len(set(totals) - set(existing))
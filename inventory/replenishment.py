@@ -0,0 +1,86 @@
+"""
+Reorder-point replenishment planner.
+
+Products are scanned in primary-key chunks; for each chunk one grouped query
+sums the goods-out quantities over the lookback window. A product is
+suggested for reorder when its stock is at or below
+
+    reorder point = minimum_stock + daily demand * lead time
+
+and the suggested quantity tops it up to ``maximum_stock`` (or, without a
+maximum, to the reorder point plus one more lead time of demand). Suggestions
+are yielded as they are computed so memory stays bounded by the chunk size.
+"""
+from collections import namedtuple
+from datetime import timedelta
+from decimal import Decimal, ROUND_CEILING
+
+from django.db.models import Q, Sum
+from django.utils import timezone
+
+from .models import Product, StockMovement
+
+ZERO = Decimal('0.00')
+
+Suggestion = namedtuple('Suggestion', [
+    'product_id', 'code', 'name', 'current_stock', 'minimum_stock', 'maximum_stock',
+    'daily_demand', 'reorder_point', 'order_quantity',
+])
+
+PRODUCT_FIELDS = ('pk', 'code', 'name', 'current_stock', 'minimum_stock', 'maximum_stock')
+
+
+def suggest(product, demand, lookback_days, lead_time_days):
+    """Return a Suggestion for one product row, or None when stock is sufficient"""
+    pk, code, name, current_stock, minimum_stock, maximum_stock = product
+    daily_demand = demand / lookback_days
+    lead_time_demand = daily_demand * lead_time_days
+    reorder_point = minimum_stock + lead_time_demand
+    if current_stock > reorder_point:
+        return None
+
+    target = maximum_stock if maximum_stock > reorder_point else reorder_point + lead_time_demand
+    order_quantity = (target - current_stock).to_integral_value(rounding=ROUND_CEILING)
+    if order_quantity <= 0:
+        return None
+    return Suggestion(
+        pk, code, name, current_stock, minimum_stock, maximum_stock,
+        daily_demand.quantize(Decimal('0.0001')), reorder_point.quantize(Decimal('0.01')),
+        order_quantity,
+    )
+
+
+def plan_replenishment(lookback_days=90, lead_time_days=14, chunk_size=5000, using='default'):
+    """Yield a Suggestion for every tracked product that needs reordering"""
+    lookback = Decimal(lookback_days)
+    since = timezone.now() - timedelta(days=lookback_days)
+    products = (
+        Product.objects.using(using)
+        .filter(is_active=True, track_inventory=True)
+        .filter(Q(minimum_stock__gt=0) | Q(maximum_stock__gt=0))
+        .order_by('pk')
+    )
+
+    last_pk = 0
+    while True:
+        chunk = list(products.filter(pk__gt=last_pk).values_list(*PRODUCT_FIELDS)[:chunk_size])
+        if not chunk:
+            return
+        last_pk = chunk[-1][0]
+
+        demand = dict(
+            StockMovement.objects.using(using)
+            .filter(
+                product_id__in=[row[0] for row in chunk],
+                movement_type='out',
+                created_at__gte=since,
+            )
+            .order_by()
+            .values('product_id')
+            .annotate(total=Sum('quantity'))
+            .values_list('product_id', 'total')
+        )
+        for row in chunk:
+            suggestion = suggest(row, demand.get(row[0], ZERO), lookback, lead_time_days)
+            if suggestion is not None:
+                yield suggestion
@@ -0,0 +1,372 @@
+"""
+Product search - ranked catalogue lookups for ProductListView.
+
+Every search first tries an exact match on code, barcode and SKU (unique or
+indexed columns), then falls back to a full-text backend:
+
+* ``SQLiteFTSBackend`` keeps two FTS5 tables in step with Product saves: a
+  unicode61 table with prefix indexes for "starts with" matches ranked by
+  bm25, and a trigram table for substring matches.
+* ``PostgreSQLSearchBackend`` ranks prefix matches with full-text search and
+  substring matches with pg_trgm similarity directly on the product table.
+* ``BasicSearchBackend`` keeps the original ``icontains`` scan for other
+  databases.
+
+The backend is chosen from the database vendor, or from the
+``INVENTORY_SEARCH_BACKEND`` setting (dotted path to a backend class), once
+per process and database: a backend whose index is missing (FTS5 tables not
+created yet, SQLite without the trigram tokenizer, no pg_trgm) is replaced
+by ``BasicSearchBackend``. An index error while searching or indexing also
+switches the process to the basic search instead of failing the request or
+the product save.
+"""
+import logging
+import re
+
+from django.conf import settings
+from django.db import DatabaseError, connections, router, transaction
+from django.db.models import Q
+from django.utils.module_loading import import_string
+
+from .models import Product
+
+SEARCH_LIMIT = 1000
+
+# Indexed columns, most significant first
+INDEXED_FIELDS = ('code', 'barcode', 'sku', 'name', 'brand', 'manufacturer')
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+logger = logging.getLogger(__name__)
+
+
+def exact_matches(query, using):
+    """Ids of products whose code, barcode or SKU equals ``query``"""
+    return list(
+        Product.objects.using(using)
+        .filter(Q(code=query) | Q(barcode=query) | Q(sku=query))
+        .order_by('code')
+        .values_list('pk', flat=True)
+    )
+
+
+class BasicSearchBackend:
+    """Unindexed ``icontains`` search, used where no search index is available"""
+
+    def __init__(self, using):
+        self.using = using
+
+    def setup(self):
+        pass
+
+    def is_available(self):
+        """Whether the index this backend queries exists"""
+        return True
+
+    def search(self, query, limit):
+        return list(
+            Product.objects.using(self.using).filter(
+                Q(code__icontains=query) |
+                Q(name__icontains=query) |
+                Q(barcode__icontains=query) |
+                Q(sku__icontains=query)
+            ).values_list('pk', flat=True)[:limit]
+        )
+
+    def index_product(self, product):
+        pass
+
+    def remove_product(self, product_id):
+        pass
+
+    def rebuild(self):
+        return 0
+
+
+class SQLiteFTSBackend(BasicSearchBackend):
+    """SQLite FTS5 prefix and trigram index"""
+    prefix_table = 'inventory_product_search'
+    trigram_table = 'inventory_product_trigram'
+    # bm25 column weights, in INDEXED_FIELDS order
+    weights = (10.0, 10.0, 8.0, 5.0, 1.0, 1.0)
+
+    def _tables(self):
+        return (self.prefix_table, self.trigram_table)
+
+    def is_available(self):
+        existing = set(connections[self.using].introspection.table_names())
+        return set(self._tables()) <= existing
+
+    def setup(self):
+        """Create the FTS tables, filling them on first creation"""
+        connection = connections[self.using]
+        existing = set(connection.introspection.table_names())
+        if set(self._tables()) <= existing:
+            return
+        columns = ', '.join(INDEXED_FIELDS)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.prefix_table} "
+                f"USING fts5({columns}, prefix='2 3')"
+            )
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.trigram_table} "
+                f"USING fts5({columns}, tokenize='trigram')"
+            )
+        self.rebuild()
+
+    def search(self, query, limit):
+        ids = []
+        tokens = TOKEN_RE.findall(query)
+        if tokens:
+            match = ' '.join(f'"{token}"*' for token in tokens)
+            ids = self._match(self.prefix_table, match, limit)
+        if len(ids) < limit and len(query) >= 3:
+            # Substring matches anywhere in the indexed columns
+            phrase = '"{}"'.format(query.replace('"', '""'))
+            seen = set(ids)
+            ids += [pk for pk in self._match(self.trigram_table, phrase, limit) if pk not in seen]
+        return ids[:limit]
+
+    def _match(self, table, match, limit):
+        weights = ', '.join(str(weight) for weight in self.weights)
+        with connections[self.using].cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid FROM {table} WHERE {table} MATCH %s "
+                f"ORDER BY bm25({table}, {weights}) LIMIT %s",
+                [match, limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def _row(self, product):
+        return [getattr(product, field) or '' for field in INDEXED_FIELDS]
+
+    def index_product(self, product):
+        placeholders = ', '.join(['%s'] * (len(INDEXED_FIELDS) + 1))
+        columns = ', '.join(INDEXED_FIELDS)
+        with connections[self.using].cursor() as cursor:
+            for table in self._tables():
+                cursor.execute(f"DELETE FROM {table} WHERE rowid = %s", [product.pk])
+                cursor.execute(
+                    f"INSERT INTO {table} (rowid, {columns}) VALUES ({placeholders})",
+                    [product.pk] + self._row(product),
+                )
+
+    def remove_product(self, product_id):
+        with connections[self.using].cursor() as cursor:
+            for table in self._tables():
+                cursor.execute(f"DELETE FROM {table} WHERE rowid = %s", [product_id])
+
+    def rebuild(self, chunk_size=2000):
+        placeholders = ', '.join(['%s'] * (len(INDEXED_FIELDS) + 1))
+        columns = ', '.join(INDEXED_FIELDS)
+        rows = (
+            Product.objects.using(self.using)
+            .order_by('pk')
+            .values_list('pk', *INDEXED_FIELDS)
+            .iterator(chunk_size=chunk_size)
+        )
+        count = 0
+        with connections[self.using].cursor() as cursor:
+            for table in self._tables():
+                cursor.execute(f"DELETE FROM {table}")
+            batch = []
+            for row in rows:
+                batch.append([value or '' for value in row])
+                if len(batch) >= chunk_size:
+                    count += self._insert(cursor, batch, columns, placeholders)
+                    batch = []
+            count += self._insert(cursor, batch, columns, placeholders)
+        return count
+
+    def _insert(self, cursor, batch, columns, placeholders):
+        for table in self._tables():
+            cursor.executemany(
+                f"INSERT INTO {table} (rowid, {columns}) VALUES ({placeholders})", batch
+            )
+        return len(batch)
+
+
+class PostgreSQLSearchBackend(BasicSearchBackend):
+    """
+    Full-text prefix search plus pg_trgm similarity on the product table.
+
+    ``setup`` creates the pg_trgm extension and the GIN indexes the queries
+    rely on; the indexes are maintained by PostgreSQL itself.
+    """
+    document = "coalesce(code, '') || ' ' || coalesce(barcode, '') || ' ' || " \
+               "coalesce(sku, '') || ' ' || name || ' ' || coalesce(brand, '')"
+
+    def setup(self):
+        table = Product._meta.db_table
+        with connections[self.using].cursor() as cursor:
+            cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS inventory_product_fts_idx ON {table} "
+                f"USING gin (to_tsvector('simple', {self.document}))"
+            )
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS inventory_product_trgm_idx ON {table} "
+                f"USING gin (({self.document}) gin_trgm_ops)"
+            )
+
+    def is_available(self):
+        with connections[self.using].cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            return cursor.fetchone() is not None
+
+    def search(self, query, limit):
+        table = Product._meta.db_table
+        vector = f"to_tsvector('simple', {self.document})"
+        tokens = TOKEN_RE.findall(query)
+        # Prefix matches rank first, then substring matches by similarity
+        prefix_query = ' & '.join(f'{token}:*' for token in tokens) or "''"
+        pattern = '%{}%'.format(query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_'))
+        with connections[self.using].cursor() as cursor:
+            cursor.execute(
+                f"SELECT id FROM {table} "
+                f"WHERE {vector} @@ to_tsquery('simple', %s) OR ({self.document}) ILIKE %s "
+                f"ORDER BY ts_rank({vector}, to_tsquery('simple', %s)) DESC, "
+                f"similarity({self.document}, %s) DESC "
+                f"LIMIT %s",
+                [prefix_query, pattern, prefix_query, query, limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def rebuild(self):
+        return Product.objects.using(self.using).count()
+
+
+VENDOR_BACKENDS = {
+    'sqlite': SQLiteFTSBackend,
+    'postgresql': PostgreSQLSearchBackend,
+}
+
+_backends = {}
+
+
+def backend_class(using):
+    """The configured or vendor search backend class for a database alias"""
+    backend_path = getattr(settings, 'INVENTORY_SEARCH_BACKEND', None)
+    if backend_path:
+        return import_string(backend_path)
+    return VENDOR_BACKENDS.get(connections[using].vendor, BasicSearchBackend)
+
+
+def get_backend(using=None):
+    """
+    Return the search backend for a database alias, the basic search when
+    the configured backend's index doesn't exist in this database
+    """
+    using = using or router.db_for_read(Product)
+    if using not in _backends:
+        backend = backend_class(using)(using)
+        try:
+            available = backend.is_available()
+        except DatabaseError:
+            available = False
+        _backends[using] = backend if available else BasicSearchBackend(using)
+    return _backends[using]
+
+
+def degrade(backend, error):
+    """Switch this process to the basic search after an index error"""
+    logger.warning('Product search index unusable on %r, using basic search: %s', backend.using, error)
+    _backends[backend.using] = BasicSearchBackend(backend.using)
+
+
+def setup_search_index(using):
+    """
+    Create the search index for a database, run after migrate.
+
+    Falls back to the unindexed search when the database lacks FTS5 or
+    pg_trgm support.
+    """
+    # Detect the backend again on next use, here and in processes started later
+    _backends.pop(using, None)
+    try:
+        backend_class(using)(using).setup()
+    except DatabaseError as error:
+        logger.warning('Product search index not created on %r: %s', using, error)
+
+
+def index_product(product, using):
+    """Add or refresh one product in the search index"""
+    backend = get_backend(using)
+    try:
+        # A savepoint, so a failed index write leaves the product save intact
+        with transaction.atomic(using=using):
+            backend.index_product(product)
+    except DatabaseError as error:
+        degrade(backend, error)
+
+
+def remove_product(product_id, using):
+    """Drop one product from the search index"""
+    backend = get_backend(using)
+    try:
+        with transaction.atomic(using=using):
+            backend.remove_product(product_id)
+    except DatabaseError as error:
+        degrade(backend, error)
+
+
+def search_products(query, limit=SEARCH_LIMIT, using=None):
+    """Return ranked product ids for ``query``, exact identifier matches first"""
+    query = query.strip()
+    if not query:
+        return []
+    backend = get_backend(using)
+    ids = exact_matches(query, backend.using)
+    seen = set(ids)
+    try:
+        with transaction.atomic(using=backend.using):
+            matches = backend.search(query, limit)
+    except DatabaseError as error:
+        degrade(backend, error)
+        matches = get_backend(backend.using).search(query, limit)
+    ids += [pk for pk in matches if pk not in seen]
+    return ids[:limit]
+
+
+class RankedResults:
+    """
+    Search matches left by a queryset's filters, in rank order.
+
+    Paginates like a queryset: ``count()`` reads the matching ids once and
+    a slice loads only the products of that page. ``limited`` tells whether
+    the search stopped at its limit.
+    """
+
+    def __init__(self, queryset, ids, limit):
+        self.queryset = queryset
+        self.ids = ids
+        self.limited = len(ids) >= limit
+        self._matching = None
+
+    def matching_ids(self):
+        if self._matching is None:
+            kept = set(self.queryset.filter(pk__in=self.ids).values_list('pk', flat=True)) if self.ids else set()
+            self._matching = [pk for pk in self.ids if pk in kept]
+        return self._matching
+
+    def count(self):
+        return len(self.matching_ids())
+
+    def __len__(self):
+        return self.count()
+
+    def __iter__(self):
+        return iter(self[:])
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            return self[key:key + 1][0]
+        page_ids = self.matching_ids()[key]
+        products = self.queryset.in_bulk(page_ids)
+        return [products[pk] for pk in page_ids if pk in products]
+
+
+def filter_ranked(queryset, query, limit=SEARCH_LIMIT):
+    """Restrict ``queryset`` to search matches, ordered by rank"""
+    return RankedResults(queryset, search_products(query, limit=limit, using=queryset.db), limit)
@@ -0,0 +1,96 @@
+from django.core.signals import request_started
+from django.db import transaction
+from django.db.models.signals import post_delete, post_migrate, post_save
+from django.dispatch import receiver
+
+from .barcodes import barcode_cache
+from .counters import invalidate_counters
+from .ledger import stock_posted
+from .models import Category, Location, Product, StockMovement
+from .projections import project_movements
+from . import search
+from .valuation import revalue_product, value_movements
+
+
+@receiver(stock_posted, sender=StockMovement)
+def update_location_stock(sender, movements, using, **kwargs):
+    """
+    Keep ProductLocation quantities in step with posted movements
+    """
+    project_movements(movements, using=using)
+
+
+@receiver(stock_posted, sender=StockMovement)
+def update_valuation(sender, movements, using, **kwargs):
+    """
+    Maintain moving average cost and stock value for posted movements
+    """
+    value_movements(movements, using=using)
+
+
+@receiver(post_save, sender=Product)
+def product_post_save(sender, instance, created, using, raw=False, **kwargs):
+    """
+    Value new products and stock levels edited outside the ledger
+    """
+    if not raw:
+        revalue_product(instance, using=using)
+
+
+@receiver(stock_posted, sender=StockMovement)
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Location)
+@receiver(post_delete, sender=Location)
+def counters_changed(sender, using, **kwargs):
+    """
+    Drop cached dashboard counters once the change is committed
+    """
+    transaction.on_commit(invalidate_counters, using=using)
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, using, **kwargs):
+    """
+    Keep the product search index up to date
+    """
+    search.index_product(instance, using)
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, using, **kwargs):
+    search.remove_product(instance.pk, using)
+
+
+@receiver(post_migrate)
+def create_search_index(sender, using, **kwargs):
+    """
+    Create the product search index alongside the inventory tables
+    """
+    if sender.name == 'inventory':
+        search.setup_search_index(using)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def product_scan_changed(sender, instance, using, **kwargs):
+    """
+    Drop a changed product from the barcode cache once committed
+    """
+    transaction.on_commit(lambda: barcode_cache.invalidate([instance.pk]), using=using)
+
+
+@receiver(stock_posted, sender=StockMovement)
+def stock_scan_changed(sender, movements, using, **kwargs):
+    product_ids = {movement.product_id for movement in movements}
+    transaction.on_commit(lambda: barcode_cache.invalidate(product_ids), using=using)
+
+
+@receiver(request_started)
+def warm_scan_cache(sender, **kwargs):
+    """
+    Warm the barcode cache in the background once the process serves requests
+    """
+    barcode_cache.warm_in_background()
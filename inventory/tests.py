@@ -1,3 +1,77 @@
+from decimal import Decimal
+
 from django.test import TestCase
 
-# Create your tests here.
+from .ledger import post_movements
+from .models import Product, StockMovement
+
+
+class StockLedgerTests(TestCase):
+    """stock_before/stock_after chain per product and end on current_stock"""
+
+    def setUp(self):
+        self.bolt = Product.objects.create(code='BOLT', name='Bolt')
+        self.nut = Product.objects.create(code='NUT', name='Nut')
+
+    def movement(self, product, movement_type, quantity):
+        return StockMovement(product=product, movement_type=movement_type, quantity=Decimal(quantity))
+
+    def assertChain(self, product, expected):
+        movements = StockMovement.objects.filter(product=product).order_by('pk')
+        self.assertEqual(
+            [(movement.stock_before, movement.stock_after) for movement in movements],
+            [(Decimal(before), Decimal(after)) for before, after in expected],
+        )
+        product.refresh_from_db()
+        self.assertEqual(product.current_stock, Decimal(expected[-1][1]))
+
+    def test_post_movements_chains_stock_per_product(self):
+        created = post_movements([
+            self.movement(self.bolt, 'in', '10'),
+            self.movement(self.nut, 'in', '5'),
+            self.movement(self.bolt, 'out', '4'),
+            self.movement(self.nut, 'transfer', '2'),
+            self.movement(self.bolt, 'adjustment', '20'),
+            self.movement(self.nut, 'out', '8'),
+            self.movement(self.bolt, 'in', '1.5'),
+        ])
+        self.assertEqual(len(created), 7)
+        self.assertChain(self.bolt, [('0', '10'), ('10', '6'), ('6', '20'), ('20', '21.5')])
+        # Out movements stop at zero
+        self.assertChain(self.nut, [('0', '5'), ('5', '5'), ('5', '0')])
+
+    def test_post_movements_continues_from_current_stock(self):
+        StockMovement.objects.create(product=self.bolt, movement_type='in', quantity=Decimal('7'))
+        post_movements([self.movement(self.bolt, 'out', '2')])
+        StockMovement.objects.create(product=self.bolt, movement_type='in', quantity=Decimal('3'))
+        self.assertChain(self.bolt, [('0', '7'), ('7', '5'), ('5', '8')])
+
+    def test_post_movements_refuses_missing_products(self):
+        missing = Product(pk=self.nut.pk + 100, code='GONE', name='Gone')
+        with self.assertRaises(Product.DoesNotExist):
+            post_movements([self.movement(self.bolt, 'in', '1'), self.movement(missing, 'in', '1')])
+        self.assertFalse(StockMovement.objects.exists())
+        self.bolt.refresh_from_db()
+        self.assertEqual(self.bolt.current_stock, Decimal('0'))
+
+    def test_post_movements_without_movements(self):
+        self.assertEqual(post_movements([]), [])
+
+    def test_saved_movement_posts_once(self):
+        movement = StockMovement.objects.create(product=self.bolt, movement_type='in', quantity=Decimal('10'))
+        movement.notes = 'Counted twice'
+        movement.save()
+        movement.reference = 'PO-1'
+        movement.save(update_fields=['reference'])
+        self.assertChain(self.bolt, [('0', '10')])
+
+    def test_posted_movement_cannot_change(self):
+        movement = StockMovement.objects.create(product=self.bolt, movement_type='in', quantity=Decimal('10'))
+        for field, value in [('quantity', Decimal('1')), ('movement_type', 'out'), ('product', self.nut),
+                             ('unit_cost', Decimal('2.50'))]:
+            edited = StockMovement.objects.get(pk=movement.pk)
+            setattr(edited, field, value)
+            with self.assertRaises(ValueError):
+                edited.save()
+        self.assertChain(self.bolt, [('0', '10')])
+        self.assertFalse(StockMovement.objects.filter(product=self.nut).exists())
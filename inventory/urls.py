@@ -30,4 +30,10 @@ urlpatterns = [
     path('movements/', views.StockMovementListView.as_view(), name='movement_list'),
     path('movements/create/', views.StockMovementCreateView.as_view(), name='movement_create'),
     path('movements/<int:pk>/', views.StockMovementDetailView.as_view(), name='movement_detail'),
+    
+    # Scanner
+    path('scan/', views.scan_barcode, name='scan_barcode'),
+    
+    # Reports
+    path('valuation/', views.InventoryValuationView.as_view(), name='valuation_report'),
 ]
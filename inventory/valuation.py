@@ -0,0 +1,175 @@
+"""
+Inventory valuation - moving weighted average cost maintained as movements post.
+
+Receipts add ``quantity * unit_cost`` to the product's stock value (falling
+back to the current average when no unit cost was given), issues remove stock
+at the current average cost. Results live in InventoryValuation so the
+dashboard and valuation report read one precomputed row per product.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from .models import InventoryValuation, Product, StockMovement
+
+ZERO = Decimal('0.00')
+CENTS = Decimal('0.01')
+COST_PLACES = Decimal('0.0001')
+
+# Movement columns needed to value a movement
+VALUATION_FIELDS = ('product_id', 'movement_type', 'unit_cost', 'stock_before', 'stock_after')
+
+
+def average_cost(quantity, value):
+    if quantity > 0:
+        return value / quantity
+    return ZERO
+
+
+def value_movement(quantity, value, movement_type, unit_cost, stock_before, stock_after):
+    """Return ``(quantity, value)`` after applying one movement"""
+    if movement_type == 'transfer':
+        return quantity, value
+
+    average = average_cost(quantity, value)
+    delta = stock_after - stock_before
+    if delta > 0:
+        value += delta * (unit_cost if unit_cost > 0 else average)
+    elif delta < 0:
+        value += delta * average
+    if stock_after <= 0:
+        value = ZERO
+    return stock_after, value
+
+
+def _valuation_row(product_id, quantity, value, now):
+    return InventoryValuation(
+        product_id=product_id,
+        quantity=quantity,
+        average_cost=average_cost(quantity, value).quantize(COST_PLACES),
+        total_value=Decimal(value).quantize(CENTS),
+        updated_at=now,
+    )
+
+
+VALUE_FIELDS = ['quantity', 'average_cost', 'total_value', 'updated_at']
+
+
+def _save_rows(rows, existing, using, batch_size=1000):
+    manager = InventoryValuation.objects.using(using)
+    for row in rows:
+        row.pk = existing.get(row.product_id)
+    updated = [row for row in rows if row.pk is not None]
+    if len(updated) == 1:
+        # One movement posted through StockMovement.save, while its product
+        # row is locked: a plain UPDATE instead of bulk_update's CASE
+        row = updated[0]
+        manager.filter(pk=row.pk).update(**{field: getattr(row, field) for field in VALUE_FIELDS})
+    else:
+        manager.bulk_update(updated, VALUE_FIELDS, batch_size=batch_size)
+    manager.bulk_create([row for row in rows if row.pk is None], batch_size=batch_size)
+
+
+def value_movements(movements, using='default'):
+    """Apply freshly posted movements to the valuation table"""
+    rows = [tuple(getattr(movement, field) for field in VALUATION_FIELDS) for movement in movements]
+    product_ids = {row[0] for row in rows}
+
+    current = {
+        product_id: (pk, quantity, value)
+        for pk, product_id, quantity, value in InventoryValuation.objects.using(using)
+        .filter(product_id__in=product_ids)
+        .values_list('pk', 'product_id', 'quantity', 'total_value')
+    }
+    state = {product_id: [quantity, value] for product_id, (_, quantity, value) in current.items()}
+
+    # Products valued for the first time start from their stock before the
+    # first movement at the product's cost price
+    missing = product_ids - set(state)
+    if missing:
+        cost_prices = dict(
+            Product.objects.using(using).filter(pk__in=missing).values_list('pk', 'cost_price')
+        )
+        for product_id, movement_type, unit_cost, stock_before, stock_after in rows:
+            if product_id not in state:
+                state[product_id] = [stock_before, stock_before * cost_prices[product_id]]
+
+    for product_id, *values in rows:
+        state[product_id] = list(value_movement(*state[product_id], *values))
+
+    now = timezone.now()
+    _save_rows(
+        [_valuation_row(product_id, quantity, value, now) for product_id, (quantity, value) in state.items()],
+        {product_id: pk for product_id, (pk, _, _) in current.items()},
+        using,
+    )
+
+
+def revalue_product(product, using='default'):
+    """
+    Bring a product's valuation in line with stock edited outside the ledger.
+
+    Stock added or removed by hand is valued at the current average cost, or
+    at the product's cost price when there is no average yet.
+    """
+    valuation = InventoryValuation.objects.using(using).filter(product=product).first()
+    if valuation is None:
+        valuation = InventoryValuation(product=product)
+    elif valuation.quantity == product.current_stock:
+        return valuation
+
+    cost = valuation.average_cost if valuation.quantity > 0 else product.cost_price
+    valuation.quantity = product.current_stock
+    valuation.average_cost = cost if valuation.quantity > 0 else ZERO
+    valuation.total_value = (valuation.quantity * cost).quantize(CENTS) if valuation.quantity > 0 else ZERO
+    valuation.save(using=using)
+    return valuation
+
+
+def rebuild_valuation(chunk_size=10000, using='default'):
+    """
+    Recompute the valuation of every product from its movement history.
+
+    Movements are streamed in chunks; only the running quantity and value of
+    each product are kept in memory. Returns the number of products valued.
+    """
+    with transaction.atomic(using=using):
+        products = {
+            pk: (current_stock, cost_price)
+            for pk, current_stock, cost_price in Product.objects.using(using)
+            .values_list('pk', 'current_stock', 'cost_price')
+        }
+        state = {}
+        movements = (
+            StockMovement.objects.using(using)
+            .order_by('product_id', 'pk')
+            .values_list(*VALUATION_FIELDS)
+            .iterator(chunk_size=chunk_size)
+        )
+        for product_id, *values in movements:
+            if product_id not in state:
+                stock_before = values[2]
+                state[product_id] = [stock_before, stock_before * products[product_id][1]]
+            state[product_id] = list(value_movement(*state[product_id], *values))
+
+        now = timezone.now()
+        rows = []
+        for product_id, (current_stock, cost_price) in products.items():
+            quantity, value = state.get(product_id, (current_stock, current_stock * cost_price))
+            if quantity != current_stock:
+                # Stock edited by hand after the last movement
+                cost = average_cost(quantity, value) if quantity > 0 else cost_price
+                quantity, value = current_stock, current_stock * cost
+            rows.append(_valuation_row(product_id, quantity, value, now))
+
+        existing = dict(InventoryValuation.objects.using(using).values_list('product_id', 'pk'))
+        _save_rows(rows, existing, using, batch_size=chunk_size)
+    return len(rows)
+
+
+def total_inventory_value(using='default'):
+    return InventoryValuation.objects.using(using).aggregate(
+        total=Sum('total_value')
+    )['total'] or ZERO
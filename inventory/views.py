@@ -1,11 +1,21 @@
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView
+from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.http import HttpResponseRedirect, JsonResponse
+from django.views.decorators.http import require_GET
 from django.urls import reverse_lazy
 from django.contrib import messages
-from django.db.models import Q, Sum, F
-from decimal import Decimal
+from django.db import transaction
+from django.db.models import F
 
-from .models import Product, Category, Unit, Location, StockMovement, ProductLocation, Warehouse
+from .models import (
+    Product, Category, Unit, Location, StockMovement, ProductLocation, Warehouse,
+    InventoryValuation
+)
+from .barcodes import barcode_cache
+from .counters import get_counters
+from .search import SEARCH_LIMIT, filter_ranked
+from .valuation import total_inventory_value
 
 # Warehouse Views
 class WarehouseListView(ListView):
@@ -24,18 +34,14 @@ class ProductListView(LoginRequiredMixin, ListView):
     def get_queryset(self):
         queryset = Product.objects.select_related('category', 'unit', 'created_by')
         
-        search = self.request.GET.get('search')
-        if search:
-            queryset = queryset.filter(
-                Q(code__icontains=search) |
-                Q(name__icontains=search) |
-                Q(barcode__icontains=search) |
-                Q(sku__icontains=search)
-            )
-        
         category = self.request.GET.get('category')
         if category:
-            queryset = queryset.filter(category_id=category)
+            # Include products of every subcategory
+            path = Category.objects.filter(pk=category).values_list('path', flat=True).first()
+            if path:
+                queryset = queryset.filter(category__path__startswith=path)
+            else:
+                queryset = queryset.filter(category_id=category)
         
         status = self.request.GET.get('status')
         if status == 'low_stock':
@@ -43,16 +49,21 @@ class ProductListView(LoginRequiredMixin, ListView):
         elif status == 'out_of_stock':
             queryset = queryset.filter(current_stock=0)
         
+        search = self.request.GET.get('search')
+        if search:
+            # Ranked: exact code/barcode/SKU, then prefix, then substring matches
+            queryset = filter_ranked(queryset, search)
+        
         return queryset
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['categories'] = Category.objects.all()
-        context['total_products'] = Product.objects.count()
-        context['low_stock_count'] = Product.objects.filter(
-            current_stock__lte=F('minimum_stock')
-        ).count()
-        context['out_of_stock_count'] = Product.objects.filter(current_stock=0).count()
+        context['search_limit'] = SEARCH_LIMIT if getattr(self.object_list, 'limited', False) else None
+        counters = get_counters()
+        context['total_products'] = counters['total_products']
+        context['low_stock_count'] = counters['low_stock']
+        context['out_of_stock_count'] = counters['out_of_stock']
         return context
 
 
@@ -93,7 +104,21 @@ class ProductUpdateView(LoginRequiredMixin, UpdateView):
     
     def form_valid(self, form):
         messages.success(self.request, 'Product updated successfully!')
-        return super().form_valid(form)
+        with transaction.atomic():
+            self.object = form.save(commit=False)
+            self.object.save_details()
+            form.save_m2m()
+            if 'current_stock' in form.changed_data:
+                # Post the edited stock level through the ledger, so movement
+                # history and stock snapshots account for it
+                StockMovement.objects.create(
+                    product=self.object,
+                    movement_type='adjustment',
+                    quantity=form.cleaned_data['current_stock'],
+                    notes='Stock level edited on the product',
+                    created_by=self.request.user,
+                )
+        return HttpResponseRedirect(self.get_success_url())
 
 
 class ProductDeleteView(LoginRequiredMixin, DeleteView):
@@ -238,29 +263,69 @@ class InventoryDashboardView(LoginRequiredMixin, ListView):
         context = super().get_context_data(**kwargs)
         
         # Statistics
-        context['total_products'] = Product.objects.filter(is_active=True).count()
-        context['total_categories'] = Category.objects.count()
-        context['total_locations'] = Location.objects.filter(is_active=True).count()
+        counters = get_counters()
+        context['total_products'] = counters['active_products']
+        context['total_categories'] = counters['total_categories']
+        context['total_locations'] = counters['active_locations']
         
         # Stock alerts
-        context['low_stock_count'] = Product.objects.filter(
-            current_stock__lte=F('minimum_stock'),
-            track_inventory=True
-        ).count()
-        context['out_of_stock_count'] = Product.objects.filter(
-            current_stock=0,
-            track_inventory=True
-        ).count()
+        context['low_stock_count'] = counters['tracked_low_stock']
+        context['out_of_stock_count'] = counters['tracked_out_of_stock']
         
         # Recent movements
         context['recent_movements'] = StockMovement.objects.select_related(
             'product', 'created_by'
         ).order_by('-created_at')[:10]
         
-        # Total inventory value
-        total_value = Product.objects.aggregate(
-            total=Sum(F('current_stock') * F('cost_price'))
-        )['total'] or Decimal('0.00')
-        context['total_inventory_value'] = total_value
+        # Total inventory value at moving average cost
+        context['total_inventory_value'] = counters['total_inventory_value']
         
         return context
+
+
+class InventoryValuationView(LoginRequiredMixin, ListView):
+    """Stock valuation report at moving average cost"""
+    model = InventoryValuation
+    template_name = 'inventory/valuation_report.html'
+    context_object_name = 'valuations'
+    paginate_by = 50
+    
+    def get_queryset(self):
+        queryset = InventoryValuation.objects.select_related('product', 'product__category')
+        
+        category = self.request.GET.get('category')
+        if category:
+            queryset = queryset.filter(product__category_id=category)
+        
+        return queryset.order_by('-total_value')
+    
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['categories'] = Category.objects.all()
+        context['total_inventory_value'] = total_inventory_value()
+        return context
+
+
+# Scanner Views
+@login_required
+@require_GET
+def scan_barcode(request):
+    """Resolve a scanned barcode, SKU or product code to product and stock"""
+    code = request.GET.get('code', '').strip()
+    if not code:
+        return JsonResponse({'error': 'Missing code parameter'}, status=400)
+    
+    product = barcode_cache.lookup(code)
+    if product is None:
+        return JsonResponse({'error': f'No product found for {code}'}, status=404)
+    
+    return JsonResponse({
+        'id': product['pk'],
+        'code': product['code'],
+        'name': product['name'],
+        'barcode': product['barcode'],
+        'sku': product['sku'],
+        'current_stock': str(product['current_stock']),
+        'selling_price': str(product['selling_price']),
+        'is_active': product['is_active'],
+    })
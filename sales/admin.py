@@ -1,5 +1,6 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 from .models import Customer, SalesOrder, SalesOrderItem, Quotation, QuotationItem
+from .conversion import convert_quotations
 
 
 class SalesOrderItemInline(admin.TabularInline):
@@ -94,6 +95,7 @@ class QuotationAdmin(admin.ModelAdmin):
     search_fields = ['quotation_number', 'customer__name', 'sales_person']
     readonly_fields = ['created_at', 'updated_at', 'sent_date', 'converted_order']
     inlines = [QuotationItemInline]
+    actions = ['convert_to_orders']
     
     fieldsets = (
         ('Quotation Information', {
@@ -116,6 +118,13 @@ class QuotationAdmin(admin.ModelAdmin):
             'classes': ('collapse',)
         }),
     )
+    
+    @admin.action(description='Convert selected quotations to sales orders')
+    def convert_to_orders(self, request, queryset):
+        result = convert_quotations(queryset.values_list('pk', flat=True))
+        self.message_user(request, f"Converted {len(result.orders)} quotations to sales orders.", messages.SUCCESS)
+        if result.skipped:
+            self.message_user(request, f"{len(result.skipped)} quotations were skipped (already converted or order number taken).", messages.WARNING)
 
 
 @admin.register(QuotationItem)
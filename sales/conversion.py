@@ -0,0 +1,124 @@
+"""
+Quotation conversion - turns quotations into confirmed sales orders.
+
+A batch of quotations is converted in one transaction: the orders and then
+all of their items are inserted with ``bulk_create`` (bulk inserts send no
+post_save, so no per-line recalculation runs), the order totals are
+calculated once per order and the quotations are marked converted with one
+``bulk_update``.
+"""
+from collections import namedtuple
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Quotation, QuotationItem, SalesOrder, SalesOrderItem
+from .totals import recalculate_totals
+
+ITEM_FIELDS = ['product_name', 'product_code', 'description', 'quantity', 'unit_price', 'discount_percentage']
+
+ConversionResult = namedtuple('ConversionResult', ['orders', 'skipped'])
+
+
+def order_number(quotation):
+    return f"SO-{quotation.quotation_number}"
+
+
+def new_order(quotation, order_date):
+    return SalesOrder(
+        order_number=order_number(quotation),
+        customer_id=quotation.customer_id,
+        order_date=order_date,
+        status='confirmed',
+        subtotal=quotation.subtotal,
+        tax_rate=quotation.tax_rate,
+        tax_amount=quotation.tax_amount,
+        discount_amount=quotation.discount_amount,
+        total_amount=quotation.total_amount,
+        notes=quotation.notes,
+        terms_conditions=quotation.terms_conditions,
+        sales_person=quotation.sales_person,
+    )
+
+
+def convert_quotations(quotation_ids, batch_size=500, using='default'):
+    """
+    Convert quotations to confirmed sales orders in one transaction.
+
+    Returns a ConversionResult with ``{quotation_id: order}`` for the
+    converted quotations and ``{quotation_id: reason}`` for the skipped
+    ones: quotations already converted or whose order number is taken.
+    """
+    quotation_ids = list(dict.fromkeys(quotation_ids))
+    orders, skipped = {}, {}
+    today = timezone.localdate()
+    with transaction.atomic(using=using):
+        quotations = {
+            quotation.pk: quotation
+            for quotation in Quotation.objects.using(using).select_for_update().filter(pk__in=quotation_ids)
+        }
+        taken = set(
+            SalesOrder.objects.using(using)
+            .filter(order_number__in=[order_number(quotation) for quotation in quotations.values()])
+            .values_list('order_number', flat=True)
+        )
+        for quotation_id in quotation_ids:
+            quotation = quotations.get(quotation_id)
+            if quotation is None:
+                skipped[quotation_id] = 'not found'
+            elif quotation.status == 'converted':
+                skipped[quotation_id] = 'already converted'
+            elif order_number(quotation) in taken:
+                skipped[quotation_id] = f'order {order_number(quotation)} already exists'
+            else:
+                orders[quotation_id] = new_order(quotation, today)
+        if not orders:
+            return ConversionResult(orders, skipped)
+
+        manager = SalesOrder.objects.using(using)
+        manager.bulk_create(orders.values(), batch_size=batch_size)
+        # bulk_create doesn't set primary keys on every backend, read them back
+        order_ids = dict(
+            manager.filter(order_number__in=[order.order_number for order in orders.values()])
+            .values_list('order_number', 'pk')
+        )
+        for order in orders.values():
+            order.pk = order_ids[order.order_number]
+
+        SalesOrderItem.objects.using(using).bulk_create([
+            SalesOrderItem(sales_order_id=orders[item['quotation_id']].pk, **{
+                field: item[field] for field in ITEM_FIELDS
+            })
+            for item in (
+                QuotationItem.objects.using(using)
+                .filter(quotation_id__in=list(orders))
+                .order_by('quotation_id', 'pk')
+                .values('quotation_id', *ITEM_FIELDS)
+            )
+        ], batch_size=batch_size)
+        recalculate_totals(SalesOrder, order_ids.values(), using=using)
+
+        converted = []
+        now = timezone.now()
+        for quotation_id, order in orders.items():
+            quotation = quotations[quotation_id]
+            quotation.status = 'converted'
+            quotation.converted_order_id = order.pk
+            quotation.updated_at = now
+            converted.append(quotation)
+        Quotation.objects.using(using).bulk_update(
+            converted, ['status', 'converted_order', 'updated_at'], batch_size=batch_size,
+        )
+    return ConversionResult(orders, skipped)
+
+
+def convert_quotation(quotation, using='default'):
+    """Convert one quotation, returning its new order; raises ValueError when it can't be converted"""
+    result = convert_quotations([quotation.pk], using=using)
+    if quotation.pk in result.skipped:
+        raise ValueError(f"Quotation {quotation.quotation_number}: {result.skipped[quotation.pk]}")
+    order = result.orders[quotation.pk]
+    order.refresh_from_db(using=using)
+    quotation.status = 'converted'
+    quotation.converted_order = order
+    return order
@@ -158,12 +158,13 @@ class SalesOrder(models.Model):
         """Check if order is fully paid"""
         return self.paid_amount >= self.total_amount
 
-    def calculate_totals(self):
-        """Calculate order totals"""
+    def calculate_totals(self, items_total=None):
+        """Calculate order totals, from ``items_total`` when the item sum is already known"""
         # Calculate subtotal from items
-        items_total = self.items.aggregate(
-            total=models.Sum(models.F('quantity') * models.F('unit_price'))
-        )['total'] or Decimal('0.00')
+        if items_total is None:
+            items_total = self.items.aggregate(
+                total=models.Sum(models.F('quantity') * models.F('unit_price'))
+            )['total'] or Decimal('0.00')
         
         self.subtotal = items_total
         
@@ -281,11 +282,12 @@ class Quotation(models.Model):
         from django.utils import timezone
         return timezone.now().date() <= self.valid_until
 
-    def calculate_totals(self):
-        """Calculate quotation totals"""
-        items_total = self.items.aggregate(
-            total=models.Sum(models.F('quantity') * models.F('unit_price'))
-        )['total'] or Decimal('0.00')
+    def calculate_totals(self, items_total=None):
+        """Calculate quotation totals, from ``items_total`` when the item sum is already known"""
+        if items_total is None:
+            items_total = self.items.aggregate(
+                total=models.Sum(models.F('quantity') * models.F('unit_price'))
+            )['total'] or Decimal('0.00')
         
         self.subtotal = items_total
         taxable_amount = self.subtotal - self.discount_amount
@@ -1,23 +1,26 @@
-from django.db.models.signals import post_save, pre_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from .models import SalesOrder, SalesOrderItem, Quotation, QuotationItem
+from .totals import mark_dirty
 
 
 @receiver(post_save, sender=SalesOrderItem)
-def update_order_totals(sender, instance, **kwargs):
+@receiver(post_delete, sender=SalesOrderItem)
+def update_order_totals(sender, instance, using, raw=False, **kwargs):
     """
-    Update sales order totals when items are saved
+    Update sales order totals when items are saved or deleted, once per
+    order and transaction
     """
-    order = instance.sales_order
-    order.calculate_totals()
-    order.save()
+    if not raw:
+        mark_dirty(SalesOrder, instance.sales_order_id, using=using)
 
 
 @receiver(post_save, sender=QuotationItem)
-def update_quotation_totals(sender, instance, **kwargs):
+@receiver(post_delete, sender=QuotationItem)
+def update_quotation_totals(sender, instance, using, raw=False, **kwargs):
     """
-    Update quotation totals when items are saved
+    Update quotation totals when items are saved or deleted, once per
+    quotation and transaction
     """
-    quotation = instance.quotation
-    quotation.calculate_totals()
-    quotation.save()
+    if not raw:
+        mark_dirty(Quotation, instance.quotation_id, using=using)
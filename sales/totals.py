@@ -0,0 +1,112 @@
+"""
+Deferred order and quotation totals - recalculates each sales order and
+quotation once per transaction instead of once per saved line.
+
+Saving or deleting a line only marks its order or quotation dirty; the
+first mark of a transaction registers one flush on commit, which
+recalculates every dirty document with one grouped item query and one
+``bulk_update`` per model. Documents marked in a rolled back transaction
+stay dirty and are recalculated by the next flush, which is harmless.
+
+``deferred_totals`` holds the flush back for a whole block, e.g. an import
+that saves lines in autocommit mode, and flushes once when the block exits.
+"""
+import threading
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.db import connections, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .models import Quotation, QuotationItem, SalesOrder, SalesOrderItem
+
+ZERO = Decimal('0.00')
+
+TOTAL_FIELDS = ['subtotal', 'discount_amount', 'tax_amount', 'total_amount', 'updated_at']
+
+# document model -> (item model, item foreign key to the document)
+DOCUMENTS = {
+    SalesOrder: (SalesOrderItem, 'sales_order_id'),
+    Quotation: (QuotationItem, 'quotation_id'),
+}
+
+_state = threading.local()
+
+
+def _dirty(using):
+    """Dirty document ids of this thread, ``{model: set of ids}`` per database"""
+    if not hasattr(_state, 'dirty'):
+        _state.dirty = {}
+        _state.deferring = 0
+        _state.scheduled = {}
+    return _state.dirty.setdefault(using, {model: set() for model in DOCUMENTS})
+
+
+def recalculate_totals(model, document_ids, using='default'):
+    """Recalculate the totals of sales orders or quotations, three queries in all"""
+    document_ids = set(document_ids)
+    if not document_ids:
+        return 0
+    item_model, document_field = DOCUMENTS[model]
+    items_totals = dict(
+        item_model.objects.using(using)
+        .filter(**{f'{document_field}__in': document_ids})
+        .order_by()
+        .values(document_field)
+        .annotate(total=Sum(F('quantity') * F('unit_price')))
+        .values_list(document_field, 'total')
+    )
+    documents = list(model.objects.using(using).filter(pk__in=document_ids))
+    now = timezone.now()
+    for document in documents:
+        document.calculate_totals(items_total=items_totals.get(document.pk) or ZERO)
+        document.updated_at = now
+    model.objects.using(using).bulk_update(documents, TOTAL_FIELDS)
+    return len(documents)
+
+
+def flush(using='default'):
+    """Recalculate every document marked dirty on this thread"""
+    dirty = _dirty(using)
+    _state.scheduled.pop(using, None)
+    for model, document_ids in dirty.items():
+        pending = set(document_ids)
+        document_ids.clear()
+        recalculate_totals(model, pending, using=using)
+
+
+def mark_dirty(model, document_id, using='default'):
+    """Recalculate a sales order's or quotation's totals once the transaction commits"""
+    _dirty(using)[model].add(document_id)
+    if not _state.deferring:
+        schedule_flush(using)
+
+
+def schedule_flush(using='default'):
+    """Register one flush on commit per transaction"""
+    _dirty(using)
+    connection = connections[using]
+    # Django replaces the callback list on commit and rollback, a flush
+    # registered in an ended transaction is no longer in the current list
+    if _state.scheduled.get(using) is connection.run_on_commit:
+        return
+    transaction.on_commit(lambda: flush(using), using=using)
+    if connection.in_atomic_block:
+        _state.scheduled[using] = connection.run_on_commit
+
+
+@contextmanager
+def deferred_totals(using='default'):
+    """
+    Hold totals recalculation back until the block exits, then recalculate
+    every document touched inside it once (on commit when in a transaction)
+    """
+    _dirty(using)
+    _state.deferring += 1
+    try:
+        yield
+    finally:
+        _state.deferring -= 1
+        if not _state.deferring:
+            schedule_flush(using)
@@ -28,4 +28,5 @@ urlpatterns = [
     path('quotations/<int:pk>/update/', views.QuotationUpdateView.as_view(), name='quotation_update'),
     path('quotations/<int:pk>/delete/', views.QuotationDeleteView.as_view(), name='quotation_delete'),
     path('quotations/<int:pk>/convert/', views.convert_quotation_to_order, name='quotation_convert'),
+    path('quotations/convert/', views.convert_quotations_to_orders, name='quotation_convert_batch'),
 ]
@@ -6,9 +6,11 @@ from django.views.generic import (
 from django.contrib import messages
 from django.db.models import Sum, Count, Q, F
 from django.utils import timezone
+from django.views.decorators.http import require_POST
 from datetime import timedelta
 
-from .models import Customer, SalesOrder, SalesOrderItem, Quotation, QuotationItem
+from .models import Customer, SalesOrder, Quotation, QuotationItem
+from .conversion import convert_quotation, convert_quotations
 from .forms import (
     CustomerForm, SalesOrderForm, SalesOrderItemForm, 
     QuotationForm, QuotationItemForm
@@ -352,38 +354,33 @@ def convert_quotation_to_order(request, pk):
         messages.warning(request, 'This quotation has already been converted!')
         return redirect('sales:quotation_detail', pk=pk)
     
-    # Create sales order from quotation
-    order = SalesOrder.objects.create(
-        order_number=f"SO-{quotation.quotation_number}",
-        customer=quotation.customer,
-        order_date=timezone.now().date(),
-        status='confirmed',
-        subtotal=quotation.subtotal,
-        tax_rate=quotation.tax_rate,
-        tax_amount=quotation.tax_amount,
-        discount_amount=quotation.discount_amount,
-        total_amount=quotation.total_amount,
-        notes=quotation.notes,
-        terms_conditions=quotation.terms_conditions,
-        sales_person=quotation.sales_person,
-    )
-    
-    # Copy items
-    for item in quotation.items.all():
-        SalesOrderItem.objects.create(
-            sales_order=order,
-            product_name=item.product_name,
-            product_code=item.product_code,
-            description=item.description,
-            quantity=item.quantity,
-            unit_price=item.unit_price,
-            discount_percentage=item.discount_percentage,
-        )
-    
-    # Update quotation
-    quotation.status = 'converted'
-    quotation.converted_order = order
-    quotation.save()
+    try:
+        order = convert_quotation(quotation)
+    except ValueError as e:
+        messages.error(request, str(e))
+        return redirect('sales:quotation_detail', pk=pk)
     
     messages.success(request, f'Quotation converted to Sales Order #{order.order_number}')
     return redirect('sales:order_detail', pk=order.pk)
+
+
+@require_POST
+def convert_quotations_to_orders(request):
+    """
+    Convert the posted quotations (``quotation_ids``), or every accepted
+    quotation when none are posted, to sales orders in one go
+    """
+    quotation_ids = request.POST.getlist('quotation_ids')
+    if quotation_ids:
+        quotation_ids = [int(pk) for pk in quotation_ids if pk.isdigit()]
+    else:
+        quotation_ids = Quotation.objects.filter(status='accepted').values_list('pk', flat=True)
+    
+    result = convert_quotations(quotation_ids)
+    if result.orders:
+        messages.success(request, f'Converted {len(result.orders)} quotations to sales orders.')
+    if result.skipped:
+        messages.warning(request, f'{len(result.skipped)} quotations were skipped (already converted or order number taken).')
+    if not result.orders and not result.skipped:
+        messages.info(request, 'No quotations to convert.')
+    return redirect('sales:order_list')